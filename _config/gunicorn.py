@@ -0,0 +1,74 @@
+"""
+Gunicorn configuration for production serving:
+
+    gunicorn --config _config/gunicorn.py _config.wsgi:application
+
+Pre-forked worker processes serve requests with a pool of threads each (gthread worker), every thread can hold
+one long-polling client. Workers are recycled after a number of requests or when they grow past a memory limit,
+`kill -HUP <master pid>` reloads the code and replaces workers gracefully.
+
+Every value is read from the environment, or the same .env file as the Django settings use.
+Processes of one host need a broker shared between them, e.g. CHAT_BROKER_URL=unix:///tmp/webchat-broker.
+"""
+import multiprocessing
+import os
+import resource
+
+from tenv import initialize_env
+
+
+# the config is executed before the project is on sys.path, so settings cannot be imported here
+ENV_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.env')
+if os.path.isfile(ENV_FILE):
+    tenv = initialize_env(ENV_FILE)
+else:
+    tenv = initialize_env()
+
+
+bind = tenv.get('GUNICORN_BIND', default='0.0.0.0:8000')
+backlog = tenv.getint('GUNICORN_BACKLOG', default=2048)
+
+workers = tenv.getint('GUNICORN_WORKERS', default=multiprocessing.cpu_count() * 2 + 1)
+worker_class = 'gthread'
+# bounds the number of concurrent long polls per worker as well
+threads = tenv.getint('GUNICORN_THREADS', default=8)
+
+# recycle workers after a number of requests, with jitter so they are not all restarted at once
+max_requests = tenv.getint('GUNICORN_MAX_REQUESTS', default=10000)
+max_requests_jitter = tenv.getint('GUNICORN_MAX_REQUESTS_JITTER', default=1000)
+# and after their resident memory grew past this many megabytes, 0 disables the check
+max_worker_memory = tenv.getint('GUNICORN_MAX_WORKER_MEMORY', default=512)
+
+# long polls last up to CHAT_POLL_MAX_TIMEOUT seconds, workers should not be killed or stopped in the middle
+timeout = tenv.getint('GUNICORN_TIMEOUT', default=75)
+graceful_timeout = tenv.getint('GUNICORN_GRACEFUL_TIMEOUT', default=60)
+keepalive = tenv.getint('GUNICORN_KEEPALIVE', default=5)
+
+# heartbeat files on tmpfs, a disk-backed /tmp can block workers long enough to get them killed
+worker_tmp_dir = tenv.get('GUNICORN_WORKER_TMP_DIR', default='/dev/shm')
+
+# message ids embed CHAT_WORKER_ID, workers take ids from [base, base + span) by their spawn number,
+# hosts sharing a database need ranges which do not overlap
+worker_id_base = tenv.getint('GUNICORN_WORKER_ID_BASE', default=0)
+worker_id_span = tenv.getint('GUNICORN_WORKER_ID_SPAN', default=1024)
+
+accesslog = tenv.get('GUNICORN_ACCESS_LOG', default=None)
+errorlog = '-'
+loglevel = tenv.get('GUNICORN_LOG_LEVEL', default='info')
+
+
+def post_fork(server, worker):
+    """ Sets CHAT_WORKER_ID of the worker before it loads the application. Workers alive at the same time get
+    distinct ids unless one of them outlives worker_id_span newer ones."""
+    os.environ['CHAT_WORKER_ID'] = str(worker_id_base + worker.age % worker_id_span)
+
+
+def post_request(worker, req, environ, resp):
+    """ Stops the worker gracefully, after its in-flight requests, once it uses too much memory."""
+    if not max_worker_memory:
+        return
+    # kilobytes on Linux
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+    if max_rss > max_worker_memory and worker.alive:
+        worker.log.info('Worker %s uses %s MB of memory, restarting.', worker.pid, max_rss)
+        worker.alive = False
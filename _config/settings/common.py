@@ -13,6 +13,13 @@ if os.path.isfile(ENV_FILE):
 else:
     tenv = initialize_env()
 
+
+def getint_or_none(var: str):
+    """ Optional integer setting: None when the variable is missing or empty."""
+    value = tenv.get(var, default='')
+    return int(value) if value else None
+
+
 DJANGO_APPS = (
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -31,8 +38,12 @@ LOCAL_APPS = (
 
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
+# Reads of history views go to the read replica when DATABASES has one
+DATABASE_ROUTERS = ['apps.chat.routers.ReplicaRouter']
+
 # Middlewares
 MIDDLEWARE = (
+    'apps.chat.middlewares.MetricsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'apps.chat.middlewares.ResponseLoggingMiddleware',
@@ -67,6 +78,19 @@ USE_L10N = True
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#use-tz
 USE_TZ = True
 
+# PASSWORD CONFIGURATION
+# ------------------------------------------------------------------------------
+# See: https://docs.djangoproject.com/en/dev/topics/auth/passwords/
+# The first hasher encodes new passwords, the rest only verify existing ones, which are re-encoded
+# with the first one on the next successful login.
+PASSWORD_HASHERS = tenv.getlist('DJANGO_PASSWORD_HASHERS', default=[
+    'apps.chat.hashers.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.BCryptPasswordHasher',
+])
+
 # URL Configuration
 # ------------------------------------------------------------------------------
 ROOT_URLCONF = '_config.urls'
@@ -96,4 +120,102 @@ TEMPLATES = [
 
 SWAGGER_ROOT_FOLDER = 'docs/'
 
-ALLOWED_HOSTS = ['*']
\ No newline at end of file
+ALLOWED_HOSTS = ['*']
+
+# CHAT CONFIGURATION
+# ------------------------------------------------------------------------------
+# Default and maximum number of messages in one page of history.
+CHAT_HISTORY_PAGE_SIZE = tenv.getint('CHAT_HISTORY_PAGE_SIZE', default=50)
+CHAT_HISTORY_MAX_PAGE_SIZE = tenv.getint('CHAT_HISTORY_MAX_PAGE_SIZE', default=200)
+
+# Cache of serialized history pages: alias from CACHES (empty disables it) and TTL in seconds.
+CHAT_HISTORY_CACHE_ALIAS = tenv.get('CHAT_HISTORY_CACHE_ALIAS', default='default')
+CHAT_HISTORY_CACHE_TTL = tenv.getint('CHAT_HISTORY_CACHE_TTL', default=60)
+
+# Maximum number of messages returned by one sync request.
+CHAT_SYNC_MAX_MESSAGES = tenv.getint('CHAT_SYNC_MAX_MESSAGES', default=1000)
+
+# Write-behind of new messages: a thread of the process inserts the messages in group commits of up to BATCH_SIZE
+# messages, collected for at most MAX_DELAY seconds, and gives them ids right before the INSERT. DURABILITY "commit"
+# answers after the commit, "enqueue" right after queueing (queued messages are lost if the process is killed), with
+# ids taken on submit, which change when the message is not stored within half of CHAT_ID_SETTLE_TIME. Requests get
+# 503 when the queue of QUEUE_SIZE requests stays full for ENQUEUE_TIMEOUT seconds, history reads of the sender wait
+# up to READ_TIMEOUT seconds for the messages still in the queue.
+CHAT_WRITE_BEHIND = tenv.getbool('CHAT_WRITE_BEHIND', default=False)
+CHAT_WRITE_BEHIND_QUEUE_SIZE = tenv.getint('CHAT_WRITE_BEHIND_QUEUE_SIZE', default=10000)
+CHAT_WRITE_BEHIND_BATCH_SIZE = tenv.getint('CHAT_WRITE_BEHIND_BATCH_SIZE', default=500)
+CHAT_WRITE_BEHIND_MAX_DELAY = tenv.getfloat('CHAT_WRITE_BEHIND_MAX_DELAY', default=0.01)
+CHAT_WRITE_BEHIND_DURABILITY = tenv.get('CHAT_WRITE_BEHIND_DURABILITY', default='commit')
+CHAT_WRITE_BEHIND_ENQUEUE_TIMEOUT = tenv.getfloat('CHAT_WRITE_BEHIND_ENQUEUE_TIMEOUT', default=1.0)
+CHAT_WRITE_BEHIND_READ_TIMEOUT = tenv.getfloat('CHAT_WRITE_BEHIND_READ_TIMEOUT', default=2.0)
+
+# Worker id (0-1023) embedded into message ids, processes writing to one database need distinct ones.
+# Gunicorn workers get it from _config/gunicorn.py, without it the low bits of the process id are used.
+CHAT_WORKER_ID = tenv.getint('CHAT_WORKER_ID', default=None)
+
+# Longest time in seconds between a message getting its id and being committed (including the write-behind queue
+# and waits for database locks). Messages commit out of id order within it, so sync and long polling only return
+# messages older than that: the cursor of a client never passes a message committed later with a smaller id.
+CHAT_ID_SETTLE_TIME = tenv.getfloat('CHAT_ID_SETTLE_TIME', default=1.0)
+
+# Message search index: "fts5" (SQLite FTS5), "terms" (a table of words of every message, works on every database)
+# or "auto" for FTS5 when SQLite has it. The index is built by the migration for the backend in use at the time,
+# messages stored before a later switch are not found by the other backend.
+CHAT_SEARCH_BACKEND = tenv.get('CHAT_SEARCH_BACKEND', default='auto')
+
+# Retention in days of public and private messages in the hot table (empty keeps them there). Older messages are
+# moved to the archive table by "manage.py archive_messages" in transactions of ARCHIVE_BATCH_SIZE messages, history
+# pages continue into the archive past the oldest message left in the hot table. Search and sync only see the hot table.
+CHAT_RETENTION_PUBLIC_DAYS = getint_or_none('CHAT_RETENTION_PUBLIC_DAYS')
+CHAT_RETENTION_PRIVATE_DAYS = getint_or_none('CHAT_RETENTION_PRIVATE_DAYS')
+CHAT_ARCHIVE_BATCH_SIZE = tenv.getint('CHAT_ARCHIVE_BATCH_SIZE', default=1000)
+
+# Number of messages read per query by the NDJSON export (the endpoint and the export_messages command).
+CHAT_EXPORT_BATCH_SIZE = tenv.getint('CHAT_EXPORT_BATCH_SIZE', default=2000)
+
+# Read replica: history reads go to this alias from DATABASES when it is configured (see
+# production.py), except for users who wrote in the last PIN_SECONDS, they read from the primary. Pins are kept in
+# the PIN_CACHE_ALIAS cache, which has to be shared between processes.
+CHAT_REPLICA_ALIAS = tenv.get('CHAT_REPLICA_ALIAS', default='replica')
+CHAT_REPLICA_PIN_SECONDS = tenv.getint('CHAT_REPLICA_PIN_SECONDS', default=5)
+CHAT_REPLICA_PIN_CACHE_ALIAS = tenv.get('CHAT_REPLICA_PIN_CACHE_ALIAS', default='default')
+
+# Maximum number of messages in one bulk send request.
+CHAT_BULK_MAX_MESSAGES = tenv.getint('CHAT_BULK_MAX_MESSAGES', default=1000)
+
+# Long-polling: default and maximum wait in seconds, number of recent messages kept in memory per process.
+CHAT_POLL_TIMEOUT = tenv.getint('CHAT_POLL_TIMEOUT', default=25)
+CHAT_POLL_MAX_TIMEOUT = tenv.getint('CHAT_POLL_MAX_TIMEOUT', default=55)
+CHAT_HUB_BUFFER_SIZE = tenv.getint('CHAT_HUB_BUFFER_SIZE', default=10000)
+
+# Fan-out of new messages between processes: memory:// for a single process,
+# unix:///path/to/dir for processes of one host, redis://host:port/db for many hosts.
+CHAT_BROKER_URL = tenv.get('CHAT_BROKER_URL', default='memory://')
+
+# Token authentication cache: in-process LRU size and TTL in seconds, optional alias of a shared
+# cache from CACHES used as the second tier.
+CHAT_TOKEN_CACHE_SIZE = tenv.getint('CHAT_TOKEN_CACHE_SIZE', default=10000)
+CHAT_TOKEN_CACHE_TTL = tenv.getint('CHAT_TOKEN_CACHE_TTL', default=60)
+CHAT_TOKEN_CACHE_SHARED_ALIAS = tenv.get('CHAT_TOKEN_CACHE_SHARED_ALIAS', default=None)
+
+# Login: PBKDF2 iterations of new and re-encoded password hashes (empty keeps the Django default),
+# allowed failed attempts per username as "number/period" (e.g. "10/min", empty disables the limit, a successful
+# login starts the count over) and the alias from CACHES the attempts are counted in.
+CHAT_PASSWORD_ITERATIONS = getint_or_none('CHAT_PASSWORD_ITERATIONS')
+CHAT_LOGIN_RATE = tenv.get('CHAT_LOGIN_RATE', default='10/min')
+CHAT_LOGIN_RATE_CACHE_ALIAS = tenv.get('CHAT_LOGIN_RATE_CACHE_ALIAS', default='default')
+
+# Alias from CACHES the version of the user directory (its ETags) is kept in, shared between processes so that
+# every worker answers If-None-Match of the others.
+CHAT_DIRECTORY_VERSION_CACHE_ALIAS = tenv.get('CHAT_DIRECTORY_VERSION_CACHE_ALIAS', default='default')
+
+# Request logging: fraction of successful responses logged per path prefix, e.g. "/public-chat/=0.1,/poll/=0"
+# (the longest matching prefix wins, errors are always logged), size of the queue of the background log writer.
+CHAT_LOG_SAMPLE_RATES = dict((prefix, float(rate)) for prefix, rate in
+                             (item.split('=') for item in tenv.getlist('CHAT_LOG_SAMPLE_RATES', default=[])))
+CHAT_LOG_QUEUE_SIZE = tenv.getint('CHAT_LOG_QUEUE_SIZE', default=10000)
+
+# Request metrics: seconds between summary log lines (0 disables them), addresses allowed to read /metrics/
+# (comma-separated, empty allows everyone).
+CHAT_METRICS_LOG_INTERVAL = tenv.getint('CHAT_METRICS_LOG_INTERVAL', default=60)
+CHAT_METRICS_ALLOWED_IPS = tenv.getlist('CHAT_METRICS_ALLOWED_IPS', default=[])
@@ -0,0 +1,89 @@
+import os
+import tempfile
+
+from .common import *
+
+
+DEBUG = tenv.getbool('DJANGO_DEBUG', default=False)
+
+# Database
+# ------------------------------------------------------------------------------
+# DJANGO_DB_ENGINE is sqlite3 or postgresql. Connections are kept open between requests for
+# DJANGO_CONN_MAX_AGE seconds, one per worker thread, so the number of worker processes times
+# GUNICORN_THREADS bounds the number of connections. In front of PostgreSQL, point DJANGO_DB_HOST/PORT
+# at a transaction-pooling PgBouncer to share a smaller pool of server connections between them.
+DATABASE_ENGINE = tenv.get('DJANGO_DB_ENGINE', default='sqlite3')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': tenv.get('DJANGO_DB_NAME', default='webchat'),
+            'USER': tenv.get('DJANGO_DB_USER', default='webchat'),
+            'PASSWORD': tenv.get('DJANGO_DB_PASSWORD', default=''),
+            'HOST': tenv.get('DJANGO_DB_HOST', default='localhost'),
+            'PORT': tenv.get('DJANGO_DB_PORT', default='5432'),
+            'CONN_MAX_AGE': tenv.getint('DJANGO_CONN_MAX_AGE', default=600),
+            'OPTIONS': {
+                'connect_timeout': tenv.getint('DJANGO_DB_CONNECT_TIMEOUT', default=5),
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': tenv.get('DJANGO_DB_NAME', default=ROOT_DIR.joinpath('db.sqlite3')),
+            'CONN_MAX_AGE': tenv.getint('DJANGO_CONN_MAX_AGE', default=600),
+        }
+    }
+
+# Optional read replica for history reads: a PostgreSQL standby at DJANGO_DB_REPLICA_HOST
+# (and DJANGO_DB_REPLICA_PORT), or a copy of the SQLite database kept by an external replication tool at
+# DJANGO_DB_REPLICA_NAME. Its alias is CHAT_REPLICA_ALIAS.
+if DATABASE_ENGINE == 'postgresql' and tenv.get('DJANGO_DB_REPLICA_HOST', default=None):
+    DATABASES['replica'] = dict(DATABASES['default'],
+                                HOST=tenv.get('DJANGO_DB_REPLICA_HOST'),
+                                PORT=tenv.get('DJANGO_DB_REPLICA_PORT', default=DATABASES['default']['PORT']))
+elif DATABASE_ENGINE != 'postgresql' and tenv.get('DJANGO_DB_REPLICA_NAME', default=None):
+    DATABASES['replica'] = dict(DATABASES['default'], NAME=tenv.get('DJANGO_DB_REPLICA_NAME'))
+
+# Caches
+# ------------------------------------------------------------------------------
+# "default" stays in the process (history pages). "shared" is seen by all worker processes: replica pins, login
+# attempts and the user directory version are kept there, in-process caches would make them per worker.
+# DJANGO_SHARED_CACHE_BACKEND is "file" for the processes of one host, DJANGO_SHARED_CACHE_LOCATION is its directory,
+# or "memcached" for many hosts, the location is host:port (needs the python-memcached package).
+SHARED_CACHE_BACKENDS = {
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'memcached': 'django.core.cache.backends.memcached.MemcachedCache',
+}
+SHARED_CACHE_BACKEND = tenv.get('DJANGO_SHARED_CACHE_BACKEND', default='file')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': SHARED_CACHE_BACKENDS[SHARED_CACHE_BACKEND],
+        'LOCATION': tenv.get('DJANGO_SHARED_CACHE_LOCATION',
+                             default=os.path.join(tempfile.gettempdir(), 'webchat-cache')),
+    },
+}
+if SHARED_CACHE_BACKEND == 'file':
+    # entries past the limit are culled on every write, pins of recent senders have to fit
+    CACHES['shared']['OPTIONS'] = {'MAX_ENTRIES': tenv.getint('DJANGO_SHARED_CACHE_MAX_ENTRIES', default=10000)}
+
+CHAT_REPLICA_PIN_CACHE_ALIAS = tenv.get('CHAT_REPLICA_PIN_CACHE_ALIAS', default='shared')
+CHAT_LOGIN_RATE_CACHE_ALIAS = tenv.get('CHAT_LOGIN_RATE_CACHE_ALIAS', default='shared')
+CHAT_DIRECTORY_VERSION_CACHE_ALIAS = tenv.get('CHAT_DIRECTORY_VERSION_CACHE_ALIAS', default='shared')
+
+# Applied to every new SQLite connection: readers do not block the writer and the other way round (WAL),
+# commits are not synced to disk one by one (NORMAL is still safe from corruption in WAL mode), writers wait
+# for the lock instead of failing right away, and the database file is read through a memory map.
+CHAT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': tenv.getint('CHAT_SQLITE_BUSY_TIMEOUT', default=5000),  # milliseconds
+    'mmap_size': tenv.getint('CHAT_SQLITE_MMAP_SIZE', default=256 * 1024 * 1024),  # bytes
+}
@@ -5,5 +5,25 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': 'test_db',
-    }
+    },
+    # a separate SQLite file, apps.chat.tests.test_routers copies the default database into it
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'test_replica_db',
+        'TEST': {
+            'NAME': 'test_replica_db.sqlite3',
+        },
+    },
 }
+
+# reads go to the replica only in the tests of the router, other tests do not keep it in sync
+CHAT_REPLICA_ALIAS = None
+
+# tests create equal histories in rolled back transactions, cached pages would leak between them
+CHAT_HISTORY_CACHE_ALIAS = None
+
+# hashing passwords of the users created in every test dominates the run time otherwise
+CHAT_PASSWORD_ITERATIONS = 1000
+
+# messages are synced and polled right after they are stored, tests of the settle time override it
+CHAT_ID_SETTLE_TIME = 0
@@ -2,7 +2,9 @@ from django.conf import settings
 from django.conf.urls import url, include
 from django.conf.urls.static import static
 
-from apps.chat.views import PublicChatView, RegistrationView, LoginView, UserListView, PrivateChatView
+from apps.chat.views import (PublicChatView, RegistrationView, LoginView, UserListView, PrivateChatView, PollView,
+                             BulkPrivateChatView, ConversationListView, ConversationReadView, MetricsView,
+                             SyncView, SearchView, ExportView)
 
 
 urlpatterns = [
@@ -10,7 +12,15 @@ urlpatterns = [
     url('^register/', RegistrationView.as_view(), name='register'),
     url('^login/', LoginView.as_view(), name='login'),
     url('^users/', UserListView.as_view(), name='user-list'),
-    url('^private/', PrivateChatView.as_view(), name='private-chat')
+    url('^private/bulk/$', BulkPrivateChatView.as_view(), name='private-chat-bulk'),
+    url('^private/', PrivateChatView.as_view(), name='private-chat'),
+    url('^conversations/$', ConversationListView.as_view(), name='conversation-list'),
+    url('^conversations/read/$', ConversationReadView.as_view(), name='conversation-read'),
+    url('^poll/$', PollView.as_view(), name='poll'),
+    url('^sync/$', SyncView.as_view(), name='sync'),
+    url('^search/$', SearchView.as_view(), name='search'),
+    url('^export/$', ExportView.as_view(), name='export'),
+    url('^metrics/$', MetricsView.as_view(), name='metrics')
 ]
 
 urlpatterns += [
@@ -0,0 +1,126 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from apps.chat.broker import get_broker
+from apps.chat.caching import LRUCache
+
+
+DEFAULT_MAX_SIZE = 10000
+DEFAULT_TTL = 60  # seconds
+
+TOKEN_INVALIDATION_TOPIC = 'auth:token-invalidation'
+SHARED_KEY_PREFIX = 'chat:token:'
+
+
+class TokenCache():
+    """ Token key -> Token (with its user loaded) cache.
+
+    The first tier is a bounded in-process LRU with TTL, the optional second tier is a shared Django cache.
+    Invalidations are applied locally and published to the broker, so other processes drop their copies too."""
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE, ttl: float = DEFAULT_TTL,
+                 shared_cache_alias: str = None) -> None:
+        self.ttl = ttl
+        self.shared_cache_alias = shared_cache_alias
+
+        self._local = LRUCache(max_size, ttl)
+        self._lock = threading.Lock()
+        self._subscription = None
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def shared_cache(self):
+        if not self.shared_cache_alias:
+            return None
+        return caches[self.shared_cache_alias]
+
+    def get(self, key: str) -> Optional[Token]:
+        self._connect()
+        token = self._local.get(key, None)
+        if token is not None:
+            self.hits += 1
+            return token
+
+        shared_cache = self.shared_cache
+        if shared_cache is not None:
+            token = shared_cache.get(SHARED_KEY_PREFIX + key)
+            if token is not None:
+                self._local.set(key, token)
+                self.shared_hits += 1
+                return token
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, token: Token) -> None:
+        self._local.set(key, token)
+        shared_cache = self.shared_cache
+        if shared_cache is not None:
+            shared_cache.set(SHARED_KEY_PREFIX + key, token, timeout=self.ttl)
+
+    def invalidate(self, keys: List[str]) -> None:
+        """ Drops tokens from every tier of every process."""
+        self._drop(keys)
+        shared_cache = self.shared_cache
+        if shared_cache is not None:
+            shared_cache.delete_many([SHARED_KEY_PREFIX + key for key in keys])
+        get_broker().publish_many([(TOKEN_INVALIDATION_TOPIC, {'key': key}) for key in keys])
+
+    def invalidate_user(self, user_id: int) -> None:
+        keys = list(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+        if keys:
+            self.invalidate(keys)
+
+    def clear(self) -> None:
+        self._local.clear()
+
+    def stats(self) -> Dict[str, int]:
+        # counters are updated without a lock, a lost increment under contention is acceptable for them
+        return {
+            'size': len(self._local),
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'evictions': self._local.evictions,
+            'invalidations': self.invalidations,
+        }
+
+    def _connect(self) -> None:
+        if self._subscription is None:
+            with self._lock:
+                if self._subscription is None:
+                    self._subscription = get_broker().subscribe([TOKEN_INVALIDATION_TOPIC], self._on_invalidation)
+
+    def _on_invalidation(self, topic: str, messages: List[dict]) -> None:
+        self._drop([message['key'] for message in messages])
+
+    def _drop(self, keys: List[str]) -> None:
+        self.invalidations += self._local.pop_many(keys)
+
+
+token_cache = TokenCache(max_size=getattr(settings, 'CHAT_TOKEN_CACHE_SIZE', DEFAULT_MAX_SIZE),
+                         ttl=getattr(settings, 'CHAT_TOKEN_CACHE_TTL', DEFAULT_TTL),
+                         shared_cache_alias=getattr(settings, 'CHAT_TOKEN_CACHE_SHARED_ALIAS', None))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """ TokenAuthentication which looks tokens up in the token cache before querying Token + User."""
+
+    def authenticate_credentials(self, key: str) -> Tuple[User, Token]:
+        token = token_cache.get(key)
+        if token is not None:
+            return token.user, token
+
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, token)
+        return user, token
@@ -0,0 +1,35 @@
+import threading
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from apps.chat.broker.base import Broker, Subscription
+
+
+BACKENDS = {
+    'memory': 'apps.chat.broker.memory.InMemoryBroker',
+    'unix': 'apps.chat.broker.unix.UnixSocketBroker',
+    'redis': 'apps.chat.broker.redis.RedisBroker',
+}
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def create_broker(url: str) -> Broker:
+    scheme = urlparse(url).scheme
+    if scheme not in BACKENDS:
+        raise ImproperlyConfigured('Unknown broker backend "{scheme}" in "{url}".'.format(scheme=scheme, url=url))
+    return import_string(BACKENDS[scheme]).from_url(url)
+
+
+def get_broker() -> Broker:
+    """ Broker of the current process, configured by CHAT_BROKER_URL."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = create_broker(settings.CHAT_BROKER_URL)
+    return _broker
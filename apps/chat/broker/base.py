@@ -0,0 +1,58 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Tuple
+
+
+# listener(topic, messages) is called with all messages of one published batch for the topic
+Listener = Callable[[str, List[dict]], None]
+
+
+def group_by_topic(items: Iterable[Tuple[str, dict]]) -> Dict[str, List[dict]]:
+    grouped = OrderedDict()  # type: Dict[str, List[dict]]
+    for topic, message in items:
+        grouped.setdefault(topic, []).append(message)
+    return grouped
+
+
+class Subscription():
+    """ Listener registered for a set of topic patterns. A pattern is either an exact topic or a prefix
+    followed by "*", as in Redis PSUBSCRIBE."""
+
+    def __init__(self, broker: 'Broker', patterns: Iterable[str], listener: Listener) -> None:
+        self.broker = broker
+        self.listener = listener
+
+        patterns = tuple(patterns)
+        self.topics = frozenset(pattern for pattern in patterns if not pattern.endswith('*'))
+        self.prefixes = tuple(pattern[:-1] for pattern in patterns if pattern.endswith('*'))
+
+    def matches(self, topic: str) -> bool:
+        return topic in self.topics or topic.startswith(self.prefixes)
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+
+class Broker():
+    """ Fans messages published to topics out to subscribers.
+
+    Backends deliver every published batch once per matching subscription and make no durability promises:
+    subscribers which are not connected at publish time miss the messages, like in Redis pub/sub."""
+
+    @classmethod
+    def from_url(cls, url: str) -> 'Broker':
+        raise NotImplementedError
+
+    def publish(self, topic: str, message: dict) -> None:
+        self.publish_many([(topic, message)])
+
+    def publish_many(self, items: Iterable[Tuple[str, dict]]) -> None:
+        raise NotImplementedError
+
+    def subscribe(self, patterns: Iterable[str], listener: Listener) -> Subscription:
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,37 @@
+import threading
+from typing import Iterable, Tuple
+
+from apps.chat.broker.base import Broker, Listener, Subscription, group_by_topic
+
+
+class InMemoryBroker(Broker):
+    """ Delivers messages to subscribers of the current process synchronously, in the publishing thread."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # replaced as a whole on (un)subscribe, so publishers iterate it without locking
+        self._subscriptions = ()  # type: Tuple[Subscription, ...]
+
+    @classmethod
+    def from_url(cls, url: str) -> 'InMemoryBroker':
+        return cls()
+
+    def publish_many(self, items: Iterable[Tuple[str, dict]]) -> None:
+        self._deliver(group_by_topic(items).items())
+
+    def subscribe(self, patterns: Iterable[str], listener: Listener) -> Subscription:
+        subscription = Subscription(self, patterns, listener)
+        with self._lock:
+            self._subscriptions += (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions = tuple(s for s in self._subscriptions if s is not subscription)
+
+    def _deliver(self, batches) -> None:
+        subscriptions = self._subscriptions
+        for topic, messages in batches:
+            for subscription in subscriptions:
+                if subscription.matches(topic):
+                    subscription.listener(topic, messages)
@@ -0,0 +1,59 @@
+import json
+from typing import Iterable, Tuple
+
+from django.core.exceptions import ImproperlyConfigured
+
+from apps.chat.broker.base import Broker, Listener, Subscription, group_by_topic
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+CHANNEL_PREFIX = 'webchat:'
+
+
+class RedisBroker(Broker):
+    """ Delivers messages between hosts through Redis pub/sub. Every topic is a channel, one PUBLISH per topic
+    of a batch is pipelined into a single round trip."""
+
+    def __init__(self, url: str) -> None:
+        if redis is None:
+            raise ImproperlyConfigured('The "redis" package is required for the Redis broker backend.')
+        self._client = redis.StrictRedis.from_url(url)
+        self._threads = {}
+
+    @classmethod
+    def from_url(cls, url: str) -> 'RedisBroker':
+        return cls(url)
+
+    def publish_many(self, items: Iterable[Tuple[str, dict]]) -> None:
+        pipeline = self._client.pipeline(transaction=False)
+        for topic, messages in group_by_topic(items).items():
+            pipeline.publish(CHANNEL_PREFIX + topic, json.dumps(messages, separators=(',', ':')))
+        pipeline.execute()
+
+    def subscribe(self, patterns: Iterable[str], listener: Listener) -> Subscription:
+        subscription = Subscription(self, patterns, listener)
+
+        def handle(event):
+            topic = event['channel'].decode('utf-8')[len(CHANNEL_PREFIX):]
+            listener(topic, json.loads(event['data'].decode('utf-8')))
+
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        if subscription.topics:
+            pubsub.subscribe(**{CHANNEL_PREFIX + topic: handle for topic in subscription.topics})
+        if subscription.prefixes:
+            pubsub.psubscribe(**{CHANNEL_PREFIX + prefix + '*': handle for prefix in subscription.prefixes})
+        self._threads[subscription] = pubsub.run_in_thread(sleep_time=0.001, daemon=True)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        thread = self._threads.pop(subscription, None)
+        if thread is not None:
+            thread.stop()
+
+    def close(self) -> None:
+        for subscription in list(self._threads):
+            self.unsubscribe(subscription)
@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Iterable, Iterator, List, Tuple
+from urllib.parse import urlparse
+
+from apps.chat.broker.base import group_by_topic
+from apps.chat.broker.memory import InMemoryBroker
+
+
+DEFAULT_MAX_DATAGRAM_SIZE = 65536
+# larger than the default socket send buffer, so a datagram which could be sent is never truncated
+RECEIVE_BUFFER_SIZE = 262144
+PEERS_REFRESH_INTERVAL = 1.0  # seconds
+
+logger = logging.getLogger('chat.broker.unix')
+
+
+class UnixSocketBroker(InMemoryBroker):
+    """ Delivers messages between processes of one host.
+
+    Every broker instance binds a datagram socket in a shared directory. A published batch is delivered
+    to local subscribers directly and sent to every other socket in the directory as one datagram per
+    ``max_datagram_size`` bytes, where the receiving thread of the peer hands it to its own subscribers.
+    Delivery is best-effort: datagrams to peers whose receive buffer is full are dropped."""
+
+    def __init__(self, path: str, max_datagram_size: int = DEFAULT_MAX_DATAGRAM_SIZE) -> None:
+        super().__init__()
+        self.path = path
+        self.max_datagram_size = max_datagram_size
+
+        os.makedirs(path, exist_ok=True)
+        self.address = os.path.join(path, '{pid}-{id}.sock'.format(pid=os.getpid(), id=id(self)))
+
+        self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._receiver.bind(self.address)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+
+        self._peers = []  # type: List[str]
+        self._peers_refreshed_at = 0.0
+        self._closed = False
+
+        self._receiving_thread = threading.Thread(target=self._receive_forever, name='chat-broker-receiver',
+                                                  daemon=True)
+        self._receiving_thread.start()
+
+    @classmethod
+    def from_url(cls, url: str) -> 'UnixSocketBroker':
+        """ unix:///var/run/webchat/broker"""
+        return cls(urlparse(url).path)
+
+    def publish_many(self, items: Iterable[Tuple[str, dict]]) -> None:
+        batches = list(group_by_topic(items).items())
+        self._deliver(batches)
+
+        for datagram in self._encode(batches):
+            for peer in self._get_peers():
+                self._send(datagram, peer)
+
+    def close(self) -> None:
+        self._closed = True
+        self._receiver.close()
+        self._sender.close()
+        try:
+            os.unlink(self.address)
+        except FileNotFoundError:
+            pass
+
+    def _encode(self, batches: List[Tuple[str, List[dict]]]) -> Iterator[bytes]:
+        """ Packs batches into as few datagrams as possible. A single message larger than the limit
+        still goes in a datagram of its own."""
+        chunk = []  # type: List[bytes]
+        chunk_size = 2
+        for topic, messages in batches:
+            for message in messages:
+                encoded = json.dumps([topic, message], separators=(',', ':')).encode('utf-8')
+                if chunk and chunk_size + len(encoded) + 1 > self.max_datagram_size:
+                    yield b'[' + b','.join(chunk) + b']'
+                    chunk, chunk_size = [], 2
+                chunk.append(encoded)
+                chunk_size += len(encoded) + 1
+        if chunk:
+            yield b'[' + b','.join(chunk) + b']'
+
+    def _get_peers(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_refreshed_at > PEERS_REFRESH_INTERVAL:
+            self._peers = [os.path.join(self.path, name) for name in os.listdir(self.path)
+                           if name.endswith('.sock') and os.path.join(self.path, name) != self.address]
+            self._peers_refreshed_at = now
+        return self._peers
+
+    def _send(self, datagram: bytes, peer: str) -> None:
+        try:
+            self._sender.sendto(datagram, peer)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # the peer process is gone, clean its socket up
+            self._forget_peer(peer)
+        except OSError as exc:
+            logger.warning('Dropped %d bytes for %s: %s', len(datagram), peer, exc)
+
+    def _forget_peer(self, peer: str) -> None:
+        try:
+            os.unlink(peer)
+        except FileNotFoundError:
+            pass
+        self._peers = [p for p in self._peers if p != peer]
+
+    def _receive_forever(self) -> None:
+        while not self._closed:
+            try:
+                datagram = self._receiver.recv(RECEIVE_BUFFER_SIZE)
+            except OSError:
+                if self._closed:
+                    return
+                raise
+            try:
+                items = json.loads(datagram.decode('utf-8'))
+            except ValueError:
+                logger.exception('Malformed datagram received.')
+                continue
+            self._deliver(group_by_topic(items).items())
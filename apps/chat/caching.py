@@ -0,0 +1,64 @@
+import collections
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, Tuple
+
+
+MISSING = object()
+
+
+class LRUCache():
+    """ Thread-safe in-process mapping bounded by size, least recently used entries are evicted first.
+    Every entry expires ``ttl`` seconds after it is set."""
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # type: Dict[Hashable, Tuple[float, Any]]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop_many(self, keys: Iterable[Hashable]) -> int:
+        """ Removes keys, returns how many of them were present."""
+        removed = 0
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    removed += 1
+        return removed
+
+    def pop_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """ Removes entries for which predicate(key, value) is true, scanning the whole cache."""
+        with self._lock:
+            keys = [key for key, (expires_at, value) in self._entries.items() if predicate(key, value)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,81 @@
+import itertools
+import zlib
+from json.encoder import encode_basestring
+from typing import Iterable, Iterator
+
+from django.conf import settings
+from django.db.models import QuerySet
+
+from apps.chat.models import ArchivedMessage, Message
+from apps.chat.serializers import MESSAGE_ROW_FIELDS
+
+
+DEFAULT_BATCH_SIZE = 2000
+# characters of NDJSON collected before a chunk is handed to the server or the compressor
+CHUNK_SIZE = 64 * 1024
+GZIP_LEVEL = 6
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+MESSAGE_LINE_FORMAT = '{{"id":{0},"id_str":"{0}","from_user":{1},"to_user":{2},"timestamp":{3},"text":{4}}}\n'
+
+
+def iter_message_rows(queryset: QuerySet, batch_size: int = None) -> Iterator[tuple]:
+    """ MESSAGE_ROW_FIELDS rows of the queryset in id order. Messages are read with one keyset query per batch,
+    so memory use does not depend on the number of messages and no transaction or cursor stays open between
+    batches. Messages stored while the export runs are included when their ids are past the last batch."""
+    if batch_size is None:
+        batch_size = getattr(settings, 'CHAT_EXPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+    queryset = queryset.order_by('id').values_list(*MESSAGE_ROW_FIELDS)
+    last_id = None
+    while True:
+        batch = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        rows = list(batch[:batch_size])
+        for row in rows:
+            yield row
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+
+def iter_history_rows(filters: dict, batch_size: int = None) -> Iterator[tuple]:
+    """ Rows of the messages matching the filters in the archive and then in the hot table, which together are
+    in id order: archived messages are older than the ones left in the hot table."""
+    return itertools.chain(iter_message_rows(ArchivedMessage.objects.filter(**filters), batch_size),
+                           iter_message_rows(Message.objects.filter(**filters), batch_size))
+
+
+def encode_message_row(row: tuple) -> str:
+    """ NDJSON line of the message as serialize_message_rows() would serialize it, formatted directly: every
+    field has a known type, a JSON encoder would spend most of the export time on checking them."""
+    pk, from_user, to_user, timestamp, text = row
+    return MESSAGE_LINE_FORMAT.format(pk, encode_basestring(from_user),
+                                      'null' if to_user is None else encode_basestring(to_user),
+                                      timestamp, encode_basestring(text))
+
+
+def iter_ndjson(rows: Iterable[tuple], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """ One message per line, lines joined into UTF-8 chunks of about chunk_size characters."""
+    lines = []
+    size = 0
+    for row in rows:
+        line = encode_message_row(row)
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield ''.join(lines).encode('utf-8')
+            lines = []
+            size = 0
+    if lines:
+        yield ''.join(lines).encode('utf-8')
+
+
+def iter_gzip(chunks: Iterable[bytes], level: int = GZIP_LEVEL) -> Iterator[bytes]:
+    """ Compresses chunks into a gzip stream as they come."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """ PBKDF2-SHA256 with CHAT_PASSWORD_ITERATIONS iterations instead of the count built into Django.
+
+    The algorithm name is the same as Django's, so existing hashes verify with it, and a hash with a different
+    count is re-encoded with the configured one on the next successful login (User.check_password() does that
+    for hashers which report must_update()). Put it first in PASSWORD_HASHERS, in place of PBKDF2PasswordHasher."""
+
+    @property
+    def iterations(self) -> int:
+        return getattr(settings, 'CHAT_PASSWORD_ITERATIONS', None) or PBKDF2PasswordHasher.iterations
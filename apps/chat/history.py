@@ -0,0 +1,69 @@
+import hashlib
+from collections import namedtuple
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.views.decorators.http import condition
+from rest_framework.request import Request
+
+from apps.chat.models import Message
+from apps.chat.writebehind import wait_for_own_messages
+
+
+DEFAULT_CACHE_TTL = 60  # seconds
+
+CACHE_KEY_PREFIX = 'chat:history:'
+PAGE_PARAMETERS = ('before', 'after', 'limit')
+
+# conversation is None for the public chat, version is the (timestamp, id) of the newest message or None
+HistoryState = namedtuple('HistoryState', ['conversation', 'version'])
+
+
+def get_history_state(request: Request, get_conversation: Callable[[Request], Optional[str]]) -> HistoryState:
+    """ Resolves the conversation and reads its version once per request, after messages of the user
+    which are still being written behind are stored."""
+    state = getattr(request, '_history_state', None)
+    if state is None:
+        conversation = get_conversation(request)
+        wait_for_own_messages(request.user.id)
+        messages = Message.objects.public() if conversation is None else Message.objects.filter(
+            conversation=conversation)
+        state = request._history_state = HistoryState(conversation, messages.latest_position())
+    return state
+
+
+def get_history_etag(request: Request, state: HistoryState) -> str:
+    """ Changes with every new message of the conversation, and differs between pages of it."""
+    parts = [state.conversation or '', '{0}:{1}'.format(*state.version) if state.version else '']
+    parts += [request.query_params.get(name, '') for name in PAGE_PARAMETERS]
+    return hashlib.md5('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def history_condition(get_conversation: Callable[[Request], Optional[str]]):
+    """ condition() for history views: answers 304 to clients which have seen the newest message of the
+    conversation returned by get_conversation(request), at the cost of one lookup at the end of an index.
+
+    There is no Last-Modified: with its one second resolution, If-Modified-Since would hide messages posted
+    in the same second as the newest one the client has seen."""
+
+    def etag_func(request: Request, *args, **kwargs) -> str:
+        return get_history_etag(request, get_history_state(request, get_conversation))
+
+    return condition(etag_func=etag_func)
+
+
+def get_cached_page(request: Request, state: HistoryState, build_page: Callable[[], dict]) -> dict:
+    """ Serialized history page from the cache in CHAT_HISTORY_CACHE_ALIAS, built and stored on a miss.
+    Keys include the version of the conversation, so pages of older versions are never served, they expire."""
+    alias = getattr(settings, 'CHAT_HISTORY_CACHE_ALIAS', None)
+    if not alias:
+        return build_page()
+
+    cache = caches[alias]
+    key = CACHE_KEY_PREFIX + get_history_etag(request, state)
+    page = cache.get(key)
+    if page is None:
+        page = build_page()
+        cache.set(key, page, timeout=getattr(settings, 'CHAT_HISTORY_CACHE_TTL', DEFAULT_CACHE_TTL))
+    return page
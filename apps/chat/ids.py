@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+from typing import List
+
+from django.conf import settings
+
+
+# 2017-01-01T00:00:00Z in milliseconds, 41 bits of milliseconds since then last until 2086
+EPOCH = 1483228800000
+
+WORKER_ID_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_ID_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+TIMESTAMP_SHIFT = WORKER_ID_BITS + SEQUENCE_BITS
+
+DEFAULT_SETTLE_TIME = 1.0  # seconds
+
+
+def get_id_floor(timestamp: int) -> int:
+    """ Smallest id generated at the millisecond ``timestamp``, ids below it were generated earlier."""
+    return max(timestamp - EPOCH, 0) << TIMESTAMP_SHIFT
+
+
+def get_id_timestamp(message_id: int) -> int:
+    """ Millisecond the id was generated at."""
+    return (message_id >> TIMESTAMP_SHIFT) + EPOCH
+
+
+def get_settle_time() -> int:
+    """ CHAT_ID_SETTLE_TIME in milliseconds: the longest a message takes from getting its id to being committed."""
+    return int(getattr(settings, 'CHAT_ID_SETTLE_TIME', DEFAULT_SETTLE_TIME) * 1000)
+
+
+def get_settled_id_floor() -> int:
+    """ Messages with ids below the floor are committed, if they are ever going to be. Ids are taken before the
+    INSERT, so messages of different requests, processes and write-behind batches are committed out of id order:
+    sync and long polling only hand out messages below the floor, so that the cursor of a client never passes
+    a message which is committed later with a smaller id."""
+    return get_id_floor(int(time.time() * 1000) - get_settle_time() + 1)
+
+
+class SnowflakeGenerator():
+    """ 64-bit ids sortable by creation time, made of milliseconds since EPOCH, a worker id and a sequence
+    number within the millisecond. Ids are generated in memory, they are unique as long as no two running
+    processes share a worker id, and strictly increase within a process: when the clock goes back or more than
+    4096 ids are taken in one millisecond, the generator keeps counting from its last millisecond.
+
+    The worker id comes from CHAT_WORKER_ID, gunicorn workers get one assigned in _config/gunicorn.py. Without
+    it the low bits of the process id are used, which can collide between hosts."""
+
+    def __init__(self, worker_id: int = None) -> None:
+        if worker_id is not None and not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError('Worker id has to be between 0 and {0}.'.format(MAX_WORKER_ID))
+        self._configured_worker_id = worker_id
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._worker_id = 0
+        self._last_timestamp = -1
+        self._sequence = 0
+
+    @property
+    def worker_id(self) -> int:
+        with self._lock:
+            self._check_process()
+            return self._worker_id
+
+    def next(self) -> int:
+        with self._lock:
+            self._check_process()
+            timestamp = int(time.time() * 1000) - EPOCH
+            if timestamp > self._last_timestamp:
+                self._last_timestamp = timestamp
+                self._sequence = 0
+            elif self._sequence < MAX_SEQUENCE:
+                self._sequence += 1
+            else:
+                self._last_timestamp += 1
+                self._sequence = 0
+            return (self._last_timestamp << TIMESTAMP_SHIFT) | (self._worker_id << SEQUENCE_BITS) | self._sequence
+
+    def allocate(self, count: int) -> List[int]:
+        return [self.next() for _ in range(count)]
+
+    def _check_process(self) -> None:
+        # a forked child must not continue the sequence of its parent
+        pid = os.getpid()
+        if pid == self._pid:
+            return
+        self._pid = pid
+        self._worker_id = self._get_worker_id(pid)
+        self._last_timestamp = -1
+        self._sequence = 0
+
+    def _get_worker_id(self, pid: int) -> int:
+        if self._configured_worker_id is not None:
+            return self._configured_worker_id
+        worker_id = getattr(settings, 'CHAT_WORKER_ID', None)
+        if worker_id is None:
+            return pid & MAX_WORKER_ID
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError('CHAT_WORKER_ID has to be between 0 and {0}.'.format(MAX_WORKER_ID))
+        return worker_id
+
+
+message_ids = SnowflakeGenerator()
+
+
+def next_message_id() -> int:
+    return message_ids.next()
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.chat.retention import SCOPES, archive_messages, get_retention_floor
+
+
+class Command(BaseCommand):
+    help = ('Moves messages older than CHAT_RETENTION_PUBLIC_DAYS / CHAT_RETENTION_PRIVATE_DAYS from the hot '
+            'table to the archive in batches. Meant to run periodically, e.g. daily from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scope', choices=SCOPES, action='append',
+                            help='Archive only this scope, may be repeated. All scopes by default.')
+        parser.add_argument('--batch-size', type=int, help='Messages moved per transaction.')
+
+    def handle(self, *args, **options):
+        for scope in options['scope'] or SCOPES:
+            if get_retention_floor(scope) is None:
+                self.stdout.write('{scope}: no retention configured, skipped'.format(scope=scope))
+                continue
+            moved = archive_messages(scope, options['batch_size'])
+            self.stdout.write('{scope}: {moved} messages archived'.format(scope=scope, moved=moved))
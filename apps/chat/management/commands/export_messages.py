@@ -0,0 +1,47 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.chat.export import iter_gzip, iter_history_rows, iter_ndjson
+from apps.chat.models import Message
+
+
+class Command(BaseCommand):
+    help = ('Writes messages as NDJSON, one message per line in id order: all of them, the public chat or '
+            'a private conversation, archived messages included. Memory use does not depend on the number '
+            'of messages.')
+
+    def add_arguments(self, parser):
+        scope = parser.add_mutually_exclusive_group()
+        scope.add_argument('--public', action='store_true', help='Export the public chat only.')
+        scope.add_argument('--between', nargs=2, metavar='USERNAME',
+                           help='Export the private conversation of two users only.')
+        parser.add_argument('--output', help='File to write to, standard output by default.')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip.')
+        parser.add_argument('--batch-size', type=int, help='Messages read per query.')
+
+    def handle(self, *args, **options):
+        filters = {}
+        if options['public']:
+            filters = {'to_user__isnull': True}
+        elif options['between']:
+            users = dict(User.objects.filter(username__in=options['between']).values_list('username', 'id'))
+            missing = [username for username in options['between'] if username not in users]
+            if missing:
+                raise CommandError('User {username} does not exist.'.format(username=missing[0]))
+            user_ids = [users[username] for username in options['between']]
+            filters = {'conversation': Message.get_conversation_key(*user_ids)}
+
+        chunks = iter_ndjson(iter_history_rows(filters, options['batch_size']))
+        if options['gzip']:
+            chunks = iter_gzip(chunks)
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+            output.flush()
+        finally:
+            if options['output']:
+                output.close()
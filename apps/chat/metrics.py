@@ -0,0 +1,243 @@
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from django.db import connections
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # seconds
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+RESPONSE_SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)  # bytes
+
+UNRESOLVED_ENDPOINT = '<unresolved>'
+
+
+class Histogram():
+    """ Cumulative-bucket histogram in the Prometheus sense, not thread-safe on its own."""
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        # the last counter is the +Inf bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> List[Tuple[str, int]]:
+        """ (le, count of observations <= le) pairs, the last one is '+Inf'."""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append(('+Inf' if bound == float('inf') else repr(bound), total))
+        return result
+
+    def quantile(self, fraction: float) -> float:
+        """ Upper bound of the bucket holding the quantile, an estimate good enough for a log line."""
+        rank = fraction * self.count
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            if total >= rank and total > 0:
+                return bound
+        return float('nan')
+
+    def copy(self) -> 'Histogram':
+        histogram = Histogram(self.buckets)
+        histogram.counts = list(self.counts)
+        histogram.sum = self.sum
+        histogram.count = self.count
+        return histogram
+
+
+class EndpointMetrics():
+    def __init__(self) -> None:
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.response_size = Histogram(RESPONSE_SIZE_BUCKETS)
+        self.db_time = 0.0
+        self.statuses = {}  # type: Dict[str, int]
+
+    def copy(self) -> 'EndpointMetrics':
+        metrics = EndpointMetrics()
+        metrics.latency = self.latency.copy()
+        metrics.queries = self.queries.copy()
+        metrics.response_size = self.response_size.copy()
+        metrics.db_time = self.db_time
+        metrics.statuses = dict(self.statuses)
+        return metrics
+
+
+class MetricsRegistry():
+    """ Per URL name request metrics of this process: latency, number and execution time of database queries,
+    response size and status classes. Recording a request takes a single lock acquisition."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._endpoints = {}  # type: Dict[str, EndpointMetrics]
+
+    def record(self, endpoint: str, status_code: int, latency: float, queries: int, db_time: float,
+               response_size: Optional[int]) -> None:
+        """ response_size is None for streaming responses, they are left out of the size histogram."""
+        status = '{0}xx'.format(status_code // 100)
+        with self._lock:
+            metrics = self._endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self._endpoints[endpoint] = EndpointMetrics()
+            metrics.latency.observe(latency)
+            metrics.queries.observe(queries)
+            if response_size is not None:
+                metrics.response_size.observe(response_size)
+            metrics.db_time += db_time
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+
+    def snapshot(self) -> Dict[str, EndpointMetrics]:
+        with self._lock:
+            return {endpoint: metrics.copy() for endpoint, metrics in self._endpoints.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
+
+
+registry = MetricsRegistry()
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(name: str, endpoint: str, histogram: Histogram) -> List[str]:
+    labels = 'endpoint="{0}"'.format(_escape_label(endpoint))
+    lines = ['{name}_bucket{{{labels},le="{le}"}} {count}'.format(name=name, labels=labels, le=le, count=count)
+             for le, count in histogram.cumulative_counts()]
+    lines.append('{name}_sum{{{labels}}} {value!r}'.format(name=name, labels=labels, value=float(histogram.sum)))
+    lines.append('{name}_count{{{labels}}} {value}'.format(name=name, labels=labels, value=histogram.count))
+    return lines
+
+
+def render_prometheus(snapshot: Dict[str, EndpointMetrics]) -> str:
+    """ Prometheus text exposition format, version 0.0.4."""
+    endpoints = sorted(snapshot.items())
+    lines = []
+
+    lines += ['# HELP chat_requests_total Requests by endpoint and status class.',
+              '# TYPE chat_requests_total counter']
+    for endpoint, metrics in endpoints:
+        for status, count in sorted(metrics.statuses.items()):
+            lines.append('chat_requests_total{{endpoint="{0}",status="{1}"}} {2}'.format(
+                _escape_label(endpoint), status, count))
+
+    for name, attribute, help_text in (
+            ('chat_request_duration_seconds', 'latency', 'Time spent in the middleware stack and the view.'),
+            ('chat_request_queries', 'queries', 'Database queries executed per request.'),
+            ('chat_response_size_bytes', 'response_size', 'Size of the response body.')):
+        lines += ['# HELP {0} {1}'.format(name, help_text), '# TYPE {0} histogram'.format(name)]
+        for endpoint, metrics in endpoints:
+            lines += _histogram_lines(name, endpoint, getattr(metrics, attribute))
+
+    lines += ['# HELP chat_request_db_seconds_total Time spent executing database queries.',
+              '# TYPE chat_request_db_seconds_total counter']
+    for endpoint, metrics in endpoints:
+        lines.append('chat_request_db_seconds_total{{endpoint="{0}"}} {1!r}'.format(
+            _escape_label(endpoint), float(metrics.db_time)))
+
+    return '\n'.join(lines) + '\n'
+
+
+def format_summary(snapshot: Dict[str, EndpointMetrics]) -> str:
+    """ One line per process for the periodic log: requests, latency estimates and queries per endpoint."""
+    parts = []
+    for endpoint, metrics in sorted(snapshot.items()):
+        count = metrics.latency.count
+        parts.append('{endpoint} n={count} p50<={p50}s p95<={p95}s q/req={queries:.1f} db={db:.3f}s'.format(
+            endpoint=endpoint, count=count, p50=metrics.latency.quantile(0.5), p95=metrics.latency.quantile(0.95),
+            queries=metrics.queries.sum / count if count else 0.0, db=metrics.db_time))
+    return 'Metrics: ' + ('; '.join(parts) if parts else 'no requests')
+
+
+class QueryCounter(threading.local):
+    """ Number and execution time of queries run by the current thread while counting is active."""
+
+    active = False
+    queries = 0
+    time = 0.0
+
+    def start(self) -> None:
+        self.active = True
+        self.queries = 0
+        self.time = 0.0
+
+    def stop(self) -> Tuple[int, float]:
+        self.active = False
+        return self.queries, self.time
+
+
+query_counter = QueryCounter()
+
+
+class TimedCursorWrapper():
+    """ Wraps a Django cursor wrapper and adds executions to the query counter of the thread."""
+
+    def __init__(self, cursor) -> None:
+        self.cursor = cursor
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.cursor.__exit__(exc_type, exc_value, traceback)
+
+    def execute(self, sql, params=None):
+        return self._timed(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed(self.cursor.executemany, sql, param_list)
+
+    def callproc(self, procname, params=None):
+        return self._timed(self.cursor.callproc, procname, params)
+
+    def _timed(self, method, *args):
+        if not query_counter.active:
+            return method(*args)
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            query_counter.queries += 1
+            query_counter.time += time.perf_counter() - started
+
+
+def instrument_connections() -> None:
+    """ Makes cursors of the connections of the current thread report to the query counter. Connection objects
+    are per thread, so this is called per request and is a no-op for already instrumented ones."""
+    for connection in connections.all():
+        if getattr(connection, '_chat_metrics_instrumented', False):
+            continue
+        cursor = connection.cursor
+        connection.cursor = lambda cursor=cursor: TimedCursorWrapper(cursor())
+        connection._chat_metrics_instrumented = True
+
+
+def get_endpoint_name(request) -> str:
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None or not resolver_match.url_name:
+        return UNRESOLVED_ENDPOINT
+    return resolver_match.url_name
+
+
+def get_response_size(response) -> Optional[int]:
+    if response.streaming:
+        return None
+    return len(response.content)
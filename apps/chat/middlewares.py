@@ -1,13 +1,22 @@
 import logging
-from typing import Tuple
+import queue
+import random
+import threading
+import time
+from typing import Callable, Optional, Tuple
 
 from django.conf import settings
 from django.core.handlers.wsgi import WSGIRequest
+from django.http import HttpResponse
 from django.utils.deprecation import MiddlewareMixin
 from rest_framework.response import Response
 
+from apps.chat.metrics import (format_summary, get_endpoint_name, get_response_size, instrument_connections,
+                               query_counter, registry)
+
 
 MAX_BODY_LENGTH = 3000  # log no more than 3k bytes of content
+DEFAULT_QUEUE_SIZE = 10000
 
 swagger_request_logger = logging.getLogger('middlewares.swagger.request')
 swagger_response_logger = logging.getLogger('middlewares.swagger.response')
@@ -15,14 +24,70 @@ swagger_response_logger = logging.getLogger('middlewares.swagger.response')
 request_logger = logging.getLogger('middlewares.request')
 response_logger = logging.getLogger('middlewares.response')
 
+metrics_logger = logging.getLogger('middlewares.metrics')
+
+
+class BackgroundLogWriter():
+    """ Builds and emits log messages in a daemon thread, so formatting and handler I/O stay off the request
+    thread. Records are dropped, not waited for, when the queue is full."""
+
+    def __init__(self, max_size: int = DEFAULT_QUEUE_SIZE) -> None:
+        self.dropped = 0
+        self._queue = queue.Queue(max_size)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, build_records: Callable[[], Tuple[Tuple[logging.Logger, int, str], ...]]) -> None:
+        """ build_records() returns (logger, level, message) tuples and is called in the writer thread."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(build_records)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self) -> None:
+        """ Blocks until every submitted record is emitted."""
+        self._queue.join()
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            build_records = self._queue.get()
+            try:
+                for logger, level, message in build_records():
+                    logger.log(level, message)
+            except Exception:
+                logging.getLogger(__name__).exception('Failed to write a log record.')
+            finally:
+                self._queue.task_done()
+
+
+log_writer = BackgroundLogWriter(getattr(settings, 'CHAT_LOG_QUEUE_SIZE', DEFAULT_QUEUE_SIZE))
+
 
 class ResponseLoggingMiddleware(MiddlewareMixin):
     """ Logs requests and responses in the nice way: log bodies of the request and response, and code together
-    in one place."""
+    in one place.
+    
+    Successful responses are sampled with per-path rates from CHAT_LOG_SAMPLE_RATES (path prefix -> rate),
+    client and server errors are always logged. Messages are built from truncated bodies in the background."""
+    
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        # the longest prefix wins
+        self.sample_rates = sorted(getattr(settings, 'CHAT_LOG_SAMPLE_RATES', {}).items(),
+                                   key=lambda item: len(item[0]), reverse=True)  # type: list
     
     def process_request(self, request: WSGIRequest) -> None:
+        request._log_sampled = random.random() < self._get_sample_rate(request.path_info)
         if request.body:
-            request._saved_body = str(self._chunked_to_max(request.body))
+            request._saved_body = self._chunked_to_max(request.body)
     
     def process_response(self, request: WSGIRequest, response: Response) -> Response:
         if type(response) == Response:
@@ -33,6 +98,9 @@ class ResponseLoggingMiddleware(MiddlewareMixin):
             else:
                 level = logging.ERROR
             
+            if level == logging.INFO and not getattr(request, '_log_sampled', True):
+                return response
+            
             _request_logger = request_logger
             _response_logger = response_logger
             # filter swagger-related messages in the separate loggers
@@ -40,25 +108,75 @@ class ResponseLoggingMiddleware(MiddlewareMixin):
                 _request_logger = swagger_request_logger
             if response.data and 'swaggerVersion' in response.data:
                 _response_logger = swagger_response_logger
-                
-            request_msg, response_msg = self._build_messages(request, response)
-            _request_logger.log(level, request_msg)
-            _response_logger.log(level, response_msg)
+            
+            if not (_request_logger.isEnabledFor(level) or _response_logger.isEnabledFor(level)):
+                return response
+            
+            # capture truncated bodies now, messages are built from them by the log writer
+            method = request.method
+            full_path = request.get_full_path()
+            saved_body = getattr(request, '_saved_body', None)
+            status_code = response.status_code
+            # the response is already rendered, slicing its content is much cheaper than str(response.data)
+            content = self._chunked_to_max(response.content) if response.data else None
+            
+            def build_records():
+                request_msg, response_msg = self._build_messages(method, full_path, saved_body, status_code, content)
+                return (_request_logger, level, request_msg), (_response_logger, level, response_msg)
+            log_writer.submit(build_records)
         
         return response
     
-    def _build_messages(self, request: WSGIRequest, response: Response) -> Tuple[str, str]:
-        request_msg_parts = [request.method, request.get_full_path()]
-        if hasattr(request, '_saved_body'):
-            request_msg_parts.append(request._saved_body)
+    def _build_messages(self, method: str, full_path: str, saved_body: Optional[bytes], status_code: int,
+                        content: Optional[bytes]) -> Tuple[str, str]:
+        request_msg_parts = [method, full_path]
+        if saved_body is not None:
+            request_msg_parts.append(str(saved_body))
         request_msg = 'Request: ' + ' '.join(request_msg_parts)
         
-        response_msg_parts = [str(response.status_code)]
-        if response.data:
-            response_msg_parts.append(str(response.data))
+        response_msg_parts = [str(status_code)]
+        if content is not None:
+            response_msg_parts.append(content.decode('utf-8', errors='replace'))
         response_msg = 'Response: ' + ' '.join(response_msg_parts)
         
         return request_msg, response_msg
     
+    def _get_sample_rate(self, path: str) -> float:
+        for prefix, rate in self.sample_rates:
+            if path.startswith(prefix):
+                return rate
+        return 1.0
+    
     def _chunked_to_max(self, msg):
         return msg[0:MAX_BODY_LENGTH]
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """ Records latency, database queries and response size of every request in the metrics registry, per URL
+    name. Should go first in MIDDLEWARE to measure the whole stack.
+
+    Every CHAT_METRICS_LOG_INTERVAL seconds a summary line is written to the 'middlewares.metrics' logger."""
+    
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        self.log_interval = getattr(settings, 'CHAT_METRICS_LOG_INTERVAL', 60)
+        self.next_log_at = time.monotonic() + self.log_interval
+    
+    def process_request(self, request: WSGIRequest) -> None:
+        instrument_connections()
+        query_counter.start()
+        request._metrics_started_at = time.perf_counter()
+    
+    def process_response(self, request: WSGIRequest, response: HttpResponse) -> HttpResponse:
+        started_at = getattr(request, '_metrics_started_at', None)
+        if started_at is None:
+            return response
+        
+        queries, db_time = query_counter.stop()
+        registry.record(get_endpoint_name(request), response.status_code, time.perf_counter() - started_at,
+                        queries, db_time, get_response_size(response))
+        
+        if self.log_interval and time.monotonic() >= self.next_log_at:
+            self.next_log_at = time.monotonic() + self.log_interval
+            log_writer.submit(lambda: ((metrics_logger, logging.INFO, format_summary(registry.snapshot())),))
+        return response
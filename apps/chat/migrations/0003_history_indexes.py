@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 03:52
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+PUBLIC_HISTORY_INDEX = 'chat_message_public_history'
+PARTIAL_INDEX_VENDORS = ('sqlite', 'postgresql')
+
+
+def fill_conversation_keys(apps, schema_editor):
+    Message = apps.get_model('chat', 'Message')
+    messages = Message.objects.using(schema_editor.connection.alias)
+    pairs = (messages.filter(to_user__isnull=False)
+             .values_list('from_user_id', 'to_user_id').distinct())
+    for from_user_id, to_user_id in pairs:
+        low_id, high_id = sorted((from_user_id, to_user_id))
+        (messages.filter(from_user_id=from_user_id, to_user_id=to_user_id)
+         .update(conversation='{low}:{high}'.format(low=low_id, high=high_id)))
+
+
+def create_public_history_index(apps, schema_editor):
+    # to_user_id leads the index, otherwise the planner prefers the plain foreign key index
+    # for "to_user_id IS NULL" and sorts the result
+    quote_name = schema_editor.quote_name
+    sql = 'CREATE INDEX {index} ON {table} ({to_user}, {timestamp}, {id})'
+    if schema_editor.connection.vendor in PARTIAL_INDEX_VENDORS:
+        sql += ' WHERE {to_user} IS NULL'
+    schema_editor.execute(sql.format(index=quote_name(PUBLIC_HISTORY_INDEX),
+                                     table=quote_name('chat_message'),
+                                     timestamp=quote_name('timestamp'),
+                                     id=quote_name('id'),
+                                     to_user=quote_name('to_user_id')))
+
+
+def drop_public_history_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        sql = 'DROP INDEX {index} ON {table}'
+    else:
+        sql = 'DROP INDEX {index}'
+    schema_editor.execute(sql.format(index=schema_editor.quote_name(PUBLIC_HISTORY_INDEX),
+                                     table=schema_editor.quote_name('chat_message')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_auto_20170301_0306'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='conversation',
+            field=models.CharField(max_length=41, null=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='message',
+            index_together=set([('conversation', 'timestamp', 'id')]),
+        ),
+        migrations.RunPython(fill_conversation_keys, migrations.RunPython.noop),
+        migrations.RunPython(create_public_history_index, drop_public_history_index),
+    ]
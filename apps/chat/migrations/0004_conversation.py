@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 04:01
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_conversations(apps, schema_editor):
+    Message = apps.get_model('chat', 'Message')
+    Conversation = apps.get_model('chat', 'Conversation')
+    db_alias = schema_editor.connection.alias
+    
+    last_messages = {}
+    messages = Message.objects.using(db_alias).filter(conversation__isnull=False).order_by('timestamp', 'id')
+    for message in messages.iterator():
+        last_messages[message.conversation] = message
+    
+    conversations = []
+    for message in last_messages.values():
+        for owner_id, peer_id in {(message.from_user_id, message.to_user_id),
+                                  (message.to_user_id, message.from_user_id)}:
+            conversations.append(Conversation(owner_id=owner_id, peer_id=peer_id,
+                                              last_message_id=message.id,
+                                              last_timestamp=message.timestamp,
+                                              last_text=message.text,
+                                              last_sent=message.from_user_id == owner_id,
+                                              unread_count=0))
+    Conversation.objects.using(db_alias).bulk_create(conversations, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0003_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_id', models.IntegerField()),
+                ('last_timestamp', models.IntegerField()),
+                ('last_text', models.TextField()),
+                ('last_sent', models.BooleanField()),
+                ('unread_count', models.IntegerField(default=0)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to=settings.AUTH_USER_MODEL)),
+                ('peer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='conversation',
+            unique_together=set([('owner', 'peer')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='conversation',
+            index_together=set([('owner', 'last_timestamp', 'last_message_id')]),
+        ),
+        migrations.RunPython(fill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 04:21
+from __future__ import unicode_literals
+
+import apps.chat.ids
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def create_message_sequence(apps, schema_editor):
+    Message = apps.get_model('chat', 'Message')
+    IdSequence = apps.get_model('chat', 'IdSequence')
+    db_alias = schema_editor.connection.alias
+    
+    max_id = Message.objects.using(db_alias).aggregate(max_id=Max('id'))['max_id'] or 0
+    IdSequence.objects.using(db_alias).create(name='message', next_value=max_id + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_conversation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(create_message_sequence, migrations.RunPython.noop),
+        # the default is applied by Django, the column does not change
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='message',
+                name='id',
+                field=models.AutoField(default=apps.chat.ids.next_message_id, primary_key=True, serialize=False),
+            ),
+        ]),
+    ]
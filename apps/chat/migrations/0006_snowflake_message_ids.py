@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 05:02
+from __future__ import unicode_literals
+
+import apps.chat.ids
+from django.db import migrations, models
+
+PUBLIC_HISTORY_INDEX = 'chat_message_public_history'
+PARTIAL_INDEX_VENDORS = ('sqlite', 'postgresql')
+
+
+def create_public_history_index(schema_editor, columns):
+    # to_user_id leads the index, otherwise the planner prefers the plain foreign key index
+    # for "to_user_id IS NULL" and sorts the result
+    quote_name = schema_editor.quote_name
+    sql = 'CREATE INDEX {index} ON {table} ({columns})'
+    if schema_editor.connection.vendor in PARTIAL_INDEX_VENDORS:
+        sql += ' WHERE {to_user} IS NULL'
+    schema_editor.execute(sql.format(index=quote_name(PUBLIC_HISTORY_INDEX),
+                                     table=quote_name('chat_message'),
+                                     columns=', '.join(quote_name(column) for column in columns),
+                                     to_user=quote_name('to_user_id')))
+
+
+def drop_public_history_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        sql = 'DROP INDEX {index} ON {table}'
+    else:
+        sql = 'DROP INDEX {index}'
+    schema_editor.execute(sql.format(index=schema_editor.quote_name(PUBLIC_HISTORY_INDEX),
+                                     table=schema_editor.quote_name('chat_message')))
+
+
+def create_id_public_history_index(apps, schema_editor):
+    create_public_history_index(schema_editor, ('to_user_id', 'id'))
+
+
+def create_timestamp_public_history_index(apps, schema_editor):
+    create_public_history_index(schema_editor, ('to_user_id', 'timestamp', 'id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_message_id_sequence'),
+    ]
+
+    operations = [
+        # dropped before the table is altered, SQLite rebuilds the table without custom indexes
+        migrations.RunPython(drop_public_history_index, create_timestamp_public_history_index),
+        migrations.AlterIndexTogether(
+            name='message',
+            index_together=set([('conversation', 'id')]),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='id',
+            field=models.BigAutoField(default=apps.chat.ids.next_message_id, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='conversation',
+            name='last_message_id',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterIndexTogether(
+            name='conversation',
+            index_together=set([('owner', 'last_message_id')]),
+        ),
+        migrations.DeleteModel(
+            name='IdSequence',
+        ),
+        migrations.RunPython(create_id_public_history_index, drop_public_history_index),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 04:38
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from apps.chat.search import BACKEND_FTS5, create_fts_index, drop_fts_index, get_search_backend, get_terms
+
+BATCH_SIZE = 1000
+
+
+def create_search_index(apps, schema_editor):
+    if get_search_backend(schema_editor.connection) == BACKEND_FTS5:
+        create_fts_index(schema_editor)
+        return
+    
+    Message = apps.get_model('chat', 'Message')
+    MessageTerm = apps.get_model('chat', 'MessageTerm')
+    messages = Message.objects.using(schema_editor.connection.alias).order_by('id').values_list('id', 'text')
+    terms = MessageTerm.objects.using(schema_editor.connection.alias)
+    last_id = 0
+    while True:
+        rows = list(messages.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not rows:
+            break
+        terms.bulk_create([MessageTerm(term=term, message_id=message_id)
+                           for message_id, text in rows for term in get_terms(text)])
+        last_id = rows[-1][0]
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        drop_fts_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_snowflake_message_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='chat.Message')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='messageterm',
+            index_together=set([('term', 'message')]),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,19 +1,279 @@
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 
+from apps.chat.authentication import token_cache
+from apps.chat.ids import next_message_id
+from apps.chat.search import (BACKEND_TERMS, FTS_TABLE, MAX_TERM_LENGTH, get_fts_query, get_search_backend,
+                              get_terms)
+from apps.chat.users import directory_version, username_cache
+
+
+class HistoryQuerySet(models.QuerySet):
+    """ Scopes shared by the messages of the hot table and the archived ones."""
+    
+    def public(self) -> 'HistoryQuerySet':
+        return self.filter(to_user__isnull=True)
+    
+    def private(self) -> 'HistoryQuerySet':
+        return self.filter(to_user__isnull=False)
+    
+    def private_between(self, user1_id: int, user2_id: int) -> 'HistoryQuerySet':
+        return self.filter(conversation=Message.get_conversation_key(user1_id, user2_id))
+    
+    def visible_to(self, user_id: int) -> 'HistoryQuerySet':
+        """ Public messages and private messages sent or received by the user."""
+        return self.filter(Q(to_user__isnull=True) | Q(to_user_id=user_id) | Q(from_user_id=user_id))
+
+
+class MessageQuerySet(HistoryQuerySet):
+    def latest_position(self) -> Optional[Tuple[int, int]]:
+        """ (timestamp, id) of the newest message, read from the end of the history index."""
+        return self.order_by('-id').values_list('timestamp', 'id').first()
+    
+    def matching(self, terms: List[str]) -> 'MessageQuerySet':
+        """ Messages containing all the terms (as returned by get_terms()), looked up in the search index."""
+        if not terms:
+            return self.none()
+        
+        if get_search_backend(connections[self.db]) == BACKEND_TERMS:
+            queryset = self
+            for term in terms:
+                queryset = queryset.filter(id__in=MessageTerm.objects.filter(term=term).values('message_id'))
+            return queryset
+        
+        where = '{message}.id IN (SELECT rowid FROM {fts} WHERE {fts} MATCH %s)'.format(
+            message=self.model._meta.db_table, fts=FTS_TABLE)
+        return self.extra(where=[where], params=[get_fts_query(terms)])
+    
+    def create_messages(self, messages: List['Message']) -> List['Message']:
+        """ Inserts messages, which already have their ids, with one bulk INSERT and updates conversation
+        summaries, all in one transaction."""
+        if not messages:
+            return messages
+        
+        for message in messages:
+            message.set_conversation()
+        
+        with transaction.atomic():
+            self.bulk_create(messages)
+            MessageTerm.objects.index_messages(messages)
+            Conversation.objects.record_messages(messages)
+        return messages
+
 
 class Message(models.Model):
+    # snowflake id generated on instantiation, orders messages by creation time and is their cursor key
+    id = models.BigAutoField(primary_key=True, default=next_message_id)
     from_user = models.ForeignKey(User, related_name='messages_sent')
     to_user = models.ForeignKey(User, null=True, related_name='messages_received')
     
+    # normalized "low_user_id:high_user_id" pair for private messages, NULL for public ones
+    conversation = models.CharField(max_length=41, null=True)
+    
     text = models.TextField()
     timestamp = models.IntegerField()
     
+    objects = MessageQuerySet.as_manager()
+    
+    class Meta:
+        index_together = (
+            ('conversation', 'id'),
+        )
+    
+    @staticmethod
+    def get_conversation_key(user1_id: int, user2_id: int) -> str:
+        low_id, high_id = sorted((user1_id, user2_id))
+        return '{low}:{high}'.format(low=low_id, high=high_id)
+    
+    def set_conversation(self) -> None:
+        if self.to_user_id is not None:
+            self.conversation = self.get_conversation_key(self.from_user_id, self.to_user_id)
     
+    def save(self, *args, **kwargs):
+        self.set_conversation()
+        super().save(*args, **kwargs)
+
+
+class ArchivedMessage(models.Model):
+    """ Message moved out of the hot table by the archive_messages command once it is older than the retention
+    of its scope. History reads continue here when they page past the oldest message of the hot table."""
+    id = models.BigIntegerField(primary_key=True)
+    from_user = models.ForeignKey(User, related_name='+')
+    to_user = models.ForeignKey(User, null=True, related_name='+')
+    conversation = models.CharField(max_length=41, null=True)
+    
+    text = models.TextField()
+    timestamp = models.IntegerField()
+    
+    objects = HistoryQuerySet.as_manager()
+    
+    class Meta:
+        index_together = (
+            ('conversation', 'id'),
+            ('to_user', 'id'),
+        )
+
+
+class MessageTermQuerySet(models.QuerySet):
+    def index_messages(self, messages: List[Message]) -> None:
+        """ Adds new messages to the term table, when it is the search backend. The FTS5 index is filled
+        by triggers in the database."""
+        if get_search_backend(connections[router.db_for_write(MessageTerm)]) != BACKEND_TERMS:
+            return
+        self.bulk_create([MessageTerm(term=term, message_id=message.id)
+                          for message in messages for term in get_terms(message.text)])
+
+
+class MessageTerm(models.Model):
+    """ Inverted index of message texts for databases without FTS5: a row per distinct word of a message."""
+    term = models.CharField(max_length=MAX_TERM_LENGTH)
+    message = models.ForeignKey(Message, related_name='+')
+    
+    objects = MessageTermQuerySet.as_manager()
+    
+    class Meta:
+        index_together = (
+            ('term', 'message'),
+        )
+
+
+class ConversationQuerySet(models.QuerySet):
+    def record_messages(self, messages: List[Message]) -> None:
+        """ Folds new private messages into the summaries of both participants: one UPDATE per
+        (owner, peer) pair of the batch, plus an INSERT the first time the pair talks."""
+        summaries = {}  # type: Dict[Tuple[int, int], List]
+        for message in messages:
+            if message.to_user_id is None:
+                continue
+            
+            participants = [(message.from_user_id, message.to_user_id, 0)]
+            if message.to_user_id != message.from_user_id:
+                participants.append((message.to_user_id, message.from_user_id, 1))
+            for owner_id, peer_id, unread in participants:
+                summary = summaries.setdefault((owner_id, peer_id), [message, 0])
+                if message.id > summary[0].id:
+                    summary[0] = message
+                summary[1] += unread
+        
+        for (owner_id, peer_id), (last_message, unread) in summaries.items():
+            if not self._update_summary(owner_id, peer_id, last_message, unread):
+                try:
+                    with transaction.atomic():
+                        self.create(owner_id=owner_id, peer_id=peer_id,
+                                    last_message_id=last_message.id,
+                                    last_timestamp=last_message.timestamp,
+                                    last_text=last_message.text,
+                                    last_sent=last_message.from_user_id == owner_id,
+                                    unread_count=unread)
+                except IntegrityError:
+                    # created concurrently by another writer
+                    self._update_summary(owner_id, peer_id, last_message, unread)
+    
+    def _update_summary(self, owner_id: int, peer_id: int, last_message: Message, unread: int) -> int:
+        # messages of concurrent writers may commit out of order, only move the summary forward
+        is_newer = Q(last_message_id__lt=last_message.id)
+        
+        def if_newer(value, field: str, output_field: models.Field) -> Case:
+            return Case(When(is_newer, then=Value(value)), default=F(field), output_field=output_field)
+        
+        return self.filter(owner_id=owner_id, peer_id=peer_id).update(
+            last_message_id=if_newer(last_message.id, 'last_message_id', models.BigIntegerField()),
+            last_timestamp=if_newer(last_message.timestamp, 'last_timestamp', models.IntegerField()),
+            last_text=if_newer(last_message.text, 'last_text', models.TextField()),
+            last_sent=if_newer(last_message.from_user_id == owner_id, 'last_sent', models.BooleanField()),
+            unread_count=F('unread_count') + unread)
+
+
+class Conversation(models.Model):
+    """ Denormalized summary of a private conversation, one row per participant, kept up to date
+    by Message.objects.create_messages()."""
+    owner = models.ForeignKey(User, related_name='conversations')
+    peer = models.ForeignKey(User, related_name='+')
+    
+    last_message_id = models.BigIntegerField()
+    last_timestamp = models.IntegerField()
+    last_text = models.TextField()
+    # whether the last message was sent by the owner
+    last_sent = models.BooleanField()
+    
+    unread_count = models.IntegerField(default=0)
+    
+    objects = ConversationQuerySet.as_manager()
+    
+    class Meta:
+        unique_together = (
+            ('owner', 'peer'),
+        )
+        index_together = (
+            ('owner', 'last_message_id'),
+        )
+    
+    
+@receiver(post_save, sender=Message)
+def index_saved_message(sender, instance=None, created=False, **kwargs):
+    # messages stored with create_messages() are indexed there
+    if created:
+        MessageTerm.objects.index_messages([instance])
+
+
 @receiver(post_save, sender=User)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
-        Token.objects.create(user=instance)
\ No newline at end of file
+        Token.objects.create(user=instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user_tokens(sender, instance=None, created=False, **kwargs):
+    # covers deactivation as well as any other change of the user cached together with the token
+    if not created:
+        token_cache.invalidate_user(instance.id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_username(sender, instance=None, created=False, **kwargs):
+    if created:
+        username_cache.invalidate(usernames=[instance.username])
+    else:
+        username_cache.invalidate(usernames=[instance.username], user_ids=[instance.id])
+
+
+@receiver(post_delete, sender=User)
+def invalidate_cached_username_on_delete(sender, instance=None, **kwargs):
+    username_cache.invalidate(user_ids=[instance.id])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_directory_version(sender, **kwargs):
+    directory_version.bump()
+
+
+@receiver(post_save, sender=Token)
+def invalidate_cached_token_on_save(sender, instance=None, created=False, **kwargs):
+    if not created:
+        token_cache.invalidate([instance.key])
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token_on_delete(sender, instance=None, **kwargs):
+    token_cache.invalidate([instance.key])
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection=None, **kwargs):
+    """ Sets CHAT_SQLITE_PRAGMAS (name -> value) on every new SQLite connection."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'CHAT_SQLITE_PRAGMAS', {})
+    if pragmas:
+        with connection.cursor() as cursor:
+            for name, value in pragmas.items():
+                cursor.execute('PRAGMA {name} = {value}'.format(name=name, value=value))
@@ -0,0 +1,129 @@
+import base64
+import binascii
+from typing import List, Optional
+
+from django.conf import settings
+from django.db.models import QuerySet
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(message_id: int) -> str:
+    raw = str(message_id).encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> int:
+    """ Message id of the cursor. Cursors issued before ids became the ordering key hold "timestamp:id",
+    their id is used."""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        parts = base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii').split(':')
+        if len(parts) > 2:
+            raise ValueError(cursor)
+        return int(parts[-1])
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValidationError({'detail': 'Invalid cursor.'})
+
+
+def encode_key_cursor(key: str) -> str:
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_key_cursor(cursor: str) -> str:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        return base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValidationError({'detail': 'Invalid cursor.'})
+
+
+def get_page_limit(request: Request) -> int:
+    default = getattr(settings, 'CHAT_HISTORY_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    maximum = getattr(settings, 'CHAT_HISTORY_MAX_PAGE_SIZE', MAX_PAGE_SIZE)
+    try:
+        limit = int(request.query_params.get('limit', default))
+    except ValueError:
+        raise ValidationError({'limit': 'A positive integer is required.'})
+    if limit <= 0:
+        raise ValidationError({'limit': 'A positive integer is required.'})
+    return min(limit, maximum)
+
+
+class MessageCursorPagination():
+    """ Keyset pagination over message ids, which are ordered by creation time.
+
+    Pages are always returned in ascending order. Without a cursor the newest page is returned,
+    ``before`` walks back in history and ``after`` walks forward, both in constant time on an index
+    ending with the id.
+
+    With an archive (see apps.chat.retention) pages continue into it past the oldest message of the hot
+    queryset. The archive is only read when the hot queryset runs out going back, or when ``after`` is below
+    the archive floor."""
+
+    def __init__(self, request: Request) -> None:
+        self.before = self._get_cursor(request, 'before')
+        self.after = self._get_cursor(request, 'after')
+        if self.before is not None and self.after is not None:
+            raise ValidationError({'detail': 'Only one of "before" and "after" can be used.'})
+        self.limit = get_page_limit(request)
+
+        self.has_previous = False
+        self.has_next = False
+
+    def paginate_queryset(self, queryset: QuerySet, archive=None) -> List:
+        if self.after is not None:
+            page = []
+            if archive is not None and self.after < archive.floor:
+                page = list(archive.messages.filter(id__gt=self.after).order_by('id')[:self.limit + 1])
+            if len(page) <= self.limit:
+                page += list(queryset.filter(id__gt=self.after).order_by('id')[:self.limit + 1 - len(page)])
+            self.has_next = len(page) > self.limit
+            self.has_previous = True
+            page = page[:self.limit]
+        else:
+            if self.before is not None:
+                queryset = queryset.filter(id__lt=self.before)
+                self.has_next = True
+            page = list(queryset.order_by('-id')[:self.limit + 1])
+            if len(page) <= self.limit and archive is not None:
+                # archived messages are older than the messages left in the hot table
+                archived = archive.messages
+                if self.before is not None:
+                    archived = archived.filter(id__lt=self.before)
+                page += list(archived.order_by('-id')[:self.limit + 1 - len(page)])
+            self.has_previous = len(page) > self.limit
+            page = page[:self.limit]
+            page.reverse()
+
+        return page
+
+    def get_paginated_data(self, results: List[dict]) -> dict:
+        """ Wraps serialized page into the response envelope. Cursors are built from the "id" keys
+        of the first and the last serialized messages."""
+        previous_cursor = next_cursor = None
+        if results:
+            if self.has_previous:
+                previous_cursor = encode_cursor(results[0]['id'])
+            if self.has_next:
+                next_cursor = encode_cursor(results[-1]['id'])
+        elif self.after is not None:
+            previous_cursor = encode_cursor(self.after)
+        elif self.before is not None:
+            next_cursor = encode_cursor(self.before)
+
+        return {
+            'previous': previous_cursor,
+            'next': next_cursor,
+            'results': results
+        }
+
+    def _get_cursor(self, request: Request, name: str) -> Optional[int]:
+        cursor = request.query_params.get(name)
+        if not cursor:
+            return None
+        return decode_cursor(cursor)
@@ -0,0 +1,127 @@
+import collections
+import itertools
+import operator
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+from apps.chat.broker import Broker, get_broker
+from apps.chat.ids import get_id_floor, get_id_timestamp, get_settle_time, get_settled_id_floor
+from apps.chat.models import Message
+from apps.chat.serializers import serialize_message
+
+
+DEFAULT_BUFFER_SIZE = 10000
+
+PUBLIC_TOPIC = 'public'
+CONVERSATION_TOPIC_PREFIX = 'conversation:'
+
+
+def get_message_topic(message: Message) -> str:
+    if message.conversation is None:
+        return PUBLIC_TOPIC
+    return CONVERSATION_TOPIC_PREFIX + message.conversation
+
+
+def publish_messages(messages: Iterable[Message]) -> None:
+    """ Publishes newly created messages to the broker as one batch. Has to be called after they are committed."""
+    message_hub.connect()
+    get_broker().publish_many([(get_message_topic(message), serialize_message(message)) for message in messages])
+
+
+def _is_visible(message: dict, username: str) -> bool:
+    return (message['to_user'] is None or
+            message['to_user'] == username or
+            message['from_user'] == username)
+
+
+class MessageHub():
+    """ Fan-out of messages published to the broker to long-polling subscribers of this process.
+
+    The hub subscribes to all topics once and keeps every message once in a bounded buffer, waiting subscribers
+    are woken up and pick the messages visible to them from it, so a new message costs one append no matter how
+    many clients poll."""
+
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER_SIZE, broker: Broker = None) -> None:
+        self._broker = broker
+        self._condition = threading.Condition()
+        self._buffer = collections.deque(maxlen=buffer_size)
+        # the buffer holds every message with a greater id published after the hub connected
+        self._horizon = get_id_floor(int(time.time() * 1000))
+        self._subscription = None
+
+    def connect(self) -> None:
+        """ Subscribes the hub to the broker of the process, the buffer is filled from then on."""
+        if self._subscription is not None:
+            return
+        with self._condition:
+            if self._subscription is None:
+                broker = self._broker or get_broker()
+                self._horizon = max(self._horizon, get_id_floor(int(time.time() * 1000)))
+                self._subscription = broker.subscribe([PUBLIC_TOPIC, CONVERSATION_TOPIC_PREFIX + '*'],
+                                                      self._on_messages)
+
+    def add(self, messages: List[dict]) -> None:
+        with self._condition:
+            overflow = len(self._buffer) + len(messages) - self._buffer.maxlen
+            for evicted in itertools.islice(itertools.chain(self._buffer, messages), max(overflow, 0)):
+                self._horizon = max(self._horizon, evicted['id'])
+            self._buffer.extend(messages)
+            self._condition.notify_all()
+
+    def covers(self, since_id: int) -> bool:
+        """ Whether all messages with ids greater than ``since_id`` are available in the buffer."""
+        with self._condition:
+            return since_id >= self._horizon
+
+    def wait(self, username: str, since_id: int, timeout: float, caught_up_to: int = None) -> Optional[List[dict]]:
+        """ Blocks until messages with ids greater than ``since_id`` visible to the user are published and settled
+        (see get_settled_id_floor()), or timeout expires. Returns them in id order, or None if the buffer does not
+        reach back to ``since_id`` and history has to be read from the database.
+
+        ``caught_up_to`` is the settled floor the database was read up to when it had no messages for the user past
+        ``since_id``: the buffer continues from there as long as it reaches back to that floor."""
+        self.connect()
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                if since_id < self._horizon and (caught_up_to is None or caught_up_to < self._horizon):
+                    return None
+
+                messages, unsettled = self._collect(username, since_id, get_settled_id_floor())
+                remaining = deadline - time.monotonic()
+                if messages or remaining <= 0:
+                    return messages
+                if unsettled is not None:
+                    # wake up when the oldest message waiting for the user settles
+                    settles_in = (get_id_timestamp(unsettled) + get_settle_time()) / 1000 - time.time()
+                    remaining = min(remaining, max(settles_in, 0.001))
+                self._condition.wait(remaining)
+
+    def _on_messages(self, topic: str, messages: List[dict]) -> None:
+        self.add(messages)
+
+    def _collect(self, username: str, since_id: int, floor: int) -> Tuple[List[dict], Optional[int]]:
+        """ Messages visible to the user with ids from ``since_id`` to ``floor`` in id order, and the smallest id
+        of the visible messages past the floor, None if there are none."""
+        # the buffer is in publish order, messages published earlier than a message can have ids up to the settle
+        # time greater than its id, so messages older than that before since_id end the search
+        oldest = get_id_floor(get_id_timestamp(since_id) - get_settle_time())
+        messages = []
+        unsettled = None
+        for message in reversed(self._buffer):
+            if message['id'] < oldest:
+                break
+            if message['id'] <= since_id or not _is_visible(message, username):
+                continue
+            if message['id'] < floor:
+                messages.append(message)
+            elif unsettled is None or message['id'] < unsettled:
+                unsettled = message['id']
+        messages.sort(key=operator.itemgetter('id'))
+        return messages, unsettled
+
+
+message_hub = MessageHub(getattr(settings, 'CHAT_HUB_BUFFER_SIZE', DEFAULT_BUFFER_SIZE))
@@ -0,0 +1,82 @@
+import time
+from collections import namedtuple
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from apps.chat.ids import get_id_floor
+from apps.chat.models import ArchivedMessage, HistoryQuerySet, Message
+from apps.chat.serializers import MESSAGE_ROW_FIELDS
+
+
+SCOPE_PUBLIC = 'public'
+SCOPE_PRIVATE = 'private'
+SCOPES = (SCOPE_PUBLIC, SCOPE_PRIVATE)
+
+DEFAULT_BATCH_SIZE = 1000
+DAY = 24 * 60 * 60 * 1000  # milliseconds
+
+RETENTION_SETTINGS = {
+    SCOPE_PUBLIC: 'CHAT_RETENTION_PUBLIC_DAYS',
+    SCOPE_PRIVATE: 'CHAT_RETENTION_PRIVATE_DAYS',
+}
+
+# MESSAGE_ROW_FIELDS rows of the archived messages of one conversation, all of them have ids below floor
+HistoryArchive = namedtuple('HistoryArchive', ['messages', 'floor'])
+
+
+def get_scope(conversation: Optional[str]) -> str:
+    return SCOPE_PUBLIC if conversation is None else SCOPE_PRIVATE
+
+
+def get_retention_floor(scope: str) -> Optional[int]:
+    """ Messages of the scope with ids below the floor are past the retention and belong to the archive.
+    None when the scope has no retention and its messages stay in the hot table."""
+    days = getattr(settings, RETENTION_SETTINGS[scope], None)
+    if days is None:
+        return None
+    return get_id_floor(int(time.time() * 1000) - days * DAY)
+
+
+def get_history_archive(conversation: Optional[str]) -> Optional[HistoryArchive]:
+    """ Archive the history of the conversation continues in, None when its scope has no retention."""
+    floor = get_retention_floor(get_scope(conversation))
+    if floor is None:
+        return None
+    if conversation is None:
+        messages = ArchivedMessage.objects.public()
+    else:
+        messages = ArchivedMessage.objects.filter(conversation=conversation)
+    return HistoryArchive(messages.values_list(*MESSAGE_ROW_FIELDS), floor)
+
+
+def scope_messages(queryset: HistoryQuerySet, scope: str) -> HistoryQuerySet:
+    return queryset.public() if scope == SCOPE_PUBLIC else queryset.private()
+
+
+def archive_messages(scope: str, batch_size: int = None) -> int:
+    """ Moves messages of the scope past its retention from the hot table to the archive, one transaction per
+    batch, oldest first. Returns the number of moved messages.
+
+    Moved messages are no longer found by search and sync, which only read the hot table."""
+    floor = get_retention_floor(scope)
+    if floor is None:
+        return 0
+    if batch_size is None:
+        batch_size = getattr(settings, 'CHAT_ARCHIVE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+    expired = scope_messages(Message.objects.all(), scope).filter(id__lt=floor).order_by('id')
+    moved = 0
+    while True:
+        with transaction.atomic():
+            messages = list(expired[:batch_size])
+            if not messages:
+                return moved
+            ArchivedMessage.objects.bulk_create([
+                ArchivedMessage(id=message.id, from_user_id=message.from_user_id, to_user_id=message.to_user_id,
+                                conversation=message.conversation, text=message.text, timestamp=message.timestamp)
+                for message in messages])
+            # search index entries go with the messages
+            Message.objects.filter(id__in=[message.id for message in messages]).delete()
+        moved += len(messages)
@@ -0,0 +1,84 @@
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+DEFAULT_REPLICA_ALIAS = 'replica'
+DEFAULT_PIN_SECONDS = 5
+DEFAULT_CACHE_ALIAS = 'default'
+
+CACHE_KEY_PREFIX = 'chat:pin:'
+
+_state = threading.local()
+
+
+def get_replica_alias() -> Optional[str]:
+    """ CHAT_REPLICA_ALIAS when it is one of DATABASES, None when there is no replica to read from."""
+    alias = getattr(settings, 'CHAT_REPLICA_ALIAS', DEFAULT_REPLICA_ALIAS)
+    if alias and alias in settings.DATABASES:
+        return alias
+    return None
+
+
+def _get_pin_cache():
+    return caches[getattr(settings, 'CHAT_REPLICA_PIN_CACHE_ALIAS', DEFAULT_CACHE_ALIAS)]
+
+
+def pin_to_primary(user_ids: Iterable[int]) -> None:
+    """ Sends reads of the users to the primary for CHAT_REPLICA_PIN_SECONDS, which should cover the replication
+    lag, so they read their own writes."""
+    seconds = getattr(settings, 'CHAT_REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS)
+    if get_replica_alias() is None or not seconds:
+        return
+    _get_pin_cache().set_many({CACHE_KEY_PREFIX + str(user_id): 1 for user_id in user_ids}, seconds)
+
+
+def is_pinned_to_primary(user_id: int) -> bool:
+    return _get_pin_cache().get(CACHE_KEY_PREFIX + str(user_id)) is not None
+
+
+@contextmanager
+def replica_reads():
+    """ Reads of the current thread go to the replica inside the block, writes still go to the primary."""
+    previous = getattr(_state, 'use_replica', False)
+    _state.use_replica = True
+    try:
+        yield
+    finally:
+        _state.use_replica = previous
+
+
+def read_from_replica(method):
+    """ Decorates a read-only handler of an API view: its reads go to the replica unless the user of the request
+    has written recently. Applied outside of conditional GET decorators, so their reads go there as well."""
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        if get_replica_alias() is None or is_pinned_to_primary(request.user.id):
+            return method(self, request, *args, **kwargs)
+        with replica_reads():
+            return method(self, request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter():
+    """ Routes reads inside replica_reads() to the CHAT_REPLICA_ALIAS database, everything else to the default
+    one. The replica is expected to be a copy of the default database, kept by replication."""
+
+    def db_for_read(self, model, **hints):
+        if getattr(_state, 'use_replica', False):
+            return get_replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # objects read from the replica are the same rows as on the primary
+        databases = {'default', get_replica_alias()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
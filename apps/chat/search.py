@@ -0,0 +1,97 @@
+import re
+import sqlite3
+from typing import List
+
+from django.conf import settings
+
+
+BACKEND_AUTO = 'auto'
+BACKEND_FTS5 = 'fts5'
+BACKEND_TERMS = 'terms'
+
+FTS_TABLE = 'chat_message_fts'
+# the same word boundaries and case folding as get_terms(), so both backends match the same messages
+FTS_TOKENIZER = 'unicode61 remove_diacritics 0'
+
+# longer words are kept in the term table by their prefix and looked up by it in FTS5
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+
+TERM_RE = re.compile(r'[^\W_]+')
+
+_fts5_available = None
+
+
+def get_terms(text: str) -> List[str]:
+    """ Distinct lowercased words of the text in the order they appear."""
+    terms = []
+    for term in TERM_RE.findall(text.lower()):
+        term = term[:MAX_TERM_LENGTH]
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+def fts5_available() -> bool:
+    """ Whether the SQLite library Django uses has the FTS5 extension compiled in."""
+    global _fts5_available
+    if _fts5_available is None:
+        probe = sqlite3.connect(':memory:')
+        try:
+            probe.execute('CREATE VIRTUAL TABLE probe USING fts5(text)')
+            _fts5_available = True
+        except sqlite3.OperationalError:
+            _fts5_available = False
+        finally:
+            probe.close()
+    return _fts5_available
+
+
+def get_search_backend(connection) -> str:
+    """ CHAT_SEARCH_BACKEND, with "auto" resolved to FTS5 on SQLite that has it and to the term table otherwise.
+    Migrations create the FTS5 index under the same condition."""
+    backend = getattr(settings, 'CHAT_SEARCH_BACKEND', BACKEND_AUTO)
+    if backend == BACKEND_AUTO:
+        if connection.vendor == 'sqlite' and fts5_available():
+            return BACKEND_FTS5
+        return BACKEND_TERMS
+    return backend
+
+
+def get_fts_query(terms: List[str]) -> str:
+    """ FTS5 query matching messages containing all the terms, each quoted so it is never read as an operator."""
+    phrases = []
+    for term in terms:
+        phrase = '"{term}"'.format(term=term.replace('"', '""'))
+        if len(term) == MAX_TERM_LENGTH:
+            phrase += '*'
+        phrases.append(phrase)
+    return ' '.join(phrases)
+
+
+def create_fts_index(schema_editor) -> None:
+    """ Creates the FTS5 index of message texts, kept up to date by triggers on chat_message, and fills it.
+
+    SQLite migrations which alter chat_message copy it into a new table and drop the old one together with
+    its triggers, such migrations have to drop the index before and call this again after."""
+    quote_name = schema_editor.quote_name
+    names = {'fts': quote_name(FTS_TABLE), 'message': quote_name('chat_message'), 'tokenizer': FTS_TOKENIZER}
+    statements = [
+        "CREATE VIRTUAL TABLE {fts} USING fts5(text, content={message}, content_rowid=id, tokenize='{tokenizer}')",
+        "CREATE TRIGGER chat_message_fts_insert AFTER INSERT ON {message} BEGIN "
+        "INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END",
+        "CREATE TRIGGER chat_message_fts_delete AFTER DELETE ON {message} BEGIN "
+        "INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text); END",
+        "CREATE TRIGGER chat_message_fts_update AFTER UPDATE OF text ON {message} BEGIN "
+        "INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text); "
+        "INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END",
+        "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+    for statement in statements:
+        schema_editor.execute(statement.format(**names))
+
+
+def drop_fts_index(schema_editor) -> None:
+    for trigger in ('chat_message_fts_insert', 'chat_message_fts_delete', 'chat_message_fts_update'):
+        schema_editor.execute('DROP TRIGGER IF EXISTS {name}'.format(name=trigger))
+    schema_editor.execute('DROP TABLE IF EXISTS {name}'.format(name=schema_editor.quote_name(FTS_TABLE)))
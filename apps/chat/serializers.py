@@ -1,7 +1,20 @@
+from typing import Iterable, List, Optional
+
 from django.contrib.auth.models import AbstractUser, User
 from rest_framework import serializers
 
 from apps.chat.models import Message
+from apps.chat.users import username_cache
+
+
+# Message ids take 64 bits and JavaScript numbers only hold integers up to 2 ** 53 exactly, so every id in the API
+# is also given as a string in the *_str field next to it, for clients to keep and send back.
+
+# columns for .values_list() on Message querysets, in the order serialize_message_rows() expects them
+MESSAGE_ROW_FIELDS = ('id', 'from_user__username', 'to_user__username', 'timestamp', 'text')
+# the same for Conversation querysets and serialize_conversation_rows()
+CONVERSATION_ROW_FIELDS = ('peer__username', 'unread_count',
+                           'last_message_id', 'last_timestamp', 'last_text', 'last_sent')
 
 
 class UserSerializer(serializers.Serializer):
@@ -15,21 +28,68 @@ class RegisterUserSerializer(UserSerializer):
 
 
 class MessageSerializer(serializers.Serializer):
-    from_user = serializers.CharField(max_length=150,
-                                      validators=[AbstractUser.username_validator])
+    """ Validates a new message. The sender and the timestamp are set by the view:
+    serializer.save(from_user=request.user, timestamp=...), which returns the message with its id but
+    does not store it, the view passes it to store_messages()."""
+    id = serializers.IntegerField(read_only=True)
+    id_str = serializers.CharField(source='id', read_only=True)
+    from_user = serializers.CharField(source='from_user.username', read_only=True)
     to_user = serializers.CharField(max_length=150,
                                     validators=[AbstractUser.username_validator],
                                     allow_null=True)
-    timestamp = serializers.IntegerField()
+    timestamp = serializers.IntegerField(read_only=True)
     text = serializers.CharField()
     
-    def create(self, validated_data):
-        to_user = None
-        if validated_data['to_user'] is not None:
-            to_user = User.objects.get(username=validated_data['to_user'])
+    def validate_to_user(self, value: Optional[str]) -> Optional[User]:
+        if value is None:
+            return None
         
-        message = Message.objects.create(from_user=User.objects.get(username=validated_data['from_user']),
-                                         to_user=to_user,
-                                         timestamp=validated_data['timestamp'],
-                                         text=validated_data['text'])
-        return message
\ No newline at end of file
+        to_user = username_cache.get(value)
+        if to_user is None:
+            raise serializers.ValidationError('User with this username does not exist.')
+        return to_user
+    
+    def create(self, validated_data):
+        return Message(from_user=validated_data['from_user'],
+                       to_user=validated_data['to_user'],
+                       timestamp=validated_data['timestamp'],
+                       text=validated_data['text'])
+
+
+class OutgoingMessageSerializer(serializers.Serializer):
+    """ One item of a bulk send request."""
+    to_user = serializers.CharField(max_length=150,
+                                    validators=[AbstractUser.username_validator])
+    text = serializers.CharField()
+
+
+def serialize_message_rows(rows: Iterable[tuple]) -> List[dict]:
+    """ Bulk counterpart of MessageSerializer(...).data for rows fetched with MESSAGE_ROW_FIELDS:
+    no serializer instance and no related user lookups per message."""
+    return [{'id': pk, 'id_str': str(pk), 'from_user': from_user, 'to_user': to_user, 'timestamp': timestamp,
+             'text': text}
+            for pk, from_user, to_user, timestamp, text in rows]
+
+
+def serialize_message(message: Message) -> dict:
+    """ Same as MessageSerializer(instance=message).data, for a message with its users already loaded."""
+    return {'id': message.id,
+            'id_str': str(message.id),
+            'from_user': message.from_user.username,
+            'to_user': message.to_user.username if message.to_user is not None else None,
+            'timestamp': message.timestamp,
+            'text': message.text}
+
+
+def serialize_conversation_rows(rows: Iterable[tuple], username: str) -> List[dict]:
+    """ Conversation summaries of the user from rows fetched with CONVERSATION_ROW_FIELDS."""
+    conversations = []
+    for peer, unread_count, last_message_id, last_timestamp, last_text, last_sent in rows:
+        from_user, to_user = (username, peer) if last_sent else (peer, username)
+        conversations.append({
+            'with': peer,
+            'unread_count': unread_count,
+            'last_message': {'id': last_message_id, 'id_str': str(last_message_id), 'from_user': from_user,
+                             'to_user': to_user, 'timestamp': last_timestamp, 'text': last_text}
+        })
+    return conversations
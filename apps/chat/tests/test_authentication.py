@@ -0,0 +1,102 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from apps.chat.authentication import TokenCache, token_cache
+from apps.chat.tests.base import AuthenticatedClientFactory, TokenizedAPIClient
+
+
+class TestCachedTokenAuthentication(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user('asdf', password='password')
+        self.auth_client = AuthenticatedClientFactory().client('asdf')
+    
+    def test_second_request_skips_token_query(self):
+        self.auth_client.get(reverse('user-list'))
+        
+        # only the user list query is left
+        with self.assertNumQueries(1):
+            response = self.auth_client.get(reverse('user-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_rotated_token_is_rejected(self):
+        self.auth_client.get(reverse('user-list'))
+        
+        self.user.auth_token.delete()
+        new_token = Token.objects.create(user=self.user)
+        
+        response = self.auth_client.get(reverse('user-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = TokenizedAPIClient(new_token.key).get(reverse('user-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_deactivated_user_is_rejected(self):
+        self.auth_client.get(reverse('user-list'))
+        
+        self.user.is_active = False
+        self.user.save()
+        
+        response = self.auth_client.get(reverse('user-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_counts_hits_and_misses(self):
+        before = token_cache.stats()
+        self.auth_client.get(reverse('user-list'))
+        self.auth_client.get(reverse('user-list'))
+        after = token_cache.stats()
+        
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'tokens': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tokens'},
+})
+class TestTokenCache(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('asdf', password='password')
+        self.token = self.user.auth_token
+    
+    def test_evicts_least_recently_used(self):
+        cache = TokenCache(max_size=2)
+        tokens = [Token(key=str(i), user=self.user) for i in range(3)]
+        cache.set('0', tokens[0])
+        cache.set('1', tokens[1])
+        cache.get('0')
+        cache.set('2', tokens[2])
+        
+        self.assertIsNotNone(cache.get('0'))
+        self.assertIsNone(cache.get('1'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+    
+    def test_expires_entries(self):
+        cache = TokenCache(ttl=60)
+        with mock.patch('apps.chat.caching.time.monotonic', return_value=0):
+            cache.set(self.token.key, self.token)
+        with mock.patch('apps.chat.caching.time.monotonic', return_value=61):
+            self.assertIsNone(cache.get(self.token.key))
+    
+    def test_shared_tier_fills_local_tier(self):
+        writer = TokenCache(shared_cache_alias='tokens')
+        reader = TokenCache(shared_cache_alias='tokens')
+        writer.set(self.token.key, self.token)
+        
+        self.assertEqual(reader.get(self.token.key).user_id, self.user.id)
+        self.assertEqual(reader.stats()['shared_hits'], 1)
+        self.assertIsNotNone(reader.get(self.token.key))
+        self.assertEqual(reader.stats()['hits'], 1)
+    
+    def test_invalidation_reaches_other_instances(self):
+        writer = TokenCache(shared_cache_alias='tokens')
+        reader = TokenCache(shared_cache_alias='tokens')
+        writer.set(self.token.key, self.token)
+        reader.get(self.token.key)
+        
+        writer.invalidate([self.token.key])
+        self.assertIsNone(reader.get(self.token.key))
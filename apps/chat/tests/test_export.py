@@ -0,0 +1,118 @@
+import gzip
+import json
+import os
+import tempfile
+import zlib
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+
+from apps.chat.export import iter_message_rows, iter_ndjson
+from apps.chat.models import ArchivedMessage, Message
+from apps.chat.serializers import MESSAGE_ROW_FIELDS, serialize_message_rows
+from apps.chat.tests.base import AuthenticatedClientFactory
+
+
+def get_rss() -> int:
+    """ Resident set size of the process in bytes."""
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class TestExport(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user('asdf1', password='password')
+        self.user2 = User.objects.create_user('asdf2', password='password')
+        self.user3 = User.objects.create_user('asdf3', password='password')
+        self.auth_client = AuthenticatedClientFactory().client('asdf1')
+        
+        Message.objects.create_messages(
+            [Message(from_user=self.user2, timestamp=n, text='public {n}'.format(n=n)) for n in range(5)] +
+            [Message(from_user=self.user2, to_user=self.user1, timestamp=5, text='"quoted"\nnew line, юникод'),
+             Message(from_user=self.user2, to_user=self.user3, timestamp=6, text='not mine')])
+    
+    def _expected(self, queryset) -> list:
+        return serialize_message_rows(queryset.order_by('id').values_list(*MESSAGE_ROW_FIELDS))
+    
+    def _parse(self, content: bytes) -> list:
+        return [json.loads(line) for line in content.decode('utf-8').splitlines()]
+    
+    def test_reads_messages_in_batches(self):
+        # 7 messages in batches of 3, the last batch is short
+        with self.assertNumQueries(3):
+            rows = list(iter_message_rows(Message.objects.all(), batch_size=3))
+        self.assertEqual(serialize_message_rows(rows), self._expected(Message.objects.all()))
+    
+    def test_lines_are_serialized_messages(self):
+        content = b''.join(iter_ndjson(iter_message_rows(Message.objects.all()), chunk_size=100))
+        self.assertEqual(self._parse(content), self._expected(Message.objects.all()))
+    
+    def test_streams_public_history(self):
+        response = self.auth_client.get(reverse('export'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(self._parse(b''.join(response.streaming_content)), self._expected(Message.objects.public()))
+    
+    def test_streams_private_conversation_gzipped(self):
+        response = self.auth_client.get(reverse('export'), data={'history_with': 'asdf2'},
+                                        HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        messages = self._parse(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual([message['text'] for message in messages], ['"quoted"\nnew line, юникод'])
+    
+    def test_unknown_user_is_rejected(self):
+        response = self.auth_client.get(reverse('export'), data={'history_with': 'nobody'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_command_writes_gzipped_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'messages.ndjson.gz')
+            call_command('export_messages', '--between', 'asdf2', 'asdf3', '--gzip', '--output', path)
+            with gzip.open(path) as output:
+                self.assertEqual(self._parse(output.read()),
+                                 self._expected(Message.objects.private_between(self.user2.id, self.user3.id)))
+    
+    def test_command_rejects_unknown_user(self):
+        with self.assertRaises(CommandError):
+            call_command('export_messages', '--between', 'asdf2', 'nobody', '--output', os.devnull)
+
+
+@skipUnless(os.path.exists('/proc/self/statm'), 'RSS is read from /proc.')
+class TestExportMemory(TestCase):
+    ROWS = 1000000
+    RSS_BUDGET = 20 * 1024 * 1024
+    
+    def setUp(self):
+        user = User.objects.create_user('asdf1', password='password')
+        self.auth_client = AuthenticatedClientFactory().client('asdf1')
+        
+        # one statement, into the archive: the hot table would update its search index for every row
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s) '
+                'INSERT INTO {table} (id, from_user_id, to_user_id, conversation, text, timestamp) '
+                "SELECT n, %s, NULL, NULL, 'message number ' || n, n FROM seq".format(
+                    table=ArchivedMessage._meta.db_table),
+                [self.ROWS, user.id])
+    
+    def test_memory_does_not_grow_with_rows(self):
+        baseline = peak = get_rss()
+        response = self.auth_client.get(reverse('export'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response.streaming)
+        
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        lines = 0
+        for chunk in response.streaming_content:
+            lines += decompressor.decompress(chunk).count(b'\n')
+            peak = max(peak, get_rss())
+        
+        # the whole export is about 100MB uncompressed, reading all rows at once would take a few hundred MB
+        self.assertEqual(lines, self.ROWS)
+        self.assertLess(peak - baseline, self.RSS_BUDGET)
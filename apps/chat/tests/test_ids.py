@@ -0,0 +1,46 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.chat.ids import MAX_SEQUENCE, MAX_WORKER_ID, SEQUENCE_BITS, SnowflakeGenerator, get_id_floor, get_id_timestamp
+
+
+NOW = 1500000000.123
+
+
+class TestSnowflakeGenerator(SimpleTestCase):
+    def test_ids_of_one_millisecond_increase(self):
+        generator = SnowflakeGenerator(worker_id=5)
+        with mock.patch('time.time', return_value=NOW):
+            ids = generator.allocate(3)
+        
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual([get_id_timestamp(pk) for pk in ids], [1500000000123] * 3)
+        self.assertEqual({(pk >> SEQUENCE_BITS) & MAX_WORKER_ID for pk in ids}, {5})
+    
+    def test_ids_increase_when_clock_goes_back(self):
+        generator = SnowflakeGenerator(worker_id=5)
+        with mock.patch('time.time', return_value=NOW):
+            first = generator.next()
+        with mock.patch('time.time', return_value=NOW - 1):
+            self.assertGreater(generator.next(), first)
+    
+    def test_sequence_overflow_moves_to_next_millisecond(self):
+        generator = SnowflakeGenerator(worker_id=5)
+        with mock.patch('time.time', return_value=NOW):
+            ids = generator.allocate(MAX_SEQUENCE + 2)
+        
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(get_id_timestamp(ids[-1]), 1500000000124)
+        self.assertGreaterEqual(ids[0], get_id_floor(1500000000123))
+    
+    @override_settings(CHAT_WORKER_ID=7)
+    def test_worker_id_from_settings(self):
+        self.assertEqual(SnowflakeGenerator().worker_id, 7)
+    
+    def test_forked_process_gets_its_own_worker_id(self):
+        generator = SnowflakeGenerator()
+        with mock.patch('os.getpid', return_value=1025):
+            self.assertEqual(generator.worker_id, 1)
+        with mock.patch('os.getpid', return_value=1026):
+            self.assertEqual(generator.worker_id, 2)
@@ -0,0 +1,74 @@
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from apps.chat.metrics import Histogram, MetricsRegistry, registry, render_prometheus
+from apps.chat.tests.base import AuthenticatedClientFactory
+
+
+class TestHistogram(SimpleTestCase):
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram((1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+        
+        self.assertEqual(histogram.cumulative_counts(), [('1', 2), ('10', 3), ('+Inf', 4)])
+        self.assertEqual(histogram.sum, 56.5)
+        self.assertEqual(histogram.quantile(0.5), 1)
+        self.assertEqual(histogram.quantile(0.95), float('inf'))
+    
+    def test_renders_prometheus_text(self):
+        metrics = MetricsRegistry()
+        metrics.record('public-chat', 200, 0.02, 3, 0.001, 512)
+        
+        text = render_prometheus(metrics.snapshot())
+        
+        self.assertIn('chat_requests_total{endpoint="public-chat",status="2xx"} 1\n', text)
+        self.assertIn('chat_request_duration_seconds_bucket{endpoint="public-chat",le="0.025"} 1\n', text)
+        self.assertIn('chat_request_queries_bucket{endpoint="public-chat",le="2"} 0\n', text)
+        self.assertIn('chat_request_queries_sum{endpoint="public-chat"} 3.0\n', text)
+        self.assertIn('chat_response_size_bytes_count{endpoint="public-chat"} 1\n', text)
+
+
+class TestMetricsMiddleware(TestCase):
+    def setUp(self):
+        registry.clear()
+        User.objects.create_user('asdf', password='password')
+        self.auth_client = AuthenticatedClientFactory().client('asdf')
+    
+    def test_records_requests_per_url_name(self):
+        self.auth_client.get(reverse('public-chat'))
+        self.auth_client.get(reverse('public-chat'))
+        response = self.auth_client.get(reverse('public-chat'))
+        self.client.get('/no-such-page/')
+        
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['public-chat'].latency.count, 3)
+        self.assertEqual(snapshot['public-chat'].statuses, {'2xx': 3})
+        self.assertEqual(snapshot['public-chat'].response_size.sum, 3 * len(response.content))
+        self.assertEqual(snapshot['<unresolved>'].statuses, {'4xx': 1})
+    
+    def test_counts_queries(self):
+        self.auth_client.get(reverse('public-chat'))
+        registry.clear()
+        
+        with self.assertNumQueries(2):
+            self.auth_client.get(reverse('public-chat'))
+        
+        queries = registry.snapshot()['public-chat'].queries
+        self.assertEqual((queries.count, queries.sum), (1, 2))
+    
+    def test_metrics_endpoint(self):
+        self.auth_client.get(reverse('public-chat'))
+        
+        response = self.client.get(reverse('metrics'))
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4')
+        self.assertIn(b'chat_requests_total{endpoint="public-chat",status="2xx"} 1', response.content)
+    
+    @override_settings(CHAT_METRICS_ALLOWED_IPS=['10.0.0.1'])
+    def test_metrics_endpoint_is_restricted(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
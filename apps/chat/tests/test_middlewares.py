@@ -0,0 +1,69 @@
+import logging
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from apps.chat.middlewares import MAX_BODY_LENGTH, BackgroundLogWriter, ResponseLoggingMiddleware, log_writer
+
+
+def rendered_response(status_code: int, data) -> Response:
+    response = Response(status=status_code, data=data)
+    response.accepted_renderer = JSONRenderer()
+    response.accepted_media_type = 'application/json'
+    response.renderer_context = {}
+    return response.render()
+
+
+class TestResponseLoggingMiddleware(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+    
+    def handle(self, middleware: ResponseLoggingMiddleware, request, response: Response) -> None:
+        middleware.process_request(request)
+        middleware.process_response(request, response)
+        log_writer.flush()
+    
+    def test_logs_request_and_truncated_response(self):
+        middleware = ResponseLoggingMiddleware()
+        request = self.factory.post('/public-chat/', data='{"text": "hello"}', content_type='application/json')
+        response = rendered_response(201, {'text': 'x' * 2 * MAX_BODY_LENGTH})
+        
+        with self.assertLogs('middlewares', logging.INFO) as logs:
+            self.handle(middleware, request, response)
+        
+        request_msg, response_msg = [record.getMessage() for record in logs.records]
+        self.assertEqual(request_msg, 'Request: POST /public-chat/ ' + str(b'{"text": "hello"}'))
+        self.assertEqual(response_msg, 'Response: 201 ' + response.content[:MAX_BODY_LENGTH].decode())
+    
+    @override_settings(CHAT_LOG_SAMPLE_RATES={'/': 1.0, '/public-chat/': 0.0})
+    def test_successful_responses_are_sampled_by_path_prefix(self):
+        middleware = ResponseLoggingMiddleware()
+        
+        with self.assertLogs('middlewares', logging.INFO) as logs:
+            self.handle(middleware, self.factory.get('/public-chat/'), rendered_response(200, {'results': []}))
+            self.handle(middleware, self.factory.get('/users/'), rendered_response(200, {'results': []}))
+        
+        self.assertEqual([record.getMessage() for record in logs.records],
+                         ['Request: GET /users/', 'Response: 200 {"results":[]}'])
+    
+    @override_settings(CHAT_LOG_SAMPLE_RATES={'/': 0.0})
+    def test_errors_are_always_logged(self):
+        middleware = ResponseLoggingMiddleware()
+        
+        with self.assertLogs('middlewares', logging.INFO) as logs:
+            self.handle(middleware, self.factory.get('/private/'), rendered_response(400, {'with': ['required']}))
+        
+        self.assertEqual([record.levelno for record in logs.records], [logging.WARN, logging.WARN])
+
+
+class TestBackgroundLogWriter(SimpleTestCase):
+    def test_drops_records_when_queue_is_full(self):
+        writer = BackgroundLogWriter(max_size=1)
+        logger = logging.getLogger('middlewares.request')
+        writer._thread = object()  # nothing consumes the queue
+        
+        writer.submit(lambda: ((logger, logging.INFO, 'first'),))
+        writer.submit(lambda: ((logger, logging.INFO, 'second'),))
+        
+        self.assertEqual(writer.dropped, 1)
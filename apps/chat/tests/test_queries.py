@@ -0,0 +1,141 @@
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from apps.chat.models import Conversation, Message
+from apps.chat.search import fts5_available
+from apps.chat.tests.base import AuthenticatedClientFactory
+from apps.chat.views import MAX_CHARACTER
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked against SQLite only.')
+class TestHistoryQueryPlans(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user('asdf1', password='password')
+        self.user2 = User.objects.create_user('asdf2', password='password')
+        self.user3 = User.objects.create_user('asdf3', password='password')
+        
+        for timestamp in range(20):
+            Message.objects.create(from_user=self.user1, to_user=None, timestamp=timestamp, text='public')
+            Message.objects.create(from_user=self.user1, to_user=self.user2, timestamp=timestamp, text='private')
+            Message.objects.create(from_user=self.user3, to_user=self.user1, timestamp=timestamp, text='private')
+        self.middle_id = Message.objects.order_by('id')[30].id
+    
+    def _query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+    
+    def assertUsesIndexWithoutSort(self, queryset):
+        plan = self._query_plan(queryset)
+        self.assertTrue(any('USING INDEX' in step or 'USING COVERING INDEX' in step for step in plan), plan)
+        self.assertFalse(any('TEMP B-TREE' in step for step in plan), plan)
+    
+    def test_public_history_uses_index(self):
+        queryset = Message.objects.public().order_by('-id')[:51]
+        self.assertUsesIndexWithoutSort(queryset)
+    
+    def test_public_history_page_before_cursor_uses_index(self):
+        queryset = (Message.objects.public().filter(id__lt=self.middle_id)
+                    .order_by('-id')[:51])
+        self.assertUsesIndexWithoutSort(queryset)
+    
+    def test_private_history_uses_index(self):
+        queryset = Message.objects.private_between(self.user2.id, self.user1.id).order_by('-id')[:51]
+        self.assertUsesIndexWithoutSort(queryset)
+    
+    def test_history_version_uses_index(self):
+        for queryset in (Message.objects.public(), Message.objects.private_between(self.user1.id, self.user2.id)):
+            self.assertUsesIndexWithoutSort(queryset.order_by('-id').values_list('timestamp', 'id')[:1])
+    
+    def test_sync_does_not_scan_history(self):
+        queryset = Message.objects.visible_to(self.user2.id).filter(id__gt=10).order_by('id')[:1001]
+        plan = self._query_plan(queryset)
+        self.assertFalse(any(step.startswith('SCAN') and 'chat_message' in step for step in plan), plan)
+    
+    def test_search_does_not_scan_history(self):
+        backends = ['fts5', 'terms'] if fts5_available() else ['terms']
+        for backend in backends:
+            with self.subTest(backend=backend), override_settings(CHAT_SEARCH_BACKEND=backend):
+                queryset = Message.objects.visible_to(self.user2.id).matching(['private']).order_by('-id')[:51]
+                plan = self._query_plan(queryset)
+                # messages are looked up by the ids found in the index
+                self.assertNotIn('SCAN chat_message', [step.split(' USING ')[0] for step in plan], plan)
+    
+    def test_conversation_list_uses_index(self):
+        queryset = (Conversation.objects.filter(owner=self.user1)
+                    .order_by('-last_message_id')[:51])
+        self.assertUsesIndexWithoutSort(queryset)
+    
+    def test_user_directory_prefix_search_uses_index(self):
+        queryset = (User.objects.filter(username__gte='asd', username__lt='asd' + MAX_CHARACTER)
+                    .order_by('username').values_list('username', flat=True)[:51])
+        self.assertUsesIndexWithoutSort(queryset)
+    
+    def test_conversation_key_is_symmetric(self):
+        self.assertEqual(Message.objects.private_between(self.user1.id, self.user2.id).count(), 20)
+        self.assertEqual(Message.objects.private_between(self.user2.id, self.user1.id).count(), 20)
+
+
+@override_settings(CHAT_HISTORY_MAX_PAGE_SIZE=1000)
+class TestHistoryQueryCounts(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user('asdf1', password='password')
+        self.user2 = User.objects.create_user('asdf2', password='password')
+        
+        self.auth_client = AuthenticatedClientFactory().client(self.user1.username)
+    
+    def _create_messages(self, count: int, to_user=None):
+        conversation = None
+        if to_user is not None:
+            conversation = Message.get_conversation_key(self.user1.id, to_user.id)
+        Message.objects.bulk_create([
+            Message(from_user=self.user1, to_user=to_user, conversation=conversation, timestamp=timestamp, text='text')
+            for timestamp in range(count)
+        ])
+    
+    def test_public_history_query_count_is_constant(self):
+        self._create_messages(1000)
+        
+        # token authentication + history version + history page
+        with self.assertNumQueries(3):
+            response = self.auth_client.get(reverse('public-chat'), data={'limit': 1000})
+        self.assertEqual(len(response.data['results']), 1000)
+        self.assertEqual(response.data['results'][0]['from_user'], self.user1.username)
+        self.assertIsNone(response.data['results'][0]['to_user'])
+    
+    def test_private_history_query_count_is_constant(self):
+        self._create_messages(1000, to_user=self.user2)
+        
+        # token authentication + second user + history version + history page
+        with self.assertNumQueries(4):
+            response = self.auth_client.get(reverse('private-chat'), data={
+                'history_with': self.user2.username,
+                'limit': 1000
+            })
+        self.assertEqual(len(response.data['results']), 1000)
+        self.assertEqual(response.data['results'][0]['to_user'], self.user2.username)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Pragmas are SQLite only.')
+class TestSqlitePragmas(SimpleTestCase):
+    def _new_connection(self):
+        settings_dict = dict(connections['default'].settings_dict, NAME=':memory:')
+        return connections['default'].__class__(settings_dict, alias='pragmas')
+    
+    @override_settings(CHAT_SQLITE_PRAGMAS={'busy_timeout': 1234, 'synchronous': 'NORMAL'})
+    def test_pragmas_are_applied_to_new_connections(self):
+        new_connection = self._new_connection()
+        try:
+            with new_connection.cursor() as cursor:
+                cursor.execute('PRAGMA busy_timeout')
+                self.assertEqual(cursor.fetchone()[0], 1234)
+                cursor.execute('PRAGMA synchronous')
+                # NORMAL
+                self.assertEqual(cursor.fetchone()[0], 1)
+        finally:
+            new_connection.close()
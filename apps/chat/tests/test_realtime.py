@@ -0,0 +1,175 @@
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from apps.chat.broker.memory import InMemoryBroker
+from apps.chat.broker.unix import UnixSocketBroker
+from apps.chat.ids import get_id_floor, get_id_timestamp, message_ids
+from apps.chat.models import Message
+from apps.chat.realtime import PUBLIC_TOPIC, MessageHub
+from apps.chat.tests.base import AuthenticatedClientFactory
+from apps.chat.views import get_current_timestamp
+
+
+def make_message(message_id: int, from_user: str = 'asdf1', to_user: str = None) -> dict:
+    return {'id': message_id, 'from_user': from_user, 'to_user': to_user, 'timestamp': get_current_timestamp(),
+            'text': 'text'}
+
+
+class TestMessageHub(SimpleTestCase):
+    def setUp(self):
+        self.broker = InMemoryBroker()
+        self.hub = MessageHub(buffer_size=3, broker=self.broker)
+        self.hub.connect()
+        self.since = message_ids.next()
+    
+    def test_returns_visible_messages_only(self):
+        self.broker.publish_many([
+            (PUBLIC_TOPIC, make_message(self.since + 1)),
+            ('conversation:1:2', make_message(self.since + 2, to_user='asdf2')),
+            ('conversation:1:3', make_message(self.since + 3, to_user='asdf3'))
+        ])
+        
+        messages = self.hub.wait('asdf2', self.since, timeout=0)
+        self.assertEqual([m['id'] for m in messages], [self.since + 1, self.since + 2])
+    
+    def test_times_out_without_messages(self):
+        self.assertEqual(self.hub.wait('asdf2', self.since, timeout=0), [])
+    
+    def test_wakes_up_waiting_subscriber(self):
+        publisher = threading.Timer(0.05, self.broker.publish, args=(PUBLIC_TOPIC, make_message(self.since + 1)))
+        publisher.start()
+        messages = self.hub.wait('asdf2', self.since, timeout=5)
+        publisher.join()
+        
+        self.assertEqual(len(messages), 1)
+    
+    def test_does_not_cover_evicted_messages(self):
+        self.broker.publish_many([(PUBLIC_TOPIC, make_message(self.since + offset)) for offset in range(1, 5)])
+        
+        self.assertFalse(self.hub.covers(self.since))
+        self.assertIsNone(self.hub.wait('asdf2', self.since, timeout=0))
+        self.assertTrue(self.hub.covers(self.since + 1))
+
+    
+    @override_settings(CHAT_ID_SETTLE_TIME=60)
+    def test_returns_settled_messages_in_id_order(self):
+        start = get_id_timestamp(self.since)
+        # published after the later message but with a smaller id, and a message too young to hand out
+        self.broker.publish_many([(PUBLIC_TOPIC, make_message(get_id_floor(start + offset)))
+                                  for offset in (20000, 10000, 270000)])
+        
+        with mock.patch('apps.chat.ids.time.time', return_value=start / 1000 + 300):
+            messages = self.hub.wait('asdf2', self.since, timeout=0)
+        self.assertEqual([m['id'] for m in messages], [get_id_floor(start + 10000), get_id_floor(start + 20000)])
+
+
+class TestBrokers(SimpleTestCase):
+    def _collect(self, broker, patterns):
+        received = []
+        broker.subscribe(patterns, lambda topic, messages: received.extend((topic, m['id']) for m in messages))
+        return received
+    
+    def test_memory_broker_routes_by_topic(self):
+        broker = InMemoryBroker()
+        public = self._collect(broker, [PUBLIC_TOPIC])
+        conversations = self._collect(broker, ['conversation:*'])
+        
+        broker.publish_many([(PUBLIC_TOPIC, make_message(1)), ('conversation:1:2', make_message(2))])
+        
+        self.assertEqual(public, [(PUBLIC_TOPIC, 1)])
+        self.assertEqual(conversations, [('conversation:1:2', 2)])
+    
+    def test_unsubscribe(self):
+        broker = InMemoryBroker()
+        received = []
+        subscription = broker.subscribe([PUBLIC_TOPIC], lambda topic, messages: received.extend(messages))
+        subscription.close()
+        
+        broker.publish(PUBLIC_TOPIC, make_message(1))
+        self.assertEqual(received, [])
+    
+    def test_unix_socket_broker_delivers_between_instances(self):
+        with tempfile.TemporaryDirectory() as path:
+            publisher = UnixSocketBroker(path, max_datagram_size=256)
+            subscriber = UnixSocketBroker(path)
+            try:
+                received = self._collect(subscriber, [PUBLIC_TOPIC])
+                local = self._collect(publisher, [PUBLIC_TOPIC])
+                
+                publisher.publish_many([(PUBLIC_TOPIC, make_message(i)) for i in range(10)])
+                
+                deadline = time.monotonic() + 5
+                while len(received) < 10 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.assertEqual([pk for topic, pk in received], list(range(10)))
+                self.assertEqual([pk for topic, pk in local], list(range(10)))
+            finally:
+                publisher.close()
+                subscriber.close()
+
+
+class TestPoll(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user('asdf1', password='password')
+        self.user2 = User.objects.create_user('asdf2', password='password')
+        
+        self.auth_client1 = AuthenticatedClientFactory().client('asdf1')
+        self.auth_client2 = AuthenticatedClientFactory().client('asdf2')
+    
+    def test_cannot_poll_without_token(self):
+        response = self.client.get(reverse('poll'), data={'since_id': 0})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_receives_posted_messages(self):
+        since_id = message_ids.next()
+        self.auth_client1.post(reverse('private-chat'), {'to_user': 'asdf2', 'text': 'private'})
+        self.auth_client1.post(reverse('public-chat'), {'text': 'public'})
+        
+        response = self.auth_client2.get(reverse('poll'), data={'since_id': since_id, 'timeout': 0})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['text'] for m in response.data['results']], ['private', 'public'])
+        self.assertEqual(response.data['since_id'], response.data['results'][-1]['id'])
+    
+    def test_catches_up_from_database(self):
+        Message.objects.create(from_user=self.user1, to_user=None, timestamp=11, text='public')
+        Message.objects.create(from_user=self.user1, to_user=self.user2, timestamp=12, text='private')
+        
+        response = self.auth_client2.get(reverse('poll'), data={'since_id': 0, 'timeout': 0})
+        self.assertEqual([m['text'] for m in response.data['results']], ['public', 'private'])
+    
+    def _create_message_before_hub(self) -> Message:
+        # the last message predates the hub, as in a quiet chat or after the worker was restarted
+        return Message.objects.create(id=get_id_floor(get_current_timestamp() - 60000), from_user=self.user1,
+                                      to_user=None, timestamp=11, text='old')
+    
+    def test_waits_when_caught_up_past_buffer(self):
+        old = self._create_message_before_hub()
+        
+        started = time.monotonic()
+        with mock.patch('apps.chat.views.message_hub', MessageHub(broker=InMemoryBroker())):
+            response = self.auth_client2.get(reverse('poll'), data={'since_id': old.id, 'timeout': 1})
+        self.assertGreaterEqual(time.monotonic() - started, 0.9)
+        self.assertEqual(response.data, {'since_id': old.id, 'since_id_str': str(old.id), 'results': []})
+    
+    def test_caught_up_poll_receives_published_messages(self):
+        old = self._create_message_before_hub()
+        broker = InMemoryBroker()
+        new = make_message(message_ids.next())
+        publisher = threading.Timer(0.2, broker.publish, args=(PUBLIC_TOPIC, new))
+        publisher.start()
+        with mock.patch('apps.chat.views.message_hub', MessageHub(broker=broker)):
+            response = self.auth_client2.get(reverse('poll'), data={'since_id': old.id, 'timeout': 5})
+        publisher.join()
+        
+        self.assertEqual(response.data, {'since_id': new['id'], 'since_id_str': str(new['id']), 'results': [new]})
+    
+    def test_invalid_since(self):
+        response = self.auth_client2.get(reverse('poll'), data={'since_id': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,27 @@
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.utils.translation import ugettext_lazy as _
+
+from apps.chat import renderers
+from apps.chat.renderers import FastJSONRenderer
+
+
+class TestFastJSONRenderer(SimpleTestCase):
+    def test_renders_compact_utf8(self):
+        data = {'results': [{'id': 1, 'from_user': 'asdf', 'to_user': None, 'timestamp': 10, 'text': 'привет'}]}
+        
+        with mock.patch.object(renderers, 'orjson', None):
+            rendered = FastJSONRenderer().render(data)
+        
+        self.assertEqual(rendered, json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+    
+    def test_renders_lazy_strings(self):
+        with mock.patch.object(renderers, 'orjson', None):
+            rendered = FastJSONRenderer().render({'detail': _('Not found.')})
+        
+        self.assertEqual(json.loads(rendered.decode('utf-8')), {'detail': 'Not found.'})
+    
+    def test_renders_nothing_for_no_data(self):
+        self.assertEqual(FastJSONRenderer().render(None), b'')
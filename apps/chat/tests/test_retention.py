@@ -0,0 +1,95 @@
+import io
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from apps.chat.export import iter_history_rows
+from apps.chat.ids import get_id_floor
+from apps.chat.models import ArchivedMessage, Message, MessageTerm
+from apps.chat.retention import SCOPE_PRIVATE, SCOPE_PUBLIC, archive_messages
+from apps.chat.tests.base import AuthenticatedClientFactory
+
+
+DAY = 24 * 60 * 60 * 1000
+
+
+@override_settings(CHAT_RETENTION_PUBLIC_DAYS=30, CHAT_RETENTION_PRIVATE_DAYS=30, CHAT_SEARCH_BACKEND='terms')
+class TestRetention(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user('asdf1', password='password')
+        self.user2 = User.objects.create_user('asdf2', password='password')
+        self.auth_client = AuthenticatedClientFactory().client('asdf1')
+        
+        now = int(time.time() * 1000)
+        messages = []
+        for n, age in enumerate((60, 50, 40, 20, 10)):
+            timestamp = now - age * DAY
+            messages.append(Message(id=get_id_floor(timestamp) + n, from_user=self.user1, timestamp=timestamp,
+                                    text='public {age}'.format(age=age)))
+            messages.append(Message(id=get_id_floor(timestamp) + n + 100, from_user=self.user1, to_user=self.user2,
+                                    timestamp=timestamp, text='private {age}'.format(age=age)))
+        Message.objects.create_messages(messages)
+    
+    def _texts(self, response) -> list:
+        return [message['text'] for message in response.data['results']]
+    
+    def test_moves_expired_messages_in_batches(self):
+        self.assertEqual(archive_messages(SCOPE_PUBLIC, batch_size=2), 3)
+        
+        self.assertEqual(sorted(ArchivedMessage.objects.values_list('text', flat=True)),
+                         ['public 40', 'public 50', 'public 60'])
+        self.assertEqual(Message.objects.public().count(), 2)
+        self.assertEqual(Message.objects.private().count(), 5)
+        self.assertFalse(MessageTerm.objects.filter(message_id__in=ArchivedMessage.objects.values('id')).exists())
+    
+    @override_settings(CHAT_RETENTION_PRIVATE_DAYS=None)
+    def test_scope_without_retention_is_kept(self):
+        out = io.StringIO()
+        call_command('archive_messages', stdout=out)
+        
+        self.assertEqual(out.getvalue().splitlines(), ['public: 3 messages archived',
+                                                       'private: no retention configured, skipped'])
+        self.assertEqual(Message.objects.private().count(), 5)
+    
+    def test_history_pages_continue_into_archive(self):
+        archive_messages(SCOPE_PUBLIC)
+        archive_messages(SCOPE_PRIVATE)
+        
+        response = self.auth_client.get(reverse('public-chat'), data={'limit': 2})
+        self.assertEqual(self._texts(response), ['public 20', 'public 10'])
+        
+        response = self.auth_client.get(reverse('public-chat'), data={'limit': 2, 'before': response.data['previous']})
+        self.assertEqual(self._texts(response), ['public 50', 'public 40'])
+        
+        response = self.auth_client.get(reverse('public-chat'), data={'limit': 2, 'before': response.data['previous']})
+        self.assertEqual(self._texts(response), ['public 60'])
+        self.assertIsNone(response.data['previous'])
+        
+        response = self.auth_client.get(reverse('public-chat'), data={'limit': 2, 'after': response.data['next']})
+        self.assertEqual(self._texts(response), ['public 50', 'public 40'])
+        
+        response = self.auth_client.get(reverse('public-chat'), data={'limit': 2, 'after': response.data['next']})
+        self.assertEqual(self._texts(response), ['public 20', 'public 10'])
+        self.assertIsNone(response.data['next'])
+    
+    def test_private_history_reads_archive_of_its_conversation(self):
+        archive_messages(SCOPE_PRIVATE)
+        
+        response = self.auth_client.get(reverse('private-chat'), data={'history_with': 'asdf2'})
+        self.assertEqual(self._texts(response), ['private 60', 'private 50', 'private 40', 'private 20', 'private 10'])
+    
+    def test_hot_pages_do_not_read_archive(self):
+        archive_messages(SCOPE_PUBLIC)
+        
+        # token authentication + history version + history page
+        with self.assertNumQueries(3):
+            self.auth_client.get(reverse('public-chat'), data={'limit': 1})
+    
+    def test_export_includes_archived_messages(self):
+        archive_messages(SCOPE_PUBLIC)
+        
+        rows = list(iter_history_rows({'to_user__isnull': True}))
+        self.assertEqual([row[-1] for row in rows], ['public 60', 'public 50', 'public 40', 'public 20', 'public 10'])
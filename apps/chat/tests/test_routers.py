@@ -0,0 +1,96 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from apps.chat.models import Message
+from apps.chat.routers import ReplicaRouter, replica_reads
+from apps.chat.tests.base import AuthenticatedClientFactory
+
+
+def sync_replica() -> None:
+    """ Stands in for replication: copies the tables of all models from the default database into the replica.
+    The search index of the replica is kept up by its own triggers."""
+    connection = connections['default']
+    with connection.cursor() as cursor:
+        cursor.execute('ATTACH DATABASE %s AS replica', [connections['replica'].settings_dict['NAME']])
+        try:
+            for table in connection.introspection.django_table_names(only_existing=True, include_views=False):
+                table = connection.ops.quote_name(table)
+                cursor.execute('DELETE FROM replica.{table}'.format(table=table))
+                cursor.execute('INSERT INTO replica.{table} SELECT * FROM main.{table}'.format(table=table))
+        finally:
+            cursor.execute('DETACH DATABASE replica')
+
+
+@override_settings(CHAT_REPLICA_ALIAS='replica')
+class TestReplicaReads(TransactionTestCase):
+    multi_db = True
+    
+    def setUp(self):
+        cache.clear()
+        self.user1 = User.objects.create_user('asdf1', password='password')
+        self.user2 = User.objects.create_user('asdf2', password='password')
+        sync_replica()
+        
+        self.auth_client1 = AuthenticatedClientFactory().client('asdf1')
+        self.auth_client2 = AuthenticatedClientFactory().client('asdf2')
+    
+    def _public_texts(self, client) -> list:
+        response = client.get(reverse('public-chat'))
+        return [message['text'] for message in response.data['results']]
+    
+    def test_history_is_read_from_replica(self):
+        Message.objects.create_messages([Message(from_user=self.user2, timestamp=1, text='hello')])
+        self.assertEqual(self._public_texts(self.auth_client1), [])
+        
+        sync_replica()
+        self.assertEqual(self._public_texts(self.auth_client1), ['hello'])
+    
+    def test_private_history_is_read_from_replica(self):
+        Message.objects.create_messages([Message(from_user=self.user2, to_user=self.user1, timestamp=1, text='hi')])
+        response = self.auth_client1.get(reverse('private-chat'), data={'history_with': 'asdf2'})
+        self.assertEqual(response.data['results'], [])
+        
+        sync_replica()
+        response = self.auth_client1.get(reverse('private-chat'), data={'history_with': 'asdf2'})
+        self.assertEqual([message['text'] for message in response.data['results']], ['hi'])
+    
+    def test_sender_reads_own_messages_from_primary(self):
+        self.auth_client1.post(reverse('public-chat'), data={'text': 'mine'})
+        
+        self.assertEqual(self._public_texts(self.auth_client1), ['mine'])
+        self.assertEqual(self._public_texts(self.auth_client2), [])
+    
+    @override_settings(CHAT_REPLICA_PIN_SECONDS=0)
+    def test_senders_are_not_pinned_without_pin_seconds(self):
+        self.auth_client1.post(reverse('public-chat'), data={'text': 'mine'})
+        self.assertEqual(self._public_texts(self.auth_client1), [])
+    
+    def test_new_user_is_resolved_on_primary(self):
+        User.objects.create_user('asdf3', password='password')
+        response = self.auth_client1.get(reverse('private-chat'), data={'history_with': 'asdf3'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        response = self.auth_client1.post(reverse('private-chat'), data={'to_user': 'asdf3', 'text': 'welcome'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_user_directory_is_read_from_primary(self):
+        etag = self.auth_client1.get(reverse('user-list'))['ETag']
+        User.objects.create_user('asdf3', password='password')
+        
+        response = self.auth_client1.get(reverse('user-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.data['results'], ['asdf1', 'asdf2', 'asdf3'])
+        
+        sync_replica()
+        response = self.auth_client1.get(reverse('user-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_writes_go_to_primary_inside_replica_reads(self):
+        router = ReplicaRouter()
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Message), 'replica')
+            self.assertIsNone(router.db_for_write(Message))
+        self.assertIsNone(router.db_for_read(Message))
@@ -1,10 +1,20 @@
+import base64
+from unittest import mock, skipUnless
+
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.db import connection
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 
-from apps.chat.models import Message
+from apps.chat.ids import get_id_floor
+from apps.chat.models import Message, MessageTerm
+from apps.chat.search import fts5_available
 from apps.chat.tests.base import AuthenticatedClientFactory
+from apps.chat.users import DirectoryVersion
+from apps.chat.views import get_current_timestamp
 
 
 class TestRegistration(TestCase):
@@ -37,6 +47,8 @@ class TestRegistration(TestCase):
 
 class TestLogin(TestCase):
     def setUp(self):
+        # login attempts are counted in the cache
+        cache.clear()
         self.username = 'asdf'
         self.password = 'password'
         User.objects.create_user(self.username, password=self.password)
@@ -64,6 +76,51 @@ class TestLogin(TestCase):
             'password': '123'
         })
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_fetches_token_with_user(self):
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('login'), data={
+                'username': self.username,
+                'password': self.password
+            })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_rehashes_password_with_configured_iterations(self):
+        with override_settings(CHAT_PASSWORD_ITERATIONS=1500):
+            response = self.client.post(reverse('login'), data={
+                'username': self.username,
+                'password': self.password
+            })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        user = User.objects.get_by_natural_key(self.username)  # type: User
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1500$'))
+        self.assertTrue(user.check_password(self.password))
+    
+    @override_settings(CHAT_LOGIN_RATE='2/min')
+    def test_throttles_attempts_per_username(self):
+        statuses = [self.client.post(reverse('login'), data={'username': self.username, 'password': '123'})
+                    .status_code for _ in range(3)]
+        self.assertEqual(statuses, [status.HTTP_401_UNAUTHORIZED, status.HTTP_401_UNAUTHORIZED,
+                                    status.HTTP_429_TOO_MANY_REQUESTS])
+        
+        response = self.client.post(reverse('login'), data={'username': 'other', 'password': '123'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    @override_settings(CHAT_LOGIN_RATE='2/min')
+    def test_does_not_throttle_successful_logins(self):
+        data = {'username': self.username, 'password': self.password}
+        statuses = [self.client.post(reverse('login'), data=data).status_code for _ in range(4)]
+        self.assertEqual(statuses, [status.HTTP_200_OK] * 4)
+    
+    @override_settings(CHAT_LOGIN_RATE='2/min')
+    def test_successful_login_resets_failed_attempts(self):
+        for password in ('123', self.password, '123', '123'):
+            response = self.client.post(reverse('login'), data={'username': self.username, 'password': password})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        
+        response = self.client.post(reverse('login'), data={'username': self.username, 'password': self.password})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
 
 
 class TestPublicChat(TestCase):
@@ -89,18 +146,288 @@ class TestPublicChat(TestCase):
         self.assertEqual(message.text, 'anytext')
     
     def test_get_all_public_messages_ordered(self):
+        # ids are the ordering key, timestamps of the clients do not matter
         Message.objects.create(from_user=self.user, to_user=None, timestamp=13, text='anytext1')
         Message.objects.create(from_user=self.user, to_user=None, timestamp=11, text='anytext2')
         
         response = self.auth_client.get(reverse('public-chat'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
-        message_json1 = response.data[0]
+        message_json1 = response.data['results'][0]
         self.assertEqual(message_json1['from_user'], self.user.username)
-        self.assertEqual(message_json1['timestamp'], 11)
+        self.assertEqual(message_json1['text'], 'anytext1')
+        
+        message_json2 = response.data['results'][1]
+        self.assertEqual(message_json2['text'], 'anytext2')
+    
+    def test_messages_of_one_millisecond_keep_their_order(self):
+        with mock.patch('apps.chat.views.get_current_timestamp', return_value=1500000000000):
+            for text in ('first', 'second', 'third'):
+                self.auth_client.post(reverse('public-chat'), data={'text': text})
+        
+        response = self.auth_client.get(reverse('public-chat'), data={'limit': 2})
+        self.assertEqual([m['text'] for m in response.data['results']], ['second', 'third'])
+        response = self.auth_client.get(reverse('public-chat'), data={'limit': 2,
+                                                                     'before': response.data['previous']})
+        self.assertEqual([m['text'] for m in response.data['results']], ['first'])
+    
+    def test_accepts_timestamp_cursors(self):
+        message = Message.objects.create(from_user=self.user, to_user=None, timestamp=1, text='anytext')
+        Message.objects.create(from_user=self.user, to_user=None, timestamp=2, text='anytext')
+        
+        cursor = base64.urlsafe_b64encode('1:{0}'.format(message.id).encode('ascii')).decode('ascii')
+        response = self.auth_client.get(reverse('public-chat'), data={'after': cursor})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['timestamp'] for m in response.data['results']], [2])
+    
+    def test_get_newest_page_first(self):
+        for timestamp in range(5):
+            Message.objects.create(from_user=self.user, to_user=None, timestamp=timestamp, text='anytext')
+        
+        response = self.auth_client.get(reverse('public-chat'), data={'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['timestamp'] for m in response.data['results']], [3, 4])
+        self.assertIsNone(response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+    
+    def test_page_back_and_forward_with_cursors(self):
+        for timestamp in (1, 2, 2, 2, 3):
+            Message.objects.create(from_user=self.user, to_user=None, timestamp=timestamp, text='anytext')
+        
+        seen_timestamps = []
+        response = self.auth_client.get(reverse('public-chat'), data={'limit': 2})
+        while True:
+            seen_timestamps = [m['timestamp'] for m in response.data['results']] + seen_timestamps
+            if response.data['previous'] is None:
+                break
+            response = self.auth_client.get(reverse('public-chat'), data={
+                'limit': 2,
+                'before': response.data['previous']
+            })
+        self.assertEqual(seen_timestamps, [1, 2, 2, 2, 3])
+        
+        response = self.auth_client.get(reverse('public-chat'), data={
+            'limit': 2,
+            'after': response.data['next']
+        })
+        self.assertEqual([m['timestamp'] for m in response.data['results']], [2, 2])
+    
+    def test_invalid_cursor(self):
+        response = self.auth_client.get(reverse('public-chat'), data={'before': '!!!'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestHistoryConditionalGet(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user('asdf1', password='password')
+        self.user2 = User.objects.create_user('asdf2', password='password')
+        self.auth_client = AuthenticatedClientFactory().client('asdf1')
+        
+        Message.objects.create_messages([Message(from_user=self.user1, timestamp=1500000000000, text='public'),
+                                         Message(from_user=self.user1, to_user=self.user2, timestamp=1500000000001,
+                                                 text='private')])
+    
+    def test_unchanged_public_history_is_not_modified(self):
+        response = self.auth_client.get(reverse('public-chat'))
+        etag = response['ETag']
+        
+        # only the history version is read
+        with self.assertNumQueries(1):
+            response = self.auth_client.get(reverse('public-chat'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_unchanged_private_history_is_not_modified(self):
+        data = {'history_with': 'asdf2'}
+        etag = self.auth_client.get(reverse('private-chat'), data=data)['ETag']
+        
+        with self.assertNumQueries(1):
+            response = self.auth_client.get(reverse('private-chat'), data=data, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        # the other participant sees the same history
+        response = AuthenticatedClientFactory().client('asdf2').get(reverse('private-chat'), data={
+            'history_with': 'asdf1'
+        }, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_new_message_changes_etag(self):
+        etag = self.auth_client.get(reverse('public-chat'))['ETag']
+        self.auth_client.post(reverse('public-chat'), {'text': 'new'})
+        
+        response = self.auth_client.get(reverse('public-chat'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([message['text'] for message in response.data['results']], ['public', 'new'])
+    
+    def test_if_modified_since_does_not_hide_new_messages(self):
+        # a message posted in the same second as the newest one the client has seen
+        response = self.auth_client.get(reverse('public-chat'))
+        self.assertNotIn('Last-Modified', response)
+        Message.objects.create_messages([Message(from_user=self.user1, timestamp=1500000000500, text='same second')])
+        
+        response = self.auth_client.get(reverse('public-chat'), HTTP_IF_MODIFIED_SINCE='Fri, 14 Jul 2017 02:40:00 GMT')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+    
+    def test_pages_have_different_etags(self):
+        first = self.auth_client.get(reverse('public-chat'))
+        second = self.auth_client.get(reverse('public-chat'), data={'limit': 1})
+        self.assertNotEqual(first['ETag'], second['ETag'])
+    
+    def test_private_history_with_unknown_user(self):
+        response = self.auth_client.get(reverse('private-chat'), data={'history_with': 'nobody'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.auth_client.get(reverse('private-chat'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    @override_settings(CHAT_HISTORY_CACHE_ALIAS='default')
+    def test_pages_are_cached_until_new_message(self):
+        cache.clear()
+        self.auth_client.get(reverse('public-chat'))
+        
+        with self.assertNumQueries(1):
+            response = self.auth_client.get(reverse('public-chat'))
+        self.assertEqual([message['text'] for message in response.data['results']], ['public'])
+        
+        self.auth_client.post(reverse('public-chat'), {'text': 'new'})
+        response = self.auth_client.get(reverse('public-chat'))
+        self.assertEqual([message['text'] for message in response.data['results']], ['public', 'new'])
+
+
+class TestSync(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user('asdf1', password='password')
+        self.user2 = User.objects.create_user('asdf2', password='password')
+        self.user3 = User.objects.create_user('asdf3', password='password')
+        self.auth_client = AuthenticatedClientFactory().client('asdf1')
+        
+        Message.objects.create_messages([
+            Message(from_user=self.user2, timestamp=1, text='public'),
+            Message(from_user=self.user2, to_user=self.user1, timestamp=2, text='to me'),
+            Message(from_user=self.user2, to_user=self.user3, timestamp=3, text='not mine'),
+            Message(from_user=self.user1, to_user=self.user3, timestamp=4, text='from me'),
+        ])
+    
+    def test_returns_visible_messages_in_one_query(self):
+        self.auth_client.get(reverse('sync'), data={'since_id': 0})
+        
+        with self.assertNumQueries(1):
+            response = self.auth_client.get(reverse('sync'), data={'since_id': 0})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([message['text'] for message in response.data['results']], ['public', 'to me', 'from me'])
+        self.assertEqual(response.data['since_id'], response.data['results'][-1]['id'])
+        self.assertFalse(response.data['has_more'])
+    
+    def test_continues_from_since_id(self):
+        response = self.auth_client.get(reverse('sync'), data={'since_id': 0, 'limit': 2})
+        self.assertEqual([message['text'] for message in response.data['results']], ['public', 'to me'])
+        self.assertTrue(response.data['has_more'])
+        
+        response = self.auth_client.get(reverse('sync'), data={'since_id': response.data['since_id']})
+        self.assertEqual([message['text'] for message in response.data['results']], ['from me'])
+        self.assertFalse(response.data['has_more'])
+        
+        # JavaScript clients keep the string, the number does not fit into a double
+        since_id = response.data['since_id_str']
+        self.assertEqual(since_id, response.data['results'][-1]['id_str'])
+        response = self.auth_client.get(reverse('sync'), data={'since_id': since_id})
+        self.assertEqual(response.data, {'since_id': int(since_id), 'since_id_str': since_id, 'has_more': False,
+                                         'results': []})
+    
+    @override_settings(CHAT_SYNC_MAX_MESSAGES=1)
+    def test_limit_is_capped(self):
+        response = self.auth_client.get(reverse('sync'), data={'since_id': 0, 'limit': 100})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertTrue(response.data['has_more'])
+    
+    def test_since_id_is_required(self):
+        response = self.auth_client.get(reverse('sync'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    
+    @override_settings(CHAT_ID_SETTLE_TIME=20)
+    def test_leaves_unsettled_messages_for_next_sync(self):
+        now = get_current_timestamp()
+        since_id = get_id_floor(now - 60000)
+        # the second message gets a smaller id than the first, but is committed after it
+        Message.objects.create(id=get_id_floor(now - 10000), from_user=self.user2, timestamp=5, text='first')
+        response = self.auth_client.get(reverse('sync'), data={'since_id': since_id})
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(response.data['since_id'], since_id)
+        
+        Message.objects.create(id=get_id_floor(now - 15000), from_user=self.user2, timestamp=6, text='second')
+        with mock.patch('apps.chat.ids.time.time', return_value=now / 1000 + 15):
+            response = self.auth_client.get(reverse('sync'), data={'since_id': since_id})
+        self.assertEqual([message['text'] for message in response.data['results']], ['second', 'first'])
+
+
+class SearchTestsMixin():
+    def setUp(self):
+        self.user1 = User.objects.create_user('asdf1', password='password')
+        self.user2 = User.objects.create_user('asdf2', password='password')
+        self.user3 = User.objects.create_user('asdf3', password='password')
+        self.auth_client = AuthenticatedClientFactory().client('asdf1')
+        
+        Message.objects.create_messages([
+            Message(from_user=self.user2, timestamp=1, text='Lunch at noon?'),
+            Message(from_user=self.user2, to_user=self.user1, timestamp=2, text='lunch is on me'),
+            Message(from_user=self.user2, to_user=self.user3, timestamp=3, text='secret lunch plans'),
+            Message(from_user=self.user1, to_user=self.user3, timestamp=4, text='LUNCH, then a walk'),
+            Message(from_user=self.user3, timestamp=5, text='lunchtime'),
+        ])
+    
+    def _search(self, **params):
+        response = self.auth_client.get(reverse('search'), data=params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+    
+    def test_finds_visible_messages_newest_first(self):
+        response = self._search(q='lunch')
+        self.assertEqual([message['text'] for message in response.data['results']],
+                         ['LUNCH, then a walk', 'lunch is on me', 'Lunch at noon?'])
+        self.assertIsNone(response.data['next'])
+    
+    def test_matches_all_words(self):
+        response = self._search(q='on LUNCH')
+        self.assertEqual([message['text'] for message in response.data['results']], ['lunch is on me'])
+    
+    def test_operators_are_searched_as_words(self):
+        response = self._search(q='lunch OR "secret" NOT*')
+        self.assertEqual(response.data['results'], [])
+    
+    def test_pages_back_with_cursor(self):
+        response = self._search(q='lunch', limit=2)
+        self.assertEqual(len(response.data['results']), 2)
         
-        message_json2 = response.data[1]
-        self.assertEqual(message_json2['timestamp'], 13)
+        response = self._search(q='lunch', limit=2, before=response.data['next'])
+        self.assertEqual([message['text'] for message in response.data['results']], ['Lunch at noon?'])
+        self.assertIsNone(response.data['next'])
+    
+    def test_finds_messages_saved_one_by_one(self):
+        Message.objects.create(from_user=self.user1, to_user=None, timestamp=6, text='dinner')
+        response = self._search(q='dinner')
+        self.assertEqual([message['text'] for message in response.data['results']], ['dinner'])
+    
+    def test_query_is_required(self):
+        response = self.auth_client.get(reverse('search'), data={'q': ' '})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@skipUnless(connection.vendor == 'sqlite' and fts5_available(), 'FTS5 is SQLite only.')
+@override_settings(CHAT_SEARCH_BACKEND='fts5')
+class TestSearchFts5(SearchTestsMixin, TestCase):
+    def test_deleted_messages_are_not_found(self):
+        Message.objects.filter(text='lunch is on me').delete()
+        response = self._search(q='lunch')
+        self.assertEqual(len(response.data['results']), 2)
+
+
+@override_settings(CHAT_SEARCH_BACKEND='terms')
+class TestSearchTerms(SearchTestsMixin, TestCase):
+    def test_terms_of_messages_are_stored(self):
+        message = Message.objects.get(text='LUNCH, then a walk')
+        self.assertEqual(set(MessageTerm.objects.filter(message=message).values_list('term', flat=True)),
+                         {'lunch', 'then', 'a', 'walk'})
 
 
 class TestPrivateChat(TestCase):
@@ -117,7 +444,7 @@ class TestPrivateChat(TestCase):
         response = self.auth_client1.get(reverse('user-list'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
-        self.assertEqual({self.username1, self.username2}, set(response.data))
+        self.assertEqual({self.username1, self.username2}, set(response.data['results']))
     
     def test_exchange_messages_with_user(self):
         in_message1 = 'Hello, {username}'.format(username=self.username2)
@@ -137,8 +464,199 @@ class TestPrivateChat(TestCase):
         response = self.auth_client1.get(reverse('private-chat'), data={
             'history_with': self.username2
         })
-        message1 = response.data[0]
-        message2 = response.data[1]
+        message1 = response.data['results'][0]
+        message2 = response.data['results'][1]
         
         self.assertEqual(message1['text'], in_message1)
         self.assertEqual(message2['text'], in_message2)
+    
+    def test_send_to_unknown_user(self):
+        response = self.auth_client1.post(reverse('private-chat'), {'to_user': 'unknown', 'text': 'text'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('to_user', response.data)
+    
+    def test_send_to_just_registered_user(self):
+        response = self.auth_client1.post(reverse('private-chat'), {'to_user': 'newbie', 'text': 'text'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        User.objects.create_user('newbie', password='password')
+        response = self.auth_client1.post(reverse('private-chat'), {'to_user': 'newbie', 'text': 'text'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_send_query_count_with_warm_caches(self):
+        self.auth_client1.post(reverse('private-chat'), {'to_user': self.username2, 'text': 'text'})
+        
+        # INSERT of the message and UPDATE of both conversation summaries, in a savepoint under TestCase
+        with self.assertNumQueries(5):
+            response = self.auth_client1.post(reverse('private-chat'), {'to_user': self.username2, 'text': 'text'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class TestBulkPrivateChat(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user('asdf1', password='password')
+        self.user2 = User.objects.create_user('asdf2', password='password')
+        self.user3 = User.objects.create_user('asdf3', password='password')
+        
+        self.auth_client = AuthenticatedClientFactory().client('asdf1')
+    
+    def _send(self, items):
+        return self.auth_client.post(reverse('private-chat-bulk'), items)
+    
+    def test_send_many_messages(self):
+        response = self._send([
+            {'to_user': 'asdf2', 'text': 'text1'},
+            {'to_user': 'asdf3', 'text': 'text2'},
+            {'to_user': 'asdf2', 'text': 'text3'},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['status'] for r in response.data['results']], [201, 201, 201])
+        
+        ids = [r['id'] for r in response.data['results']]
+        messages = Message.objects.in_bulk(ids)
+        self.assertEqual([messages[pk].text for pk in ids], ['text1', 'text2', 'text3'])
+        self.assertEqual(Message.objects.private_between(self.user1.id, self.user2.id).count(), 2)
+    
+    def test_reports_invalid_items(self):
+        response = self._send([
+            {'to_user': 'asdf2', 'text': 'text1'},
+            {'to_user': 'unknown', 'text': 'text2'},
+            {'to_user': 'asdf2'},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['status'] for r in response.data['results']], [201, 404, 400])
+        self.assertIn('text', response.data['results'][2]['errors'])
+        self.assertEqual(Message.objects.count(), 1)
+    
+    def test_query_count_does_not_depend_on_number_of_messages(self):
+        # warm the token and the recipient caches up, so both measured requests find them there
+        self._send([{'to_user': 'asdf2', 'text': 'text'}, {'to_user': 'asdf3', 'text': 'text'}])
+        query_counts = []
+        for count in (2, 50):
+            with CaptureQueriesContext(connection) as queries:
+                self._send([{'to_user': 'asdf{n}'.format(n=2 + i % 2), 'text': 'text'} for i in range(count)])
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+    
+    def test_rejects_non_list_body(self):
+        response = self._send({'to_user': 'asdf2', 'text': 'text'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestConversations(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user('asdf1', password='password')
+        self.user2 = User.objects.create_user('asdf2', password='password')
+        self.user3 = User.objects.create_user('asdf3', password='password')
+        
+        self.auth_client1 = AuthenticatedClientFactory().client('asdf1')
+        self.auth_client2 = AuthenticatedClientFactory().client('asdf2')
+    
+    def test_list_conversations_by_recency(self):
+        self.auth_client1.post(reverse('private-chat'), {'to_user': 'asdf2', 'text': 'to asdf2'})
+        self.auth_client1.post(reverse('private-chat'), {'to_user': 'asdf3', 'text': 'to asdf3'})
+        self.auth_client2.post(reverse('private-chat'), {'to_user': 'asdf1', 'text': 'from asdf2'})
+        
+        response = self.auth_client1.get(reverse('conversation-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        conversations = response.data['results']
+        self.assertEqual([c['with'] for c in conversations], ['asdf2', 'asdf3'])
+        self.assertEqual(conversations[0]['last_message']['text'], 'from asdf2')
+        self.assertEqual(conversations[0]['last_message']['from_user'], 'asdf2')
+        self.assertEqual(conversations[0]['unread_count'], 1)
+        self.assertEqual(conversations[1]['last_message']['to_user'], 'asdf3')
+        self.assertEqual(conversations[1]['unread_count'], 0)
+    
+    def test_counts_unread_messages_of_bulk_send(self):
+        self.auth_client2.post(reverse('private-chat-bulk'), [
+            {'to_user': 'asdf1', 'text': 'one'},
+            {'to_user': 'asdf1', 'text': 'two'},
+        ])
+        
+        response = self.auth_client1.get(reverse('conversation-list'))
+        self.assertEqual(response.data['results'][0]['unread_count'], 2)
+        self.assertEqual(response.data['results'][0]['last_message']['text'], 'two')
+    
+    def test_mark_conversation_read(self):
+        self.auth_client2.post(reverse('private-chat'), {'to_user': 'asdf1', 'text': 'text'})
+        
+        response = self.auth_client1.post(reverse('conversation-read'), {'with': 'asdf2'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        response = self.auth_client1.get(reverse('conversation-list'))
+        self.assertEqual(response.data['results'][0]['unread_count'], 0)
+    
+    def test_paginate_conversations(self):
+        for username in ('asdf2', 'asdf3'):
+            self.auth_client1.post(reverse('private-chat'), {'to_user': username, 'text': 'text'})
+        
+        response = self.auth_client1.get(reverse('conversation-list'), data={'limit': 1})
+        self.assertEqual([c['with'] for c in response.data['results']], ['asdf3'])
+        
+        response = self.auth_client1.get(reverse('conversation-list'), data={
+            'limit': 1,
+            'before': response.data['next']
+        })
+        self.assertEqual([c['with'] for c in response.data['results']], ['asdf2'])
+        self.assertIsNone(response.data['next'])
+    
+    def test_list_is_a_single_query(self):
+        self.auth_client1.post(reverse('private-chat'), {'to_user': 'asdf2', 'text': 'text'})
+        
+        with self.assertNumQueries(1):
+            self.auth_client1.get(reverse('conversation-list'))
+
+
+class TestUserDirectory(TestCase):
+    def setUp(self):
+        for username in ('alice', 'alex', 'bob', 'carol', 'al'):
+            User.objects.create_user(username, password='password')
+        
+        self.auth_client = AuthenticatedClientFactory().client('bob')
+    
+    def test_paginate_alphabetically(self):
+        usernames = []
+        data = {'limit': 2}
+        while True:
+            response = self.auth_client.get(reverse('user-list'), data=data)
+            usernames.extend(response.data['results'])
+            if response.data['next'] is None:
+                break
+            data['after'] = response.data['next']
+        self.assertEqual(usernames, ['al', 'alex', 'alice', 'bob', 'carol'])
+    
+    def test_search_by_prefix(self):
+        response = self.auth_client.get(reverse('user-list'), data={'q': 'ale'})
+        self.assertEqual(response.data['results'], ['alex'])
+        
+        response = self.auth_client.get(reverse('user-list'), data={'q': 'al'})
+        self.assertEqual(response.data['results'], ['al', 'alex', 'alice'])
+    
+    def test_unchanged_page_is_not_modified(self):
+        response = self.auth_client.get(reverse('user-list'))
+        etag = response['ETag']
+        
+        with self.assertNumQueries(0):
+            response = self.auth_client.get(reverse('user-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_new_user_changes_etag(self):
+        response = self.auth_client.get(reverse('user-list'))
+        etag = response['ETag']
+        
+        User.objects.create_user('dave', password='password')
+        response = self.auth_client.get(reverse('user-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('dave', response.data['results'])
+    
+    def test_directory_version_is_shared_between_processes(self):
+        # instances stand for processes sharing the cache, nothing is delivered through the broker
+        with mock.patch('apps.chat.users.get_broker') as get_broker_mock:
+            first, second = DirectoryVersion(), DirectoryVersion()
+            self.assertEqual(first.value, second.value)
+            
+            first.bump()
+            self.assertEqual(second.value, first.value)
+            self.assertEqual(DirectoryVersion().value, first.value)
+        self.assertFalse(get_broker_mock.called)
@@ -0,0 +1,149 @@
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from apps.chat.models import Message, MessageQuerySet
+from apps.chat.tests.base import AuthenticatedClientFactory
+from apps.chat.writebehind import DURABILITY_ENQUEUE, MessageWriter, WriterOverloaded
+
+
+# the writer thread has its own database connection, so the data has to be committed for it
+class TestMessageWriter(TransactionTestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user('asdf1', password='password')
+        self.user2 = User.objects.create_user('asdf2', password='password')
+    
+    def _message(self, text: str = 'text', **kwargs) -> Message:
+        return Message(from_user=self.user1, to_user=self.user2, timestamp=1, text=text, **kwargs)
+    
+    def test_stores_before_returning(self):
+        writer = MessageWriter()
+        message = self._message()
+        writer.submit([message])
+        self.assertTrue(Message.objects.filter(id=message.id).exists())
+    
+    def test_stores_queued_messages_in_one_commit(self):
+        writer = MessageWriter(max_delay=0.5, durability=DURABILITY_ENQUEUE)
+        create_messages = MessageQuerySet.create_messages
+        with mock.patch.object(MessageQuerySet, 'create_messages', autospec=True,
+                               side_effect=create_messages) as create_mock:
+            for text in ('text1', 'text2', 'text3'):
+                writer.submit([self._message(text)])
+            writer.flush()
+        
+        self.assertEqual(create_mock.call_count, 1)
+        self.assertEqual(sorted(Message.objects.values_list('text', flat=True)), ['text1', 'text2', 'text3'])
+    
+    def test_failed_request_does_not_fail_the_batch(self):
+        writer = MessageWriter(max_delay=0.5, durability=DURABILITY_ENQUEUE)
+        for message in (self._message('text1'), self._message(None), self._message('text2')):
+            writer.submit([message])
+        with self.assertLogs('apps.chat.writebehind') as logs:
+            writer.flush()
+        
+        self.assertEqual(sorted(Message.objects.values_list('text', flat=True)), ['text1', 'text2'])
+        self.assertEqual([record.levelname for record in logs.records], ['WARNING', 'ERROR'])
+    
+    def test_raises_storing_error_with_commit_durability(self):
+        writer = MessageWriter()
+        with self.assertLogs('apps.chat.writebehind', 'ERROR'), self.assertRaises(IntegrityError):
+            writer.submit([self._message(None)])
+    
+    def test_raises_any_storing_error_with_commit_durability(self):
+        writer = MessageWriter()
+        with mock.patch.object(MessageQuerySet, 'create_messages', side_effect=ValueError('bad message')):
+            with self.assertLogs('apps.chat.writebehind', 'ERROR'), self.assertRaises(ValueError):
+                writer.submit([self._message()])
+    
+    def test_raises_error_outside_of_storing_with_commit_durability(self):
+        writer = MessageWriter()
+        with mock.patch('apps.chat.writebehind.close_old_connections', side_effect=RuntimeError('broken')):
+            with self.assertLogs('apps.chat.writebehind', 'ERROR'), self.assertRaises(RuntimeError):
+                writer.submit([self._message()])
+        self.assertFalse(Message.objects.exists())
+    
+    def test_rejects_messages_when_queue_is_full(self):
+        writer = MessageWriter(max_size=1, durability=DURABILITY_ENQUEUE, enqueue_timeout=0)
+        started, release = threading.Event(), threading.Event()
+    
+        def store(queryset, messages):
+            started.set()
+            release.wait()
+        
+        with mock.patch.object(MessageQuerySet, 'create_messages', autospec=True, side_effect=store):
+            writer.submit([self._message()])
+            started.wait()
+            writer.submit([self._message()])
+            with self.assertRaises(WriterOverloaded):
+                writer.submit([self._message()])
+            
+            self.assertFalse(writer.wait_for_user(self.user1.id, timeout=0))
+            release.set()
+            writer.flush()
+        self.assertTrue(writer.wait_for_user(self.user1.id, timeout=0))
+
+
+class TestWriteBehindViews(TransactionTestCase):
+    def setUp(self):
+        User.objects.create_user('asdf1', password='password')
+        self.user2 = User.objects.create_user('asdf2', password='password')
+        self.auth_client = AuthenticatedClientFactory().client('asdf1')
+        self.reader = AuthenticatedClientFactory().client('asdf2')
+        
+        self.writer = MessageWriter(max_delay=0.2, durability=DURABILITY_ENQUEUE)
+        patcher = mock.patch('apps.chat.writebehind.message_writer', self.writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    @override_settings(CHAT_WRITE_BEHIND=True)
+    def test_sender_reads_own_public_message(self):
+        response = self.auth_client.post(reverse('public-chat'), data={'text': 'anytext'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        response = self.auth_client.get(reverse('public-chat'))
+        self.assertEqual([m['text'] for m in response.data['results']], ['anytext'])
+    
+    @override_settings(CHAT_WRITE_BEHIND=True)
+    def test_sender_syncs_own_private_messages(self):
+        response = self.auth_client.post(reverse('private-chat-bulk'), data=[
+            {'to_user': 'asdf2', 'text': 'text1'},
+            {'to_user': 'asdf2', 'text': 'text2'},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        response = self.auth_client.get(reverse('sync'), data={'since_id': 0})
+        self.assertEqual([m['text'] for m in response.data['results']], ['text1', 'text2'])
+    
+    @override_settings(CHAT_WRITE_BEHIND=True, CHAT_ID_SETTLE_TIME=0.2)
+    def test_message_flushed_after_settle_time_is_synced(self):
+        # the batch is flushed long after the message was posted, while another message is stored and synced
+        writer = MessageWriter(max_delay=0.6)
+        with mock.patch('apps.chat.writebehind.message_writer', writer):
+            results = []
+            poster = threading.Thread(target=lambda: results.append(self.auth_client.post(
+                reverse('private-chat-bulk'), data=[{'to_user': 'asdf2', 'text': 'late'}])))
+            poster.start()
+            time.sleep(0.1)
+            Message.objects.create(from_user=self.user2, to_user=None, timestamp=1, text='direct')
+            time.sleep(0.25)
+            
+            response = self.reader.get(reverse('sync'), data={'since_id': 0})
+            self.assertEqual([m['text'] for m in response.data['results']], ['direct'])
+            poster.join()
+            time.sleep(0.25)
+            
+            response = self.reader.get(reverse('sync'), data={'since_id': response.data['since_id']})
+        self.assertEqual([m['text'] for m in response.data['results']], ['late'])
+        self.assertEqual(response.data['results'][0]['id'], results[0].data['results'][0]['id'])
+    
+    @override_settings(CHAT_WRITE_BEHIND=True)
+    def test_overloaded_writer_answers_503(self):
+        with mock.patch.object(self.writer, 'submit', side_effect=WriterOverloaded()):
+            response = self.auth_client.post(reverse('public-chat'), data={'text': 'anytext'})
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
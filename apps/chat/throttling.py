@@ -0,0 +1,65 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+
+DEFAULT_LOGIN_RATE = '10/min'
+DEFAULT_CACHE_ALIAS = 'default'
+
+
+class LoginRateThrottle(SimpleRateThrottle):
+    """ Limits failed login attempts per username to CHAT_LOGIN_RATE ("number/period" as in DRF, empty disables
+    it). Throttles run before the view, so attempts over the limit never reach the password hasher, while only
+    the view knows whether the password was wrong: it calls record_failure() after a failed check and reset()
+    after a successful login.
+
+    Attempts are counted in the CHAT_LOGIN_RATE_CACHE_ALIAS cache, which has to be shared between processes
+    for the limit to hold for the whole deployment."""
+
+    scope = 'login'
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'CHAT_LOGIN_RATE_CACHE_ALIAS', DEFAULT_CACHE_ALIAS)]
+
+    def get_rate(self):
+        return getattr(settings, 'CHAT_LOGIN_RATE', DEFAULT_LOGIN_RATE) or None
+
+    def get_cache_key(self, request, view):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if not username or not isinstance(username, str):
+            # rejected by the serializer anyway
+            return None
+        # any string is a valid username here, keep keys safe for every cache backend
+        ident = hashlib.md5(username.encode('utf-8')).hexdigest()
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def throttle_success(self):
+        # allowed attempts are recorded by the view once the password turns out to be wrong
+        return True
+
+    def record_failure(self, request, view) -> None:
+        if not self._load_history(request, view):
+            return
+        self.history.insert(0, self.now)
+        self.cache.set(self.key, self.history, self.duration)
+
+    def reset(self, request, view) -> None:
+        if self.rate is not None:
+            key = self.get_cache_key(request, view)
+            if key is not None:
+                self.cache.delete(key)
+
+    def _load_history(self, request, view) -> bool:
+        if self.rate is None:
+            return False
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return False
+        self.history = self.cache.get(self.key, [])
+        self.now = self.timer()
+        while self.history and self.history[-1] <= self.now - self.duration:
+            self.history.pop()
+        return True
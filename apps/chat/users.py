@@ -0,0 +1,114 @@
+import threading
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from apps.chat.broker import get_broker
+from apps.chat.caching import MISSING, LRUCache
+
+
+DEFAULT_MAX_SIZE = 100000
+DEFAULT_TTL = 300  # seconds
+DEFAULT_CACHE_ALIAS = 'default'
+
+USERNAME_INVALIDATION_TOPIC = 'users:username-invalidation'
+DIRECTORY_VERSION_CACHE_KEY = 'chat:directory-version'
+
+
+class UsernameCache():
+    """ username -> User cache for resolving message recipients.
+
+    Cached users have only ``id`` and ``username`` loaded. Unknown usernames are cached too, so entries are
+    invalidated on user creation and rename as well as on deletion, in every process through the broker."""
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE, ttl: float = DEFAULT_TTL) -> None:
+        self._local = LRUCache(max_size, ttl)
+        self._lock = threading.Lock()
+        self._subscription = None
+
+    def get(self, username: str) -> Optional[User]:
+        return self.get_many([username]).get(username)
+
+    def get_many(self, usernames: Iterable[str]) -> Dict[str, User]:
+        """ Resolves usernames with at most one query, unknown usernames are left out of the result."""
+        self._connect()
+        found = {}
+        missing = []
+        for username in set(usernames):
+            user = self._local.get(username)
+            if user is MISSING:
+                missing.append(username)
+            elif user is not None:
+                found[username] = user
+
+        if missing:
+            # always from the primary: a user not replicated yet would be cached as unknown for the TTL
+            users = {user.username: user for user in
+                     User.objects.using(DEFAULT_DB_ALIAS).filter(username__in=missing).only('id', 'username')}
+            for username in missing:
+                # None marks a known absence
+                self._local.set(username, users.get(username))
+            found.update(users)
+        return found
+
+    def invalidate(self, usernames: Iterable[str] = (), user_ids: Iterable[int] = ()) -> None:
+        """ Drops entries by username (e.g. a new user) or by user id (renamed or deleted user) in every process."""
+        items = ([(USERNAME_INVALIDATION_TOPIC, {'username': username}) for username in usernames] +
+                 [(USERNAME_INVALIDATION_TOPIC, {'user_id': user_id}) for user_id in user_ids])
+        self._drop([message for topic, message in items])
+        get_broker().publish_many(items)
+
+    def clear(self) -> None:
+        self._local.clear()
+
+    def _connect(self) -> None:
+        if self._subscription is None:
+            with self._lock:
+                if self._subscription is None:
+                    self._subscription = get_broker().subscribe([USERNAME_INVALIDATION_TOPIC],
+                                                                self._on_invalidation)
+
+    def _on_invalidation(self, topic: str, messages: List[dict]) -> None:
+        self._drop(messages)
+
+    def _drop(self, messages: List[dict]) -> None:
+        self._local.pop_many([message['username'] for message in messages if 'username' in message])
+        user_ids = {message['user_id'] for message in messages if 'user_id' in message}
+        if user_ids:
+            self._local.pop_where(lambda username, user: user is not None and user.id in user_ids)
+
+
+username_cache = UsernameCache(max_size=getattr(settings, 'CHAT_USERNAME_CACHE_SIZE', DEFAULT_MAX_SIZE),
+                               ttl=getattr(settings, 'CHAT_USERNAME_CACHE_TTL', DEFAULT_TTL))
+
+
+class DirectoryVersion():
+    """ Opaque version of the user directory, changed whenever a user is created, changed or deleted. Lets unchanged
+    directory pages be answered with 304 without touching the user table.
+
+    The version is kept in the cache_alias cache and read from it on every request, one cache get: processes
+    sharing the cache (all workers of a deployment, recycled ones included) always produce the same ETags, with
+    nothing to miss when a notification is lost."""
+
+    def __init__(self, cache_alias: str = DEFAULT_CACHE_ALIAS) -> None:
+        self._cache_alias = cache_alias
+
+    @property
+    def value(self) -> str:
+        cache = caches[self._cache_alias]
+        value = cache.get(DIRECTORY_VERSION_CACHE_KEY)
+        if value is None:
+            # the first process stores its value, the others take it
+            cache.add(DIRECTORY_VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+            value = cache.get(DIRECTORY_VERSION_CACHE_KEY) or uuid.uuid4().hex
+        return value
+
+    def bump(self) -> None:
+        caches[self._cache_alias].set(DIRECTORY_VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+
+
+directory_version = DirectoryVersion(getattr(settings, 'CHAT_DIRECTORY_VERSION_CACHE_ALIAS', DEFAULT_CACHE_ALIAS))
@@ -1,21 +1,87 @@
+import hashlib
+import re
 import time
 
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.http import condition
 from rest_framework import status
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apps.chat.models import Message
-from apps.chat.serializers import MessageSerializer, RegisterUserSerializer, UserSerializer
+from apps.chat.authentication import CachedTokenAuthentication
+from apps.chat.export import NDJSON_CONTENT_TYPE, iter_gzip, iter_history_rows, iter_ndjson
+from apps.chat.history import get_cached_page, get_history_state, history_condition
+from apps.chat.ids import get_settled_id_floor
+from apps.chat.metrics import registry, render_prometheus
+from apps.chat.models import Conversation, Message
+from apps.chat.pagination import (MessageCursorPagination, decode_cursor, decode_key_cursor, encode_cursor,
+                                  encode_key_cursor, get_page_limit)
+from apps.chat.realtime import message_hub
+from apps.chat.renderers import FastJSONRenderer
+from apps.chat.retention import get_history_archive
+from apps.chat.routers import read_from_replica
+from apps.chat.search import MAX_QUERY_TERMS, get_terms
+from apps.chat.serializers import (CONVERSATION_ROW_FIELDS, MESSAGE_ROW_FIELDS, MessageSerializer,
+                                   OutgoingMessageSerializer, RegisterUserSerializer, UserSerializer,
+                                   serialize_conversation_rows, serialize_message_rows)
+from apps.chat.throttling import LoginRateThrottle
+from apps.chat.users import directory_version, username_cache
+from apps.chat.writebehind import store_messages, wait_for_own_messages
+
+
+# sorts after any character of a username
+MAX_CHARACTER = '\U0010ffff'
+
+# views returning pages of messages render them with the fast JSON renderer
+HISTORY_RENDERER_CLASSES = (FastJSONRenderer, BrowsableAPIRenderer)
+
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
 
 
 def get_current_timestamp() -> int:
     return int(time.time() * 1000)
 
 
+def get_directory_etag(request: Request) -> str:
+    parts = [directory_version.value] + [request.query_params.get(name, '') for name in ('q', 'after', 'limit')]
+    return hashlib.md5('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def get_int_param(request: Request, name: str, default: int = None) -> int:
+    value = request.query_params.get(name, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({name: 'A non-negative integer is required.'})
+    if value < 0:
+        raise ValidationError({name: 'A non-negative integer is required.'})
+    return value
+
+
+def get_public_conversation(request: Request) -> None:
+    return None
+
+
+def get_private_conversation(request: Request) -> str:
+    username = request.query_params.get('history_with')
+    if not username:
+        raise ValidationError({'history_with': 'This parameter is required.'})
+    second_user = username_cache.get(username)
+    if second_user is None:
+        raise ValidationError({'history_with': 'User with this username does not exist.'})
+    return Message.get_conversation_key(request.user.id, second_user.id)
+
+
 class RegistrationView(APIView):
     def post(self, request: Request) -> Response:
         """
@@ -55,6 +121,8 @@ class RegistrationView(APIView):
 
 
 class LoginView(APIView):
+    throttle_classes = (LoginRateThrottle,)
+    
     def post(self, request: Request) -> Response:
         """
         ---
@@ -72,6 +140,8 @@ class LoginView(APIView):
               message: Invalid credentials.
             - code: 404
               message: No such username.
+            - code: 429
+              message: Too many failed login attempts for this username, retry after Retry-After seconds.
         """
         serialized = UserSerializer(data=request.data)
         if not serialized.is_valid():
@@ -81,34 +151,70 @@ class LoginView(APIView):
         password = serialized.data['password']
         
         try:
-            user = User.objects.get_by_natural_key(username)  # type: User
+            # the token comes with the user in one query
+            user = User.objects.select_related('auth_token').get(username=username)  # type: User
         except User.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND, data={
                 'detail': 'User with this username does not exist.'
             })
         
+        # re-encodes the password when it was hashed with another hasher or work factor than the preferred one
+        throttle = LoginRateThrottle()
         if not user.check_password(password):
+            throttle.record_failure(request, self)
             return Response(status=status.HTTP_401_UNAUTHORIZED)
+        throttle.reset(request, self)
         
+        try:
+            token = user.auth_token
+        except Token.DoesNotExist:
+            # users created before tokens were issued on registration
+            token = Token.objects.create(user=user)
         return Response(status=status.HTTP_200_OK, data={
-            'token': user.auth_token.key
+            'token': token.key
         })
 
 
 class PublicChatView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    renderer_classes = HISTORY_RENDERER_CLASSES
     
+    @read_from_replica
+    @method_decorator(history_condition(get_public_conversation))
     def get(self, request: Request) -> Response:
         """
-        Returns public message history.
+        Returns a page of public message history, ordered by id, which follows the order messages were sent in.
+        Without a cursor the newest page is returned. Follow "previous" cursor in the
+        "before" parameter to page back in history, "next" cursor in the "after" parameter to page forward.
+        Pages are answered with 304 to requests with If-None-Match while no new message is posted.
+        ---
+        parameters:
+            - name: before
+              description: Cursor, return messages older than it.
+              required: false
+              type: string
+              paramType: query
+            - name: after
+              description: Cursor, return messages newer than it.
+              required: false
+              type: string
+              paramType: query
+            - name: limit
+              description: Maximum number of messages in the page.
+              required: false
+              type: integer
+              paramType: query
         """
-        messages = []
-        for message in Message.objects.filter(to_user__isnull=True).order_by('timestamp'):
-            serialized_message = MessageSerializer(instance=message)
-            messages.append(serialized_message.data)
+        state = get_history_state(request, get_public_conversation)
         
-        return Response(status=status.HTTP_200_OK, data=messages)
+        def build_page() -> dict:
+            paginator = MessageCursorPagination(request)
+            page = paginator.paginate_queryset(Message.objects.public().values_list(*MESSAGE_ROW_FIELDS),
+                                               get_history_archive(None))
+            return paginator.get_paginated_data(serialize_message_rows(page))
+        
+        return Response(status=status.HTTP_200_OK, data=get_cached_page(request, state, build_page))
     
     def post(self, request: Request) -> Response:
         """
@@ -131,37 +237,83 @@ class PublicChatView(APIView):
               message: Bad request form.
             - code: 401
               message: Invalid credential token.
+            - code: 503
+              message: Too many messages are waiting to be stored, with write-behind on.
         
         """
         message_data = dict(request.data)
-        message_data['from_user'] = request.user.username
         message_data['to_user'] = None
-        message_data['timestamp'] = get_current_timestamp()
         
         new_message_serialized = MessageSerializer(data=message_data)
         if not new_message_serialized.is_valid():
             return Response(status=status.HTTP_400_BAD_REQUEST, data=new_message_serialized.errors)
         
-        new_message_serialized.save()
+        message = new_message_serialized.save(from_user=request.user, timestamp=get_current_timestamp())
+        store_messages([message])
         return Response(status=status.HTTP_200_OK)
 
 
 class UserListView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     
+    # read from the primary: its ETag comes from the version bumped on writes to the primary, a page read from a
+    # lagging replica would be cached by clients under the new version
+    @method_decorator(condition(etag_func=get_directory_etag))
     def get(self, request: Request) -> Response:
-        username_list = User.objects.all().values_list('username', flat=True)
-        return Response(status=status.HTTP_200_OK, data=username_list)
+        """
+        Returns a page of usernames in alphabetical order. Pass "next" cursor in the "after" parameter
+        to get the following page. Unchanged pages are answered with 304 to requests with If-None-Match.
+        ---
+        parameters:
+            - name: q
+              description: Return only usernames starting with this prefix.
+              required: false
+              type: string
+              paramType: query
+            - name: after
+              description: Cursor, return usernames following it.
+              required: false
+              type: string
+              paramType: query
+            - name: limit
+              description: Maximum number of usernames in the page.
+              required: false
+              type: integer
+              paramType: query
+        """
+        limit = get_page_limit(request)
+        
+        users = User.objects.all()
+        prefix = request.query_params.get('q')
+        if prefix:
+            # a range instead of LIKE, so the unique index on username is used on every backend
+            users = users.filter(username__gte=prefix, username__lt=prefix + MAX_CHARACTER)
+        if request.query_params.get('after'):
+            users = users.filter(username__gt=decode_key_cursor(request.query_params['after']))
+        username_list = list(users.order_by('username').values_list('username', flat=True)[:limit + 1])
+        
+        next_cursor = None
+        if len(username_list) > limit:
+            username_list = username_list[:limit]
+            next_cursor = encode_key_cursor(username_list[-1])
+        
+        return Response(status=status.HTTP_200_OK, data={
+            'next': next_cursor,
+            'results': username_list
+        })
 
 
 class PrivateChatView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    renderer_classes = HISTORY_RENDERER_CLASSES
     
+    @read_from_replica
+    @method_decorator(history_condition(get_private_conversation))
     def get(self, request: Request) -> Response:
         """
-        Get message history with user.
+        Get a page of message history with user, paginated and cached the same way as public history.
         ---
         parameters:
             - name: history_with
@@ -169,18 +321,32 @@ class PrivateChatView(APIView):
               required: true
               type: string
               paramType: query
+            - name: before
+              description: Cursor, return messages older than it.
+              required: false
+              type: string
+              paramType: query
+            - name: after
+              description: Cursor, return messages newer than it.
+              required: false
+              type: string
+              paramType: query
+            - name: limit
+              description: Maximum number of messages in the page.
+              required: false
+              type: integer
+              paramType: query
         """
-        username = request.query_params['history_with']
-        second_user = User.objects.get(username=username)
+        state = get_history_state(request, get_private_conversation)
         
-        message_history_ascending = ((Message.objects.filter(from_user=request.user, to_user=second_user) |
-                                      Message.objects.filter(from_user=second_user, to_user=request.user))
-                                     .order_by('timestamp'))
-        message_history_serialized = []
-        for message in message_history_ascending:
-            message_history_serialized.append(MessageSerializer(instance=message).data)
-            
-        return Response(status=status.HTTP_200_OK, data=message_history_serialized)
+        def build_page() -> dict:
+            paginator = MessageCursorPagination(request)
+            page = paginator.paginate_queryset(Message.objects.filter(conversation=state.conversation)
+                                               .values_list(*MESSAGE_ROW_FIELDS),
+                                               get_history_archive(state.conversation))
+            return paginator.get_paginated_data(serialize_message_rows(page))
+        
+        return Response(status=status.HTTP_200_OK, data=get_cached_page(request, state, build_page))
         
     def post(self, request: Request) -> Response:
         """
@@ -198,16 +364,348 @@ class PrivateChatView(APIView):
               paramType: body
         """
         
-        data = dict(request.data)
-        data['from_user'] = request.user.username
-        data['timestamp'] = get_current_timestamp()
-        
-        serialized = MessageSerializer(data=data)
+        serialized = MessageSerializer(data=request.data)
         if not serialized.is_valid():
             return Response(status=status.HTTP_400_BAD_REQUEST, data=serialized.errors)
         
-        serialized.save()
+        message = serialized.save(from_user=request.user, timestamp=get_current_timestamp())
+        store_messages([message])
         
         return Response(status=status.HTTP_200_OK)
+
+
+class BulkPrivateChatView(APIView):
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    
+    def post(self, request: Request) -> Response:
+        """
+        Send many private messages at once.
+        Body in the form [{"to_user": "USERNAME", "text": "MESSAGE_TEXT"}, ...]. Valid messages are stored
+        in one transaction, the response has a status for each item in the same order.
+        ---
+        consumes:
+            - application/json
+        
+        parameters:
+            - name: body
+              description: List of messages
+              required: true
+              type: string
+              paramType: body
+        
+        responseMessages:
+            - code: 200
+              message: Per-item results, 201 with message id or 400/404 with errors.
+            - code: 400
+              message: Body is not a list or it is too long.
+            - code: 503
+              message: Too many messages are waiting to be stored, with write-behind on.
+        """
+        if not isinstance(request.data, list):
+            return Response(status=status.HTTP_400_BAD_REQUEST, data={
+                'errors': 'Expected a list of messages.'
+            })
+        if len(request.data) > settings.CHAT_BULK_MAX_MESSAGES:
+            return Response(status=status.HTTP_400_BAD_REQUEST, data={
+                'errors': 'No more than {max} messages per request.'.format(max=settings.CHAT_BULK_MAX_MESSAGES)
+            })
+        
+        results = [None] * len(request.data)
+        item_serializer = OutgoingMessageSerializer()
+        valid_items = []
+        for index, item in enumerate(request.data):
+            try:
+                valid_items.append((index, item_serializer.run_validation(item)))
+            except ValidationError as exc:
+                results[index] = {'status': status.HTTP_400_BAD_REQUEST, 'errors': exc.detail}
+        
+        recipients = username_cache.get_many(item['to_user'] for index, item in valid_items)
+        
+        timestamp = get_current_timestamp()
+        indexed_messages = []
+        for index, item in valid_items:
+            to_user = recipients.get(item['to_user'])
+            if to_user is None:
+                results[index] = {'status': status.HTTP_404_NOT_FOUND,
+                                  'errors': {'to_user': ['User with this username does not exist.']}}
+                continue
+            indexed_messages.append((index, Message(from_user=request.user, to_user=to_user,
+                                                    timestamp=timestamp, text=item['text'])))
+        
+        store_messages([message for index, message in indexed_messages])
+        
+        for index, message in indexed_messages:
+            results[index] = {'status': status.HTTP_201_CREATED, 'id': message.id, 'id_str': str(message.id)}
+        return Response(status=status.HTTP_200_OK, data={'results': results})
+
+
+class ConversationListView(APIView):
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = HISTORY_RENDERER_CLASSES
+    
+    def get(self, request: Request) -> Response:
+        """
+        Private conversations of the user with their last message and number of unread messages,
+        most recent first. Pass "next" cursor in the "before" parameter to get the following page.
+        ---
+        parameters:
+            - name: before
+              description: Cursor, return conversations with older last message.
+              required: false
+              type: string
+              paramType: query
+            - name: limit
+              description: Maximum number of conversations in the page.
+              required: false
+              type: integer
+              paramType: query
+        """
+        limit = get_page_limit(request)
+        
+        wait_for_own_messages(request.user.id)
+        conversations = Conversation.objects.filter(owner=request.user)
+        if request.query_params.get('before'):
+            conversations = conversations.filter(last_message_id__lt=decode_cursor(request.query_params['before']))
+        rows = list(conversations.order_by('-last_message_id')
+                    .values_list(*CONVERSATION_ROW_FIELDS)[:limit + 1])
         
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_message = rows[-1]
+            next_cursor = encode_cursor(last_message[2])
         
+        return Response(status=status.HTTP_200_OK, data={
+            'next': next_cursor,
+            'results': serialize_conversation_rows(rows, request.user.username)
+        })
+
+
+class ConversationReadView(APIView):
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    
+    def post(self, request: Request) -> Response:
+        """
+        Mark all messages of the conversation with user as read.
+        Body in the form {"with": "USERNAME"}
+        ---
+        consumes:
+            - application/json
+        
+        parameters:
+            - name: body
+              description: Username of the other participant
+              required: true
+              type: string
+              paramType: body
+        """
+        peer = username_cache.get(str(request.data.get('with', '')))
+        if peer is None:
+            return Response(status=status.HTTP_404_NOT_FOUND, data={
+                'detail': 'User with this username does not exist.'
+            })
+        
+        Conversation.objects.filter(owner=request.user, peer_id=peer.id).update(unread_count=0)
+        return Response(status=status.HTTP_200_OK)
+
+
+class PollView(APIView):
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = HISTORY_RENDERER_CLASSES
+    
+    def get(self, request: Request) -> Response:
+        """
+        Long-polls for public and private messages with ids greater than "since_id". Returns as soon as there are
+        any, or an empty list after the timeout. Pass returned "since_id" to the next poll. Messages are returned
+        once they are CHAT_ID_SETTLE_TIME old, when no message with a smaller id can be committed after them.
+        ---
+        parameters:
+            - name: since_id
+              description: Id of the last seen message.
+              required: true
+              type: integer
+              paramType: query
+            - name: timeout
+              description: Maximum number of seconds to wait for new messages.
+              required: false
+              type: integer
+              paramType: query
+        """
+        since_id = get_int_param(request, 'since_id')
+        timeout = min(get_int_param(request, 'timeout', settings.CHAT_POLL_TIMEOUT),
+                      settings.CHAT_POLL_MAX_TIMEOUT)
+        
+        deadline = time.monotonic() + timeout
+        messages = message_hub.wait(request.user.username, since_id, timeout)
+        if messages is None:
+            # the client is too far behind the in-memory buffer, catch up from the database
+            caught_up_to = get_settled_id_floor()
+            messages = serialize_message_rows(
+                Message.objects.visible_to(request.user.id)
+                .filter(id__gt=since_id, id__lt=caught_up_to)
+                .order_by('id')
+                .values_list(*MESSAGE_ROW_FIELDS)[:settings.CHAT_HISTORY_MAX_PAGE_SIZE])
+            if not messages:
+                # nothing was missed (e.g. a quiet chat, or a restarted worker), wait for new messages instead of
+                # answering right away and being polled again in a loop
+                messages = message_hub.wait(request.user.username, since_id, max(deadline - time.monotonic(), 0),
+                                            caught_up_to=caught_up_to) or []
+        
+        if messages:
+            since_id = messages[-1]['id']
+        return Response(status=status.HTTP_200_OK, data={
+            'since_id': since_id,
+            'since_id_str': str(since_id),
+            'results': messages
+        })
+
+
+class SyncView(APIView):
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = HISTORY_RENDERER_CLASSES
+    
+    def get(self, request: Request) -> Response:
+        """
+        Returns public and private messages with ids greater than "since_id", in id order, with one query.
+        At most CHAT_SYNC_MAX_MESSAGES are returned at once: while "has_more" is true, repeat the request
+        with the returned "since_id" right away, otherwise keep it for the next sync. Messages younger than
+        CHAT_ID_SETTLE_TIME are left for the next sync, a message with a smaller id can still be committed.
+        ---
+        parameters:
+            - name: since_id
+              description: Id of the last seen message, 0 to sync from the beginning.
+              required: true
+              type: integer
+              paramType: query
+            - name: limit
+              description: Maximum number of messages to return.
+              required: false
+              type: integer
+              paramType: query
+        """
+        since_id = get_int_param(request, 'since_id')
+        maximum = settings.CHAT_SYNC_MAX_MESSAGES
+        limit = min(get_int_param(request, 'limit', maximum) or maximum, maximum)
+        
+        wait_for_own_messages(request.user.id)
+        messages = serialize_message_rows(Message.objects.visible_to(request.user.id)
+                                          .filter(id__gt=since_id, id__lt=get_settled_id_floor())
+                                          .order_by('id')
+                                          .values_list(*MESSAGE_ROW_FIELDS)[:limit + 1])
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        
+        if messages:
+            since_id = messages[-1]['id']
+        return Response(status=status.HTTP_200_OK, data={
+            'since_id': since_id,
+            'since_id_str': str(since_id),
+            'has_more': has_more,
+            'results': messages
+        })
+
+
+class SearchView(APIView):
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = HISTORY_RENDERER_CLASSES
+    
+    def get(self, request: Request) -> Response:
+        """
+        Public messages and private messages of the user containing all words of the query, most recent first.
+        Words are matched whole and case-insensitively. Pass "next" cursor in the "before" parameter to get
+        the following page.
+        ---
+        parameters:
+            - name: q
+              description: Words to search for.
+              required: true
+              type: string
+              paramType: query
+            - name: before
+              description: Cursor, return messages older than it.
+              required: false
+              type: string
+              paramType: query
+            - name: limit
+              description: Maximum number of messages in the page.
+              required: false
+              type: integer
+              paramType: query
+        """
+        query = request.query_params.get('q', '')
+        if not query.strip():
+            raise ValidationError({'q': 'This parameter is required.'})
+        terms = get_terms(query)
+        if len(terms) > MAX_QUERY_TERMS:
+            raise ValidationError({'q': 'No more than {max} words.'.format(max=MAX_QUERY_TERMS)})
+        limit = get_page_limit(request)
+        
+        wait_for_own_messages(request.user.id)
+        messages = Message.objects.visible_to(request.user.id).matching(terms)
+        if request.query_params.get('before'):
+            messages = messages.filter(id__lt=decode_cursor(request.query_params['before']))
+        results = serialize_message_rows(messages.order_by('-id').values_list(*MESSAGE_ROW_FIELDS)[:limit + 1])
+        
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            next_cursor = encode_cursor(results[-1]['id'])
+        
+        return Response(status=status.HTTP_200_OK, data={
+            'next': next_cursor,
+            'results': results
+        })
+
+
+class ExportView(APIView):
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    
+    def get(self, request: Request) -> StreamingHttpResponse:
+        """
+        Streams the complete public history, or the private conversation with "history_with", archived messages
+        included, as NDJSON: one message per line in id order. The response is gzip-compressed for clients accepting it.
+        ---
+        parameters:
+            - name: history_with
+              description: Username of the other participant, the public history is exported without it.
+              required: false
+              type: string
+              paramType: query
+        """
+        if request.query_params.get('history_with'):
+            filters = {'conversation': get_private_conversation(request)}
+            filename = 'private.ndjson'
+        else:
+            filters = {'to_user__isnull': True}
+            filename = 'public.ndjson'
+        
+        wait_for_own_messages(request.user.id)
+        chunks = iter_ndjson(iter_history_rows(filters))
+        compress = ACCEPTS_GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if compress:
+            chunks = iter_gzip(chunks)
+        
+        response = StreamingHttpResponse(chunks, content_type=NDJSON_CONTENT_TYPE)
+        response['Content-Disposition'] = 'attachment; filename="{filename}"'.format(filename=filename)
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+class MetricsView(View):
+    """ Request metrics of this process in the Prometheus text format. Restricted to CHAT_METRICS_ALLOWED_IPS
+    when it is not empty."""
+    
+    def get(self, request):
+        allowed_ips = getattr(settings, 'CHAT_METRICS_ALLOWED_IPS', [])
+        if allowed_ips and request.META.get('REMOTE_ADDR') not in allowed_ips:
+            return HttpResponseForbidden()
+        return HttpResponse(render_prometheus(registry.snapshot()), content_type='text/plain; version=0.0.4')
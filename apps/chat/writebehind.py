@@ -0,0 +1,241 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, close_old_connections
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from apps.chat.ids import get_id_floor, get_settle_time, message_ids
+from apps.chat.models import Message
+from apps.chat.realtime import publish_messages
+from apps.chat.routers import pin_to_primary
+
+
+DURABILITY_COMMIT = 'commit'
+DURABILITY_ENQUEUE = 'enqueue'
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MAX_DELAY = 0.01  # seconds
+DEFAULT_ENQUEUE_TIMEOUT = 1.0  # seconds
+DEFAULT_READ_TIMEOUT = 2.0  # seconds
+
+# attempts and the pause between them for batches failing with operational errors, e.g. a locked SQLite database
+STORE_ATTEMPTS = 3
+RETRY_DELAY = 0.05  # seconds
+
+logger = logging.getLogger(__name__)
+
+
+class WriterOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many messages are waiting to be stored, try again later.'
+    default_code = 'writer_overloaded'
+
+
+class _PendingWrite():
+    """ Messages of one request, in the queue or in a batch being stored."""
+
+    def __init__(self, messages: List[Message]) -> None:
+        self.messages = messages
+        self.stored = threading.Event()
+        self.error = None  # type: Exception
+
+
+class MessageWriter():
+    """ Stores new messages from a daemon thread of the process, in group commits: the thread takes what is
+    queued, up to batch_size messages or whatever arrived within max_delay seconds of the first one, inserts
+    it with create_messages() in one transaction and publishes it.
+
+    Sync and long polling take ids older than CHAT_ID_SETTLE_TIME as committed (see get_settled_id_floor()),
+    while messages can wait in the queue for longer, so the thread gives them ids right before the INSERT.
+
+    With DURABILITY_COMMIT submit() returns after the batch is committed, many requests share one commit, and the
+    messages have their final ids by then. With DURABILITY_ENQUEUE it returns right away and messages still in the
+    queue are lost if the process dies, the queue is flushed on a normal exit. Requests answer with the ids taken on
+    submit, which are only kept when the messages are stored within half of the settle time.
+
+    Reads see the writes of their user through wait_for_user(), which only knows about this process: with several
+    worker processes and DURABILITY_ENQUEUE the next request of the sender can still miss its message."""
+
+    def __init__(self, max_size: int = DEFAULT_QUEUE_SIZE, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_delay: float = DEFAULT_MAX_DELAY, durability: str = DURABILITY_COMMIT,
+                 enqueue_timeout: float = DEFAULT_ENQUEUE_TIMEOUT) -> None:
+        if durability not in (DURABILITY_COMMIT, DURABILITY_ENQUEUE):
+            raise ImproperlyConfigured('Unknown write-behind durability {0!r}.'.format(durability))
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.durability = durability
+        self.enqueue_timeout = enqueue_timeout
+
+        self._queue = queue.Queue(max_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        # user id -> number of messages sent by the user and not stored yet
+        self._pending = {}  # type: Dict[int, int]
+        self._pending_changed = threading.Condition()
+
+    def submit(self, messages: List[Message]) -> None:
+        """ Queues messages for storing, raises WriterOverloaded when the queue stays full for enqueue_timeout
+        seconds. With DURABILITY_COMMIT waits for the commit and raises the error storing them failed with."""
+        if not messages:
+            return
+        self._ensure_started()
+
+        write = _PendingWrite(messages)
+        self._add_pending(messages, 1)
+        try:
+            self._queue.put(write, timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._add_pending(messages, -1)
+            raise WriterOverloaded()
+
+        if self.durability == DURABILITY_COMMIT:
+            write.stored.wait()
+            if write.error is not None:
+                raise write.error
+
+    def wait_for_user(self, user_id: int, timeout: float) -> bool:
+        """ Blocks until messages sent by the user are stored, False if some are still pending after timeout."""
+        with self._pending_changed:
+            return self._pending_changed.wait_for(lambda: not self._pending.get(user_id), timeout)
+
+    def flush(self) -> None:
+        """ Blocks until every submitted message is stored or failed."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _add_pending(self, messages: List[Message], delta: int) -> None:
+        with self._pending_changed:
+            for message in messages:
+                count = self._pending.get(message.from_user_id, 0) + delta
+                if count:
+                    self._pending[message.from_user_id] = count
+                else:
+                    del self._pending[message.from_user_id]
+            if delta < 0:
+                self._pending_changed.notify_all()
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            writes = self._take_batch()
+            try:
+                self._write(writes)
+            except Exception as exc:
+                logger.exception('Failed to store a batch of messages.')
+                # requests waiting for the commit must not take the batch as stored
+                for write in writes:
+                    if write.error is None:
+                        write.error = exc
+            finally:
+                for write in writes:
+                    self._add_pending(write.messages, -1)
+                    write.stored.set()
+                    self._queue.task_done()
+
+    def _take_batch(self) -> List[_PendingWrite]:
+        writes = [self._queue.get()]
+        size = len(writes[0].messages)
+        deadline = time.monotonic() + self.max_delay
+        while size < self.batch_size:
+            try:
+                write = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            writes.append(write)
+            size += len(write.messages)
+        return writes
+
+    def _write(self, writes: List[_PendingWrite]) -> None:
+        # the thread outlives requests, so it drops connections the way request handling does
+        close_old_connections()
+        try:
+            self._store([message for write in writes for message in write.messages])
+            stored = writes
+        except Exception as exc:
+            if len(writes) > 1:
+                # one bad message should not fail the others: fall back to a transaction per request
+                logger.warning('Failed to store a batch of %s requests, storing them one by one.', len(writes))
+                stored = [write for write in writes if self._store_write(write)]
+            else:
+                logger.exception('Failed to store messages.')
+                writes[0].error = exc
+                stored = []
+        finally:
+            close_old_connections()
+
+        if stored:
+            try:
+                publish_messages([message for write in stored for message in write.messages])
+            except Exception:
+                # the messages are committed, subscribers catch up from the database
+                logger.exception('Failed to publish stored messages.')
+
+    def _store_write(self, write: _PendingWrite) -> bool:
+        try:
+            self._store(write.messages)
+            return True
+        except Exception as exc:
+            logger.exception('Failed to store messages.')
+            write.error = exc
+            return False
+
+    def _store(self, messages: List[Message]) -> None:
+        for attempt in range(1, STORE_ATTEMPTS + 1):
+            self._assign_ids(messages)
+            try:
+                Message.objects.create_messages(messages)
+                return
+            except OperationalError:
+                if attempt == STORE_ATTEMPTS:
+                    raise
+                time.sleep(RETRY_DELAY * attempt)
+
+    def _assign_ids(self, messages: List[Message]) -> None:
+        if self.durability == DURABILITY_ENQUEUE:
+            # the request has answered with the id already, it is replaced only when the rest of the settle time
+            # might not cover the INSERT
+            fresh_floor = get_id_floor(int(time.time() * 1000) - get_settle_time() // 2)
+            messages = [message for message in messages if message.id < fresh_floor]
+        for message, message_id in zip(messages, message_ids.allocate(len(messages))):
+            message.id = message_id
+
+
+message_writer = MessageWriter(
+    max_size=getattr(settings, 'CHAT_WRITE_BEHIND_QUEUE_SIZE', DEFAULT_QUEUE_SIZE),
+    batch_size=getattr(settings, 'CHAT_WRITE_BEHIND_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+    max_delay=getattr(settings, 'CHAT_WRITE_BEHIND_MAX_DELAY', DEFAULT_MAX_DELAY),
+    durability=getattr(settings, 'CHAT_WRITE_BEHIND_DURABILITY', DURABILITY_COMMIT),
+    enqueue_timeout=getattr(settings, 'CHAT_WRITE_BEHIND_ENQUEUE_TIMEOUT', DEFAULT_ENQUEUE_TIMEOUT))
+
+
+def store_messages(messages: List[Message]) -> None:
+    """ Stores and publishes new messages, through the write-behind writer when CHAT_WRITE_BEHIND is on.
+    Senders read from the primary for a while afterwards."""
+    pin_to_primary({message.from_user_id for message in messages})
+    if getattr(settings, 'CHAT_WRITE_BEHIND', False):
+        message_writer.submit(messages)
+    else:
+        Message.objects.create_messages(messages)
+        publish_messages(messages)
+
+
+def wait_for_own_messages(user_id: int) -> None:
+    """ Read-your-writes barrier for reads of the user's history, a no-op without write-behind."""
+    if getattr(settings, 'CHAT_WRITE_BEHIND', False):
+        message_writer.wait_for_user(user_id, getattr(settings, 'CHAT_WRITE_BEHIND_READ_TIMEOUT',
+                                                      DEFAULT_READ_TIMEOUT))
@@ -0,0 +1,5 @@
+"""
+Local benchmarks of the chat service. Every module is runnable on its own:
+
+    python -m benchmarks.<module> --help
+"""
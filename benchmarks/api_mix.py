@@ -0,0 +1,283 @@
+"""
+Throughput of the chat API under a mix of operations: seeds a throwaway SQLite database with users and messages,
+starts gunicorn on it and drives weighted register/login/post/history/user list requests from concurrent keep-alive
+connections. Reports req/s and p50/p95/p99 latency per operation and in total, plus database queries per request
+of every operation, measured in-process on the same database and settings. Results can be saved as JSON and
+compared with a saved run, e.g. of the previous commit. On SQLite writes of different workers can collide with
+"database is locked", such responses are counted in the errors column.
+
+    python -m benchmarks.api_mix --users 100 --messages 10000 --clients 4 --connections 4 --duration 10 \\
+        --mix history=50,private_history=20,users=10,post=10,private_post=5,login=2,register=1,search=2 \\
+        --output after.json --compare before.json
+"""
+import argparse
+import bisect
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.load_test import ROOT_DIR, start_server
+from benchmarks.stats import summarize
+
+
+# name -> expected status, requests are built by build_request()
+OPERATIONS = {
+    'register': 201,
+    'login': 200,
+    'post': 200,
+    'private_post': 200,
+    'history': 200,
+    'private_history': 200,
+    'users': 200,
+    'search': 200,
+}
+DEFAULT_MIX = 'history=50,private_history=20,users=10,post=10,private_post=5,login=2,register=1,search=2'
+
+PROFILES = {
+    'production': '_config.settings.production',
+    'tests': '_config.settings.tests',
+}
+
+
+def parse_mix(value: str) -> list:
+    """ "name=weight,..." -> [(name, weight)], names from OPERATIONS."""
+    mix = []
+    for item in value.split(','):
+        name, weight = item.split('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError('Unknown operation {name}.'.format(name=name))
+        mix.append((name, float(weight)))
+    return mix
+
+
+def build_request(operation: str, username: str, peer: str, unique: str) -> tuple:
+    """ (method, path, JSON body or None) of one request of the operation, made by username."""
+    if operation == 'register':
+        name = 'bench-' + unique
+        return 'POST', '/register/', {'username': name, 'password': 'password', 'repeat_password': 'password'}
+    if operation == 'login':
+        return 'POST', '/login/', {'username': username, 'password': 'password'}
+    if operation == 'post':
+        return 'POST', '/public-chat/', {'text': 'public message ' + unique}
+    if operation == 'private_post':
+        return 'POST', '/private/', {'to_user': peer, 'text': 'private message ' + unique}
+    if operation == 'history':
+        return 'GET', '/public-chat/?limit=50', None
+    if operation == 'private_history':
+        return 'GET', '/private/?limit=50&history_with=' + peer, None
+    if operation == 'users':
+        return 'GET', '/users/?limit=50', None
+    if operation == 'search':
+        return 'GET', '/search/?limit=50&q=message', None
+    raise ValueError(operation)
+
+
+def seed_database(path: str, profile: str, users: int, messages: int) -> list:
+    """ Migrates a database in path and fills it with users and public and private messages between them,
+    returns (username, token) pairs of the users. Django stays set up on it in this process."""
+    sys.path.insert(0, ROOT_DIR)
+    os.chdir(path)
+    os.environ['DJANGO_SETTINGS_MODULE'] = PROFILES[profile]
+    os.environ['DJANGO_DB_NAME'] = os.path.join(path, 'db.sqlite3')
+    import django
+    django.setup()
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from apps.chat.models import Message
+    
+    call_command('migrate', verbosity=0)
+    seeded = [User.objects.create_user('user{n}'.format(n=n), password='password') for n in range(users)]
+    rng = random.Random(0)
+    for start in range(0, messages, 1000):
+        batch = []
+        for n in range(start, min(start + 1000, messages)):
+            from_user, to_user = rng.sample(seeded, 2) if len(seeded) > 1 else (seeded[0], seeded[0])
+            batch.append(Message(from_user=from_user, to_user=to_user if n % 2 else None, timestamp=n,
+                                 text='message {n}'.format(n=n)))
+        Message.objects.create_messages(batch)
+    return [(user.username, user.auth_token.key) for user in seeded]
+
+
+def client_process(args) -> dict:
+    """ Sends requests of the mix over keep-alive connections from threads until the deadline, returns
+    latencies and number of unexpected responses per operation."""
+    port, users, mix, connections, deadline, seed = args
+    names = [name for name, weight in mix]
+    cumulative = []
+    total = 0
+    for name, weight in mix:
+        total += weight
+        cumulative.append(total)
+    
+    results = {name: {'latencies': [], 'errors': 0} for name in names}
+    lock = threading.Lock()
+    
+    def run_connection(number: int):
+        rng = random.Random(seed * 1000 + number)
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        own = {name: {'latencies': [], 'errors': 0} for name in names}
+        n = 0
+        while time.time() < deadline:
+            operation = names[bisect.bisect_right(cumulative, rng.random() * total)]
+            (username, token), (peer, _) = rng.sample(users, 2) if len(users) > 1 else (users[0], users[0])
+            unique = '{pid}-{number}-{n}'.format(pid=os.getpid(), number=number, n=n)
+            method, url, body = build_request(operation, username, peer, unique)
+            headers = {'Authorization': 'Token ' + token, 'Content-Type': 'application/json'}
+            
+            started = time.perf_counter()
+            connection.request(method, url, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status == OPERATIONS[operation]:
+                own[operation]['latencies'].append(time.perf_counter() - started)
+            else:
+                own[operation]['errors'] += 1
+            n += 1
+        with lock:
+            for name in names:
+                results[name]['latencies'].extend(own[name]['latencies'])
+                results[name]['errors'] += own[name]['errors']
+    
+    threads = [threading.Thread(target=run_connection, args=(number,)) for number in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def count_queries(mix: list, users: list) -> dict:
+    """ Database queries per request of every operation of the mix, taken from its second run in this process,
+    so per-process caches are warm as they are on the server."""
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    
+    client = Client()
+    (username, token), (peer, _) = users[0], users[-1]
+    queries = {}
+    for name, weight in mix:
+        for attempt in range(2):
+            method, url, body = build_request(name, username, peer, 'queries-{attempt}'.format(attempt=attempt))
+            with CaptureQueriesContext(connection) as captured:
+                client.generic(method, url, data=json.dumps(body) if body is not None else '',
+                               content_type='application/json', HTTP_AUTHORIZATION='Token ' + token)
+        queries[name] = len(captured)
+    return queries
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(path: str, args, users: list, mix: list) -> dict:
+    # logins are not throttled, every benchmark user logs in many times a minute
+    server = start_server(path, args.port, args.workers, args.threads, settings_module=PROFILES[args.profile],
+                          extra_env={'DJANGO_DB_NAME': os.path.join(path, 'db.sqlite3'), 'CHAT_LOGIN_RATE': ''})
+    try:
+        # warm up every worker before measuring
+        client_process((args.port, users, mix, args.workers, time.time() + 1, 0))
+        deadline = time.time() + args.duration
+        jobs = [(args.port, users, mix, args.connections, deadline, seed + 1) for seed in range(args.clients)]
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.map(client_process, jobs)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+    
+    operations = {}
+    all_latencies = []
+    all_errors = 0
+    for name, weight in mix:
+        latencies = [latency for result in results for latency in result[name]['latencies']]
+        errors = sum(result[name]['errors'] for result in results)
+        operations[name] = dict(summarize(latencies), rps=len(latencies) / args.duration, errors=errors)
+        all_latencies += latencies
+        all_errors += errors
+    
+    return {
+        'commit': get_commit(),
+        'parameters': {name: value for name, value in vars(args).items() if name not in ('output', 'compare')},
+        'operations': operations,
+        'total': dict(summarize(all_latencies), rps=len(all_latencies) / args.duration, errors=all_errors),
+    }
+
+
+def format_change(old: float, new: float) -> str:
+    if not old:
+        return ''
+    return '{0:+.1f}%'.format((new - old) / old * 100)
+
+
+def print_report(report: dict, baseline: dict = None) -> None:
+    print('commit {0}, {1} cores, {2} workers x {3} threads, {4} connections'.format(
+        report['commit'], multiprocessing.cpu_count(), report['parameters']['workers'],
+        report['parameters']['threads'], report['parameters']['clients'] * report['parameters']['connections']))
+    header = '{:>16} {:>10} {:>10} {:>10} {:>10} {:>8} {:>8}'.format(
+        'operation', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'errors')
+    if baseline is not None:
+        header += ' {:>12} {:>12}'.format('req/s vs ' + str(baseline['commit']), 'p99 vs')
+    print(header)
+    
+    rows = sorted(report['operations'].items()) + [('total', report['total'])]
+    for name, result in rows:
+        line = '{:>16} {:>10.1f} {:>10.3f} {:>10.3f} {:>10.3f} {:>8} {:>8}'.format(
+            name, result['rps'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+            result.get('queries', ''), result['errors'])
+        previous = None
+        if baseline is not None:
+            previous = baseline['total'] if name == 'total' else baseline['operations'].get(name)
+        if previous is not None:
+            line += ' {:>12} {:>12}'.format(format_change(previous['rps'], result['rps']),
+                                            format_change(previous['p99_ms'], result['p99_ms']))
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='production', help='settings of the server')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help='weights of operations: ' + ', '.join(sorted(OPERATIONS)))
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=4, help='client processes')
+    parser.add_argument('--connections', type=int, default=4, help='keep-alive connections per client process')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output', help='save the results as JSON')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    args = parser.parse_args()
+    
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    
+    with tempfile.TemporaryDirectory() as path:
+        users = seed_database(path, args.profile, args.users, args.messages)
+        report = run(path, args, users, args.mix)
+        for name, queries in count_queries(args.mix, users).items():
+            report['operations'][name]['queries'] = queries
+    
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+import os
+from contextlib import contextmanager
+
+
+def setup_django(settings_module: str = '_config.settings.tests') -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """ Creates a throwaway database the same way the test runner does, and destroys it on exit."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
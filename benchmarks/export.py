@@ -0,0 +1,69 @@
+"""
+Time and peak Python memory (tracemalloc) of exporting the whole message table: one list of serialized messages
+rendered with FastJSONRenderer (what building the export from the history views amounts to) against the streaming
+NDJSON export, plain and gzipped.
+
+    python -m benchmarks.export --messages 200000
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.environment import setup_django, test_database
+
+
+def export_in_memory() -> int:
+    from apps.chat.models import Message
+    from apps.chat.renderers import FastJSONRenderer
+    from apps.chat.serializers import MESSAGE_ROW_FIELDS, serialize_message_rows
+    
+    messages = serialize_message_rows(Message.objects.order_by('id').values_list(*MESSAGE_ROW_FIELDS))
+    return len(FastJSONRenderer().render(messages))
+
+
+def export_streaming(compress: bool) -> int:
+    from apps.chat.export import iter_gzip, iter_message_rows, iter_ndjson
+    from apps.chat.models import Message
+    
+    chunks = iter_ndjson(iter_message_rows(Message.objects.all()))
+    if compress:
+        chunks = iter_gzip(chunks)
+    return sum(len(chunk) for chunk in chunks)
+
+
+def measure(export) -> tuple:
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = export()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200000)
+    args = parser.parse_args()
+    
+    setup_django()
+    from django.contrib.auth.models import User
+    from apps.chat.models import Message
+    
+    with test_database():
+        user = User.objects.create_user('user', password='password')
+        for start in range(0, args.messages, 10000):
+            Message.objects.bulk_create([Message(from_user=user, timestamp=n, text='message number {n}'.format(n=n))
+                                         for n in range(start, min(start + 10000, args.messages))])
+        
+        print('{:>10} {:>10} {:>12} {:>12}'.format('path', 'seconds', 'peak MB', 'output MB'))
+        paths = [('in-memory', export_in_memory),
+                 ('ndjson', lambda: export_streaming(False)),
+                 ('ndjson.gz', lambda: export_streaming(True))]
+        for name, export in paths:
+            elapsed, peak, size = measure(export)
+            print('{:>10} {:>10.2f} {:>12.1f} {:>12.1f}'.format(name, elapsed, peak / 2 ** 20, size / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Messages/sec fanned out by a broker backend to N subscribers.
+
+    python -m benchmarks.fanout --backend unix --subscribers 1 10 100 --messages 20000
+"""
+import argparse
+import tempfile
+import threading
+import time
+
+from apps.chat.broker.memory import InMemoryBroker
+from apps.chat.broker.unix import UnixSocketBroker
+
+
+def make_message(pk: int) -> dict:
+    return {'id': pk, 'from_user': 'bench', 'to_user': None, 'timestamp': pk, 'text': 'x' * 64}
+
+
+def run(backend: str, subscribers: int, messages: int, batch_size: int) -> float:
+    """ Returns number of delivered (message, subscriber) pairs per second."""
+    with tempfile.TemporaryDirectory() as path:
+        if backend == 'memory':
+            publisher = receiver = InMemoryBroker()
+        else:
+            # subscribers live behind a second socket, as in another worker process
+            publisher, receiver = UnixSocketBroker(path), UnixSocketBroker(path)
+        
+        expected = messages * subscribers
+        delivered = [0]
+        done = threading.Event()
+        lock = threading.Lock()
+        
+        def listener(topic, batch):
+            with lock:
+                delivered[0] += len(batch)
+                if delivered[0] >= expected:
+                    done.set()
+        
+        for _ in range(subscribers):
+            receiver.subscribe(['conversation:*'], listener)
+        
+        started = time.perf_counter()
+        for offset in range(0, messages, batch_size):
+            if backend == 'unix':
+                # keep one batch in flight, so datagrams are not dropped on a full socket buffer
+                while delivered[0] < offset * subscribers:
+                    time.sleep(0.0001)
+            publisher.publish_many([('conversation:1:2', make_message(pk))
+                                    for pk in range(offset, min(offset + batch_size, messages))])
+        done.wait(timeout=60)
+        elapsed = time.perf_counter() - started
+        
+        publisher.close()
+        receiver.close()
+    return delivered[0] / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=('memory', 'unix'), default='memory')
+    parser.add_argument('--subscribers', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+    
+    print('{:>12} {:>16} {:>16}'.format('subscribers', 'deliveries/sec', 'messages/sec'))
+    for subscribers in args.subscribers:
+        rate = run(args.backend, subscribers, args.messages, args.batch_size)
+        print('{:>12} {:>16,.0f} {:>16,.0f}'.format(subscribers, rate, rate / subscribers))
+
+
+if __name__ == '__main__':
+    main()
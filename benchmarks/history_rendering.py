@@ -0,0 +1,86 @@
+"""
+CPU cost of building and rendering a 10k-message history response: serializer instances rendered with DRF's
+JSONRenderer (the path before the rework), values_list rows with JSONRenderer, and values_list rows with
+FastJSONRenderer (orjson when installed, the stdlib encoder otherwise).
+
+    python -m benchmarks.history_rendering --messages 10000 --repeat 10
+"""
+import argparse
+import time
+
+from benchmarks.environment import setup_django, test_database
+from benchmarks.stats import summarize
+
+
+def legacy_serializer_class():
+    from rest_framework import serializers
+    
+    class LegacyMessageSerializer(serializers.Serializer):
+        """ MessageSerializer as history used to be serialized with it."""
+        id = serializers.IntegerField(read_only=True)
+        from_user = serializers.CharField(source='from_user.username', read_only=True)
+        to_user = serializers.CharField(source='to_user.username', allow_null=True)
+        timestamp = serializers.IntegerField(read_only=True)
+        text = serializers.CharField()
+    return LegacyMessageSerializer
+
+
+def build_legacy(limit: int):
+    from apps.chat.models import Message
+    
+    messages = Message.objects.public().select_related('from_user', 'to_user').order_by('id')[:limit]
+    return legacy_serializer_class()(messages, many=True).data
+
+
+def build_rows(limit: int):
+    from apps.chat.models import Message
+    from apps.chat.serializers import MESSAGE_ROW_FIELDS, serialize_message_rows
+    
+    rows = Message.objects.public().order_by('id').values_list(*MESSAGE_ROW_FIELDS)[:limit]
+    return serialize_message_rows(rows)
+
+
+def run(build, renderer, limit: int, repeat: int) -> dict:
+    build_latencies = []
+    render_latencies = []
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        data = {'previous': None, 'next': None, 'results': build(limit)}
+        built = time.perf_counter()
+        size = len(renderer.render(data))
+        build_latencies.append(built - started)
+        render_latencies.append(time.perf_counter() - built)
+    return {'build': summarize(build_latencies), 'render': summarize(render_latencies), 'size': size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    
+    setup_django()
+    from django.contrib.auth.models import User
+    from rest_framework.renderers import JSONRenderer
+    from apps.chat import renderers
+    from apps.chat.models import Message
+    
+    with test_database():
+        user = User.objects.create_user('sender', password='password')
+        Message.objects.bulk_create([Message(from_user=user, timestamp=n, text='message number {n}'.format(n=n))
+                                     for n in range(args.messages)])
+        
+        fast = 'fast ({0})'.format('orjson' if renderers.orjson is not None else 'stdlib')
+        print('{:>24} {:>14} {:>15} {:>14}'.format('path', 'build p50 ms', 'render p50 ms', 'total p50 ms'))
+        for label, build, renderer in (('serializer + JSONRenderer', build_legacy, JSONRenderer()),
+                                       ('rows + JSONRenderer', build_rows, JSONRenderer()),
+                                       ('rows + ' + fast, build_rows, renderers.FastJSONRenderer())):
+            result = run(build, renderer, args.messages, args.repeat)
+            print('{:>24} {:>14.2f} {:>15.2f} {:>14.2f}'.format(
+                label, result['build']['p50_ms'], result['render']['p50_ms'],
+                result['build']['p50_ms'] + result['render']['p50_ms']))
+
+
+if __name__ == '__main__':
+    main()
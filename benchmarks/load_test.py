@@ -0,0 +1,149 @@
+"""
+Throughput of the production server (gunicorn with _config/gunicorn.py) by number of worker processes.
+Every run serves a throwaway SQLite database with public history from a temporary directory, and clients
+request the newest page of it over keep-alive connections from separate processes.
+
+    python -m benchmarks.load_test --workers 1 2 4 --threads 4 --clients 4 --connections 4 --duration 10
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.stats import summarize
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SETTINGS_MODULE = '_config.settings.tests'
+
+
+def create_database(path: str, messages: int) -> str:
+    """ Migrates a database in path and fills it with public messages, returns a token to read them with."""
+    # the test settings keep the database next to the working directory
+    sys.path.insert(0, ROOT_DIR)
+    os.chdir(path)
+    os.environ['DJANGO_SETTINGS_MODULE'] = SETTINGS_MODULE
+    import django
+    django.setup()
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from apps.chat.models import Message
+    
+    call_command('migrate', verbosity=0)
+    user = User.objects.create_user('loadtest', password='password')
+    Message.objects.bulk_create([Message(from_user=user, timestamp=n, text='message {n}'.format(n=n))
+                                 for n in range(messages)])
+    return user.auth_token.key
+
+
+def start_server(path: str, port: int, workers: int, threads: int, settings_module: str = SETTINGS_MODULE,
+                 extra_env: dict = None) -> subprocess.Popen:
+    """ Starts gunicorn serving from path as its working directory and waits until it answers."""
+    env = dict(os.environ,
+               DJANGO_SETTINGS_MODULE=settings_module,
+               GUNICORN_BIND='127.0.0.1:{port}'.format(port=port),
+               GUNICORN_WORKERS=str(workers),
+               GUNICORN_THREADS=str(threads),
+               GUNICORN_WORKER_TMP_DIR=path,
+               GUNICORN_LOG_LEVEL='warning',
+               CHAT_BROKER_URL='unix://' + os.path.join(path, 'broker'),
+               DJANGO_SHARED_CACHE_LOCATION=os.path.join(path, 'cache'),
+               **(extra_env or {}))
+    # gunicorn 19 cannot be run with -m
+    server = subprocess.Popen([sys.executable, '-c', 'from gunicorn.app.wsgiapp import run; run()',
+                               '--config', os.path.join(ROOT_DIR, '_config', 'gunicorn.py'),
+                               '--pythonpath', ROOT_DIR,
+                               '_config.wsgi:application'],
+                              cwd=path, env=env, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/metrics/')
+            connection.getresponse().read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('The server did not start.')
+
+
+def client_process(args) -> list:
+    """ Sends requests over persistent connections from threads until the deadline, returns latencies."""
+    import threading
+    
+    port, token, connections, deadline = args
+    latencies = []
+    lock = threading.Lock()
+    
+    def run_connection():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        own = []
+        while time.time() < deadline:
+            started = time.perf_counter()
+            connection.request('GET', '/public-chat/?limit=50', headers={'Authorization': 'Token ' + token})
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                raise RuntimeError('Unexpected status {0}'.format(response.status))
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(own)
+    
+    threads = [threading.Thread(target=run_connection) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def run(path: str, port: int, token: str, workers: int, threads: int, clients: int, connections: int,
+        duration: float) -> dict:
+    server = start_server(path, port, workers, threads)
+    try:
+        # warm up every worker before measuring
+        client_process((port, token, workers, time.time() + 1))
+        deadline = time.time() + duration
+        with multiprocessing.Pool(clients) as pool:
+            latencies = [latency for result in pool.map(client_process, [(port, token, connections, deadline)] * clients)
+                         for latency in result]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+    
+    result = summarize(latencies)
+    result['rps'] = len(latencies) / duration
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=4, help='client processes')
+    parser.add_argument('--connections', type=int, default=4, help='keep-alive connections per client process')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as path:
+        token = create_database(path, args.messages)
+        print('{0} cores, {1} threads per worker, {2} connections'.format(
+            multiprocessing.cpu_count(), args.threads, args.clients * args.connections))
+        print('{:>8} {:>10} {:>10} {:>10} {:>10}'.format('workers', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+        for workers in args.workers:
+            result = run(path, args.port, token, workers, args.threads, args.clients, args.connections,
+                         args.duration)
+            print('{:>8} {:>10.1f} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                workers, result['rps'], result['p50_ms'], result['p95_ms'], result['p99_ms']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Time ResponseLoggingMiddleware adds to a request serving a large page of history, before and after moving
+message building to the background log writer. Records are written to os.devnull through a FileHandler.
+
+    python -m benchmarks.logging_middleware --requests 2000 --messages 200 --text-length 500
+"""
+import argparse
+import logging
+import os
+import time
+
+from benchmarks.environment import setup_django
+from benchmarks.stats import summarize
+
+
+def legacy_log(request, response) -> None:
+    """ Logging before the rework: bodies are stringified and records are emitted on the request thread."""
+    from apps.chat.middlewares import request_logger, response_logger
+    
+    saved_body = str(request.body[0:3000]) if request.body else None
+    request_msg_parts = [request.method, request.get_full_path()]
+    if saved_body is not None:
+        request_msg_parts.append(saved_body)
+    response_msg_parts = [str(response.status_code)]
+    if response.data:
+        response_msg_parts.append(str(response.data))
+    request_logger.log(logging.INFO, 'Request: ' + ' '.join(request_msg_parts))
+    response_logger.log(logging.INFO, 'Response: ' + ' '.join(response_msg_parts))
+
+
+def make_response(messages: int, text_length: int):
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.response import Response
+    
+    data = {
+        'previous': None,
+        'next': None,
+        'results': [{'id': n, 'from_user': 'sender', 'to_user': None, 'timestamp': n, 'text': 'x' * text_length}
+                    for n in range(messages)],
+    }
+    response = Response(status=200, data=data)
+    response.accepted_renderer = JSONRenderer()
+    response.accepted_media_type = 'application/json'
+    response.renderer_context = {}
+    response.render()
+    return response
+
+
+def run(path: str, requests: int, response) -> dict:
+    from django.test import RequestFactory
+    from apps.chat.middlewares import ResponseLoggingMiddleware, log_writer
+    
+    middleware = ResponseLoggingMiddleware()
+    factory = RequestFactory()
+    latencies = []
+    for _ in range(requests):
+        request = factory.get('/public-chat/', {'limit': 200})
+        started = time.perf_counter()
+        if path == 'legacy':
+            legacy_log(request, response)
+        else:
+            middleware.process_request(request)
+            middleware.process_response(request, response)
+        latencies.append(time.perf_counter() - started)
+    log_writer.flush()
+    return summarize(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--text-length', type=int, default=500)
+    args = parser.parse_args()
+    
+    setup_django()
+    handler = logging.FileHandler(os.devnull)
+    for name in ('middlewares.request', 'middlewares.response'):
+        logger = logging.getLogger(name)
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    
+    response = make_response(args.messages, args.text_length)
+    print('response size: {size} bytes'.format(size=len(response.content)))
+    print('{:>8} {:>10} {:>10} {:>10} {:>10}'.format('path', 'mean ms', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for path in ('legacy', 'current'):
+        result = run(path, args.requests, response)
+        print('{:>8} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+            path, result['mean_ms'], result['p50_ms'], result['p95_ms'], result['p99_ms']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Logins per second on one core: the login path before the rework (user, password check and token in separate
+steps, called directly) and the login view through the test client with a few PBKDF2 iteration counts, plus
+queries per login. Users log in round robin,
+each password is hashed with the measured iteration count up front, so no login pays for a rehash.
+
+    python -m benchmarks.login --logins 200 --users 20 --iterations 30000 10000 1000
+"""
+import argparse
+import time
+
+from benchmarks.environment import setup_django, test_database
+from benchmarks.stats import summarize
+
+
+def legacy_login(username: str, password: str) -> str:
+    """ Login path before the rework: the token is a separate query after the user and the password check."""
+    from django.contrib.auth.models import User
+    
+    user = User.objects.get_by_natural_key(username)
+    if not user.check_password(password):
+        raise ValueError(username)
+    return user.auth_token.key
+
+
+def run(path: str, usernames: list, logins: int, iterations: int) -> dict:
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.test.utils import CaptureQueriesContext
+    from django.urls import reverse
+    
+    with override_settings(CHAT_PASSWORD_ITERATIONS=iterations, CHAT_LOGIN_RATE=None):
+        for username in usernames:
+            user = User.objects.get_by_natural_key(username)
+            user.set_password('password')
+            user.save(update_fields=['password'])
+        
+        client = Client()
+        url = reverse('login')
+        latencies = []
+        with CaptureQueriesContext(connection) as queries:
+            for n in range(logins):
+                username = usernames[n % len(usernames)]
+                started = time.perf_counter()
+                if path == 'legacy':
+                    legacy_login(username, 'password')
+                else:
+                    response = client.post(url, data={'username': username, 'password': 'password'})
+                    assert response.status_code == 200, response.status_code
+                latencies.append(time.perf_counter() - started)
+    
+    result = summarize(latencies)
+    result['logins_per_second'] = logins / sum(latencies)
+    result['queries_per_login'] = len(queries) / logins
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--iterations', type=int, nargs='+', default=[30000, 10000, 1000])
+    args = parser.parse_args()
+    
+    setup_django()
+    import logging
+    from django.contrib.auth.hashers import PBKDF2PasswordHasher
+    from django.contrib.auth.models import User
+    
+    logging.getLogger('middlewares').setLevel(logging.ERROR)
+    
+    with test_database():
+        usernames = ['user{n}'.format(n=n) for n in range(args.users)]
+        for username in usernames:
+            User.objects.create_user(username, password='password')
+        
+        print('{:>8} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+            'path', 'iterations', 'logins/s', 'queries', 'p50 ms', 'p99 ms'))
+        runs = [('legacy', PBKDF2PasswordHasher.iterations)] + [('current', n) for n in args.iterations]
+        for path, iterations in runs:
+            result = run(path, usernames, args.logins, iterations)
+            print('{:>8} {:>10} {:>10.1f} {:>10.2f} {:>10.3f} {:>10.3f}'.format(
+                path, iterations, result['logins_per_second'], result['queries_per_login'],
+                result['p50_ms'], result['p99_ms']))
+
+
+if __name__ == '__main__':
+    main()
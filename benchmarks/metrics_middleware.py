@@ -0,0 +1,70 @@
+"""
+Overhead of MetricsMiddleware: latency of full public history requests through the test client with and
+without the middleware, and the cost of recording one request in the registry.
+
+    python -m benchmarks.metrics_middleware --requests 2000 --messages 50
+"""
+import argparse
+import time
+
+from benchmarks.environment import setup_django, test_database
+from benchmarks.stats import summarize
+
+
+def run_requests(middleware: tuple, requests: int, token: str) -> dict:
+    from django.test import Client, override_settings
+    from django.urls import reverse
+    
+    with override_settings(MIDDLEWARE=middleware):
+        client = Client(HTTP_AUTHORIZATION='Token ' + token)
+        url = reverse('public-chat')
+        client.get(url)
+        latencies = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            client.get(url)
+            latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def run_record(records: int) -> dict:
+    from apps.chat.metrics import MetricsRegistry
+    
+    registry = MetricsRegistry()
+    started = time.perf_counter()
+    for n in range(records):
+        registry.record('public-chat', 200, 0.001 * (n % 100), n % 7, 0.0005, 1000 + n)
+    return {'us_per_record': (time.perf_counter() - started) / records * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=50)
+    args = parser.parse_args()
+    
+    setup_django()
+    import logging
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from apps.chat.models import Message
+    
+    # measure the metrics middleware, not request logging
+    logging.getLogger('middlewares').setLevel(logging.ERROR)
+    
+    with test_database():
+        user = User.objects.create_user('sender', password='password')
+        Message.objects.bulk_create([Message(from_user=user, timestamp=n, text='text') for n in range(args.messages)])
+        token = user.auth_token.key
+        
+        without = tuple(name for name in settings.MIDDLEWARE if not name.endswith('.MetricsMiddleware'))
+        print('{:>16} {:>10} {:>10} {:>10} {:>10}'.format('middleware', 'mean ms', 'p50 ms', 'p95 ms', 'p99 ms'))
+        for label, middleware in (('without metrics', without), ('with metrics', tuple(settings.MIDDLEWARE))):
+            result = run_requests(middleware, args.requests, token)
+            print('{:>16} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                label, result['mean_ms'], result['p50_ms'], result['p95_ms'], result['p99_ms']))
+        print('registry.record: {:.2f} us'.format(run_record(100000)['us_per_record']))
+
+
+if __name__ == '__main__':
+    main()
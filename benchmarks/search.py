@@ -0,0 +1,87 @@
+"""
+Latency of a first page of search results over a generated history: a text__icontains filter (the full scan
+search would be without an index), the FTS5 index and the term table. Rare words are in one message of a
+thousand, common ones in every tenth message. Each index is filled while the messages are stored.
+
+    python -m benchmarks.search --messages 100000 --searches 200
+"""
+import argparse
+import random
+import time
+
+from benchmarks.environment import setup_django, test_database
+from benchmarks.stats import summarize
+
+
+WORDS = ['word{n}'.format(n=n) for n in range(1000)]
+
+
+def make_text(n: int) -> str:
+    words = random.sample(WORDS, 8)
+    if n % 10 == 0:
+        words.append('common')
+    if n % 1000 == 0:
+        words.append('rare')
+    return ' '.join(words)
+
+
+def search(path: str, user_id: int, word: str, limit: int) -> list:
+    from apps.chat.models import Message
+    from apps.chat.search import get_terms
+    from apps.chat.serializers import MESSAGE_ROW_FIELDS
+    
+    messages = Message.objects.visible_to(user_id)
+    if path == 'icontains':
+        messages = messages.filter(text__icontains=word)
+    else:
+        messages = messages.matching(get_terms(word))
+    return list(messages.order_by('-id').values_list(*MESSAGE_ROW_FIELDS)[:limit])
+
+
+def run(path: str, user_id: int, word: str, searches: int, limit: int) -> dict:
+    from django.test import override_settings
+    
+    backend = path if path != 'icontains' else 'auto'
+    latencies = []
+    with override_settings(CHAT_SEARCH_BACKEND=backend):
+        for n in range(searches):
+            started = time.perf_counter()
+            search(path, user_id, word, limit)
+            latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--searches', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+    
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.test import override_settings
+    from apps.chat.models import Message
+    from apps.chat.search import fts5_available
+    
+    random.seed(0)
+    paths = ['icontains', 'terms'] + (['fts5'] if fts5_available() else [])
+    with test_database():
+        user = User.objects.create_user('user', password='password')
+        # both indexes are filled: the triggers always run on SQLite with FTS5, the term table is forced
+        with override_settings(CHAT_SEARCH_BACKEND='terms'):
+            for start in range(0, args.messages, 1000):
+                Message.objects.create_messages([
+                    Message(from_user=user, timestamp=n, text=make_text(n))
+                    for n in range(start, min(start + 1000, args.messages))])
+        
+        print('{:>10} {:>8} {:>10} {:>10} {:>10}'.format('path', 'word', 'mean ms', 'p50 ms', 'p99 ms'))
+        for word in ('rare', 'common'):
+            for path in paths:
+                result = run(path, user.id, word, args.searches, args.limit)
+                print('{:>10} {:>8} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                    path, word, result['mean_ms'], result['p50_ms'], result['p99_ms']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+import math
+from typing import Dict, List
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """ Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return float('nan')
+    rank = max(int(math.ceil(fraction * len(sorted_values))) - 1, 0)
+    return sorted_values[rank]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """ Latencies in seconds -> count, mean and percentiles in milliseconds."""
+    values = sorted(latency * 1000 for latency in latencies)
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) if values else float('nan'),
+        'p50_ms': percentile(values, 0.50),
+        'p95_ms': percentile(values, 0.95),
+        'p99_ms': percentile(values, 0.99),
+        'max_ms': values[-1] if values else float('nan'),
+    }
@@ -0,0 +1,77 @@
+"""
+Concurrent writers against the message POST endpoints of the production profile with synchronous inserts and with
+the write-behind queue in both durability modes. Same load as benchmarks.write_concurrency.
+
+    python -m benchmarks.write_behind --workers 2 --threads 8 --writers 32 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import time
+
+from benchmarks.load_test import start_server
+from benchmarks.stats import summarize
+from benchmarks.write_concurrency import create_database, writer_process
+
+
+MODES = (
+    ('sync', {'CHAT_WRITE_BEHIND': 'false'}),
+    ('commit', {'CHAT_WRITE_BEHIND': 'true', 'CHAT_WRITE_BEHIND_DURABILITY': 'commit'}),
+    ('enqueue', {'CHAT_WRITE_BEHIND': 'true', 'CHAT_WRITE_BEHIND_DURABILITY': 'enqueue'}),
+)
+
+
+def run(path: str, template: str, mode: str, mode_env: dict, port: int, users: list, workers: int, threads: int,
+        duration: float) -> dict:
+    mode_path = os.path.join(path, mode)
+    os.makedirs(mode_path)
+    database = os.path.join(mode_path, 'db.sqlite3')
+    shutil.copy(template, database)
+    
+    extra_env = dict(mode_env, DJANGO_DB_NAME=database)
+    server = start_server(mode_path, port, workers, threads, settings_module='_config.settings.production',
+                          extra_env=extra_env)
+    try:
+        deadline = time.time() + duration
+        jobs = [(port, token, users[(n + 1) % len(users)][0], deadline) for n, (username, token) in enumerate(users)]
+        with multiprocessing.Pool(len(jobs)) as pool:
+            results = pool.map(writer_process, jobs)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+    
+    latencies = [latency for result in results for latency in result['latencies']]
+    result = summarize(latencies)
+    result['writes_per_second'] = len(latencies) / duration
+    result['errors'] = sum(result['errors'] for result in results)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as path:
+        users = create_database(path, args.writers)
+        template = os.path.join(path, 'test_db')
+        
+        print('{:>8} {:>10} {:>8} {:>10} {:>10} {:>10}'.format(
+            'mode', 'writes/s', 'errors', 'p50 ms', 'p95 ms', 'p99 ms'))
+        for mode, mode_env in MODES:
+            result = run(path, template, mode, mode_env, args.port, users, args.workers, args.threads,
+                         args.duration)
+            print('{:>8} {:>10.1f} {:>8} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                mode, result['writes_per_second'], result['errors'],
+                result['p50_ms'], result['p95_ms'], result['p99_ms']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Concurrent writers against the message POST endpoints, with the database settings of the test profile
+(a new SQLite connection per request, rollback journal, full fsync) and of _config.settings.production
+(persistent connections, WAL, synchronous=NORMAL, busy timeout, mmap). Every writer alternates public and
+private messages over its own keep-alive connection.
+
+    python -m benchmarks.write_concurrency --workers 2 --threads 4 --writers 16 --duration 10
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import time
+
+from benchmarks.load_test import ROOT_DIR, start_server
+from benchmarks.stats import summarize
+
+
+def create_database(path: str, writers: int) -> list:
+    """ Migrates a test database in path with writer users, returns their (username, token) pairs."""
+    import sys
+    sys.path.insert(0, ROOT_DIR)
+    os.chdir(path)
+    os.environ['DJANGO_SETTINGS_MODULE'] = '_config.settings.tests'
+    import django
+    django.setup()
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    
+    call_command('migrate', verbosity=0)
+    users = [User.objects.create_user('writer{n}'.format(n=n), password='password') for n in range(writers)]
+    return [(user.username, user.auth_token.key) for user in users]
+
+
+def writer_process(args) -> dict:
+    """ Posts messages from one keep-alive connection until the deadline."""
+    port, token, peer, deadline = args
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    headers = {'Authorization': 'Token ' + token, 'Content-Type': 'application/json'}
+    latencies = []
+    errors = 0
+    n = 0
+    while time.time() < deadline:
+        if n % 2:
+            url, body = '/private/', {'to_user': peer, 'text': 'private {n}'.format(n=n)}
+        else:
+            url, body = '/public-chat/', {'text': 'public {n}'.format(n=n)}
+        started = time.perf_counter()
+        connection.request('POST', url, body=json.dumps(body), headers=headers)
+        response = connection.getresponse()
+        response.read()
+        if response.status == 200:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors += 1
+        n += 1
+    return {'latencies': latencies, 'errors': errors}
+
+
+def run(path: str, template: str, profile: str, port: int, users: list, workers: int, threads: int,
+        duration: float) -> dict:
+    profile_path = os.path.join(path, profile)
+    os.makedirs(profile_path)
+    if profile == 'production':
+        database = os.path.join(profile_path, 'db.sqlite3')
+        settings_module = '_config.settings.production'
+    else:
+        database = os.path.join(profile_path, 'test_db')
+        settings_module = '_config.settings.tests'
+    shutil.copy(template, database)
+    
+    server = start_server(profile_path, port, workers, threads, settings_module=settings_module,
+                          extra_env={'DJANGO_DB_NAME': database})
+    try:
+        deadline = time.time() + duration
+        jobs = [(port, token, users[(n + 1) % len(users)][0], deadline) for n, (username, token) in enumerate(users)]
+        with multiprocessing.Pool(len(jobs)) as pool:
+            results = pool.map(writer_process, jobs)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+    
+    latencies = [latency for result in results for latency in result['latencies']]
+    result = summarize(latencies)
+    result['writes_per_second'] = len(latencies) / duration
+    result['errors'] = sum(result['errors'] for result in results)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as path:
+        users = create_database(path, args.writers)
+        template = os.path.join(path, 'test_db')
+        
+        print('{:>11} {:>10} {:>8} {:>10} {:>10} {:>10}'.format(
+            'profile', 'writes/s', 'errors', 'p50 ms', 'p95 ms', 'p99 ms'))
+        for profile in ('tests', 'production'):
+            result = run(path, template, profile, args.port, users, args.workers, args.threads, args.duration)
+            print('{:>11} {:>10.1f} {:>8} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                profile, result['writes_per_second'], result['errors'],
+                result['p50_ms'], result['p95_ms'], result['p99_ms']))
+
+
+if __name__ == '__main__':
+    main()
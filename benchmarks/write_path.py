@@ -0,0 +1,83 @@
+"""
+Queries and latency per message of the message write path, before and after resolving
+users through the username cache.
+
+    python -m benchmarks.write_path --messages 2000 --recipients 50
+"""
+import argparse
+import time
+
+from benchmarks.environment import setup_django, test_database
+from benchmarks.stats import summarize
+
+
+def legacy_create(from_username: str, to_username: str, timestamp: int, text: str):
+    """ Write path before the rework: the sender and the recipient are looked up by username per message."""
+    from django.contrib.auth.models import User
+    from apps.chat.models import Message
+    
+    to_user = User.objects.get(username=to_username)
+    return Message.objects.create(from_user=User.objects.get(username=from_username),
+                                  to_user=to_user,
+                                  timestamp=timestamp,
+                                  text=text)
+
+
+def current_create(from_user, to_username: str, timestamp: int, text: str):
+    from apps.chat.serializers import MessageSerializer
+    from apps.chat.writebehind import store_messages
+    
+    serialized = MessageSerializer(data={'to_user': to_username, 'text': text})
+    serialized.is_valid(raise_exception=True)
+    message = serialized.save(from_user=from_user, timestamp=timestamp)
+    store_messages([message])
+    return message
+
+
+def run(path: str, messages: int, recipients: int) -> dict:
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from apps.chat.users import username_cache
+    
+    username_cache.clear()
+    sender = User.objects.get(username='sender')
+    latencies = []
+    with CaptureQueriesContext(connection) as queries:
+        for i in range(messages):
+            to_username = 'user{n}'.format(n=i % recipients)
+            started = time.perf_counter()
+            if path == 'legacy':
+                legacy_create(sender.username, to_username, i, 'text')
+            else:
+                current_create(sender, to_username, i, 'text')
+            latencies.append(time.perf_counter() - started)
+    
+    result = summarize(latencies)
+    result['queries_per_message'] = len(queries) / messages
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--recipients', type=int, default=50)
+    args = parser.parse_args()
+    
+    setup_django()
+    from django.contrib.auth.models import User
+    
+    with test_database():
+        User.objects.create_user('sender', password='password')
+        for n in range(args.recipients):
+            User.objects.create_user('user{n}'.format(n=n), password='password')
+        
+        print('{:>8} {:>16} {:>10} {:>10} {:>10}'.format('path', 'queries/message', 'p50 ms', 'p95 ms', 'p99 ms'))
+        for path in ('legacy', 'current'):
+            result = run(path, args.messages, args.recipients)
+            print('{:>8} {:>16.2f} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                path, result['queries_per_message'], result['p50_ms'], result['p95_ms'], result['p99_ms']))
+
+
+if __name__ == '__main__':
+    main()
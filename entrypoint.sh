@@ -1,4 +1,12 @@
 #!/usr/bin/env bash
 
-python3 /webchat/manage.py migrate
-python3 /webchat/manage.py runserver 0.0.0.0:8000
\ No newline at end of file
+if [ "${WEBCHAT_SERVER:-runserver}" = "gunicorn" ]; then
+    export DJANGO_SETTINGS_MODULE="${DJANGO_SETTINGS_MODULE:-_config.settings.production}"
+    # workers of the container share new messages through unix sockets unless another broker is configured
+    export CHAT_BROKER_URL="${CHAT_BROKER_URL:-unix:///tmp/webchat-broker}"
+    python3 /webchat/manage.py migrate
+    cd /webchat && exec gunicorn --config _config/gunicorn.py _config.wsgi:application
+else
+    python3 /webchat/manage.py migrate
+    python3 /webchat/manage.py runserver 0.0.0.0:8000
+fi